@@ -43,18 +43,33 @@ bl_info = {
 
 if "bpy" in locals():
     import imp 
+    imp.reload(lightfield_core)
+    imp.reload(view_selection)
+    imp.reload(view_synthesis)
+    imp.reload(cost_estimate)
+    imp.reload(depth_cache)
+    imp.reload(epi_export)
+    imp.reload(job_queue)
+    imp.reload(refocus)
+    imp.reload(render_session)
+    imp.reload(render_tuning)
+    imp.reload(virtual_rig)
     imp.reload(gui)
     imp.reload(lightfield_simulator)
     imp.reload(updates)
     imp.reload(import_export)
 else:
-    from . import gui, lightfield_simulator, updates, import_export
+    from . import gui, cost_estimate, depth_cache, lightfield_core, lightfield_simulator, updates, import_export, \
+        view_selection, view_synthesis, epi_export, job_queue, refocus, render_session, render_tuning, virtual_rig
     
 import bpy
 from bpy.props import *
 
 import datetime
 import os
+import re
+
+import numpy as np
 
 
 # global properties for the script, mainly for UI
@@ -140,15 +155,232 @@ class LFPropertyGroup(bpy.types.PropertyGroup):
         default=10.0,
         description='Factor for the high resolution depth map export'
     )
+    depth_postprocess_threads = IntProperty(
+        name='post-processing threads',
+        default=0,
+        min=0,
+        max=64,
+        description='Threads post-processing depth maps while the next view renders, 0 = process synchronously'
+    )
+    compositor_disparity = BoolProperty(
+        name='compositor disparity',
+        default=False,
+        description='Compute the high resolution disparity map with compositor nodes from the depth pass '
+                    'instead of in Python. Not used with adaptive depth maps'
+    )
+    adaptive_depth = BoolProperty(
+        name='adaptive depth maps',
+        default=False,
+        description='Render depth at native resolution and only regions at depth discontinuities or object '
+                    'boundaries at high resolution. High resolution maps are saved sparsely as .npz files'
+    )
+    adaptive_depth_block_size = IntProperty(
+        name='block size',
+        default=16,
+        min=1,
+        max=1024,
+        description='Size of the blocks rendered at high resolution in native pixels'
+    )
+    depth_cache_dir = StringProperty(
+        name='depth cache',
+        subtype='DIR_PATH',
+        default='',
+        description='Directory caching rendered high resolution depth maps, which allows to recompute disparities '
+                    'after changing baseline or focus without rendering. Empty = no cache'
+    )
+    depth_cache_size_gb = FloatProperty(
+        name='cache size [GB]',
+        default=50.0,
+        min=0,
+        description='Maximum size of the depth cache, least recently used depth maps are removed first'
+    )
+    use_view_synthesis = BoolProperty(
+        name='view synthesis',
+        default=False,
+        description='Render only key views and synthesize the other input views by depth based warping, '
+                    'pixels which cannot be synthesized are rendered'
+    )
+    synthesis_stride = IntProperty(
+        name='key view stride',
+        default=4,
+        min=1,
+        max=64,
+        description='Distance of the rendered key views in grid rows and columns'
+    )
+    synthesis_block_size = IntProperty(
+        name='hole block size',
+        default=16,
+        min=1,
+        max=1024,
+        description='Size of the blocks rendered to fill pixels which cannot be synthesized'
+    )
+    save_depth_statistics = BoolProperty(
+        name='save depth statistics',
+        default=False,
+        description='Save min, max, mean and standard deviation of the high resolution depth per low resolution pixel '
+                    'and a mask of pixels at depth discontinuities'
+    )
+    save_derived_ground_truth = BoolProperty(
+        name='save normals and visibility',
+        default=False,
+        description='Save surface normals and occlusion boundaries computed from the depth maps, and masks of the '
+                    'center view pixels visible in each view with depth map'
+    )
+    depth_edge_threshold = FloatProperty(
+        name='edge threshold',
+        default=0.05,
+        min=0,
+        description='Relative depth range within a low resolution pixel above which it is marked as depth discontinuity'
+    )
+    use_virtual_rig = BoolProperty(
+        name='virtual camera grid',
+        default=False,
+        description='Use a single camera which is moved to each view instead of one camera object per view',
+        update=updates.update_lightfield
+    )
     save_depth_for_all_views = BoolProperty(
         name='save depth and disparity maps for all views',
         default=False,
-        description='Whether to save disp/depth maps for all views or only for center view.'
+        description='Whether to save disp/depth maps for all views or only for center view.',
+        update=updates.update_save_depth_for_all_views
     )
     save_object_id_maps_for_all_views = BoolProperty(
         name='save object id maps for all views',
         default=False,
-        description='Whether to save object id maps for all views or only for center view.'
+        description='Whether to save object id maps for all views or only for center view.',
+        update=updates.update_save_object_id_maps_for_all_views
+    )
+
+    # view selection, the center view is always rendered for depth, disparity and object ids
+    rgb_views = EnumProperty(
+        name='RGB views',
+        items=view_selection.VIEW_PATTERNS,
+        default='ALL',
+        description='Views for which input images are rendered'
+    )
+    rgb_view_stride = IntProperty(
+        name='stride',
+        default=2,
+        min=1,
+        max=2000,
+        description='Step between selected views for the stride pattern'
+    )
+    rgb_view_list = StringProperty(
+        name='views',
+        default='',
+        description='Comma separated view indices and ranges for the list pattern, e.g. "0, 4, 10-12"'
+    )
+    depth_views = EnumProperty(
+        name='depth views',
+        items=view_selection.VIEW_PATTERNS,
+        default='CENTER',
+        description='Views for which depth maps are saved'
+    )
+    depth_view_stride = IntProperty(
+        name='stride',
+        default=2,
+        min=1,
+        max=2000,
+        description='Step between selected views for the stride pattern'
+    )
+    depth_view_list = StringProperty(
+        name='views',
+        default='',
+        description='Comma separated view indices and ranges for the list pattern, e.g. "0, 4, 10-12"'
+    )
+    disp_views = EnumProperty(
+        name='disparity views',
+        items=view_selection.VIEW_PATTERNS,
+        default='CENTER',
+        description='Views for which disparity maps are saved'
+    )
+    disp_view_stride = IntProperty(
+        name='stride',
+        default=2,
+        min=1,
+        max=2000,
+        description='Step between selected views for the stride pattern'
+    )
+    disp_view_list = StringProperty(
+        name='views',
+        default='',
+        description='Comma separated view indices and ranges for the list pattern, e.g. "0, 4, 10-12"'
+    )
+    object_id_views = EnumProperty(
+        name='object id views',
+        items=view_selection.VIEW_PATTERNS,
+        default='CENTER',
+        description='Views for which object id maps are saved'
+    )
+    object_id_view_stride = IntProperty(
+        name='stride',
+        default=2,
+        min=1,
+        max=2000,
+        description='Step between selected views for the stride pattern'
+    )
+    object_id_view_list = StringProperty(
+        name='views',
+        default='',
+        description='Comma separated view indices and ranges for the list pattern, e.g. "0, 4, 10-12"'
+    )
+    use_direct_image_output = BoolProperty(
+        name='direct image output',
+        default=False,
+        description='Read back input views and encode them in background threads instead of using a file output node'
+    )
+    image_output_format = EnumProperty(
+        name='image format',
+        items=[('PNG', 'PNG', '8 bit png'),
+               ('PNG16', 'PNG 16 bit', '16 bit png'),
+               ('PFM', 'PFM', 'Linear float pfm without color management')],
+        default='PNG',
+        description='File format of the input views for direct image output'
+    )
+    light_field_image = EnumProperty(
+        name='light field image',
+        items=[('NONE', 'None', 'Only individual input views'),
+               ('MOSAIC', 'Mosaic', 'Sub-aperture mosaic, the views side by side in grid order'),
+               ('LENSLET', 'Lenslet', 'Lenslet image, a block of all views per pixel'),
+               ('BOTH', 'Mosaic and lenslet', 'Sub-aperture mosaic and lenslet image')],
+        default='NONE',
+        description='Additionally write all input views of a frame into one image'
+    )
+    save_view_images = BoolProperty(
+        name='save individual views',
+        default=True,
+        description='Save the individual input views next to the light field image. They are always saved '
+                    'if view synthesis, EPIs or the focal stack need them'
+    )
+    image_output_threads = IntProperty(
+        name='encoder threads',
+        default=4,
+        min=1,
+        max=64,
+        description='Number of threads encoding input views for direct image output'
+    )
+    export_epis = BoolProperty(
+        name='export EPIs',
+        default=False,
+        description='Export horizontal and vertical EPI stacks for all complete rows and columns of rendered views'
+    )
+    export_focal_stack = BoolProperty(
+        name='export focal stack',
+        default=False,
+        description='Export images of the rendered views refocused to the focal stack disparities'
+    )
+    focal_stack_disparities = StringProperty(
+        name='disparities',
+        default='-1:1:5',
+        description='Disparities of the focal stack in [px], 0 is the focus distance. Comma separated values, '
+                    'start:stop:num for evenly spaced values'
+    )
+    focal_stack_threads = IntProperty(
+        name='refocusing threads',
+        default=0,
+        min=0,
+        max=64,
+        description='Threads refocusing the disparities of the focal stack in parallel, 0 = no threads'
     )
     sequence_start = IntProperty(
         name='start frame',
@@ -169,6 +401,71 @@ class LFPropertyGroup(bpy.types.PropertyGroup):
     )
 
 
+    render_all_rigs = BoolProperty(
+        name='render all rigs',
+        default=False,
+        description='Render all light field rigs of the scene, each into its own subdirectory'
+    )
+    rig_subdir = StringProperty(
+        name='rig subdirectory',
+        default='',
+        description='Output subdirectory of this rig when rendering all rigs, default is the rig name'
+    )
+
+    resume_rendering = BoolProperty(
+        name='resume',
+        default=False,
+        description='Skip views whose output files exist, e.g. to continue a cancelled rendering'
+    )
+    render_progress = FloatProperty(
+        name='progress',
+        default=0,
+        min=0,
+        max=100,
+        subtype='PERCENTAGE',
+        description='Progress of the current rendering'
+    )
+    render_status = StringProperty(
+        name='',
+        default='',
+        description='Status of the current rendering'
+    )
+    use_job_queue = BoolProperty(
+        name='job queue',
+        default=False,
+        description='Claim frames from a job queue in the target directory, so that several blender instances '
+                    'sharing the directory render a sequence together'
+    )
+    job_lease_minutes = FloatProperty(
+        name='lease time [min]',
+        default=30,
+        min=1,
+        description='Frames of a worker without a sign of life for this time are rendered by another worker, '
+                    'must exceed the render time of a single view'
+    )
+    render_cost_estimate = StringProperty(
+        name='',
+        default='',
+        description='Estimated render time, memory and disk space of the rendering'
+    )
+    ignore_cost_limits = BoolProperty(
+        name='ignore memory and disk limits',
+        default=False,
+        description='Start renderings which are estimated to exceed the available memory or disk space'
+    )
+    auto_tune_render = BoolProperty(
+        name='auto-tune render settings',
+        default=False,
+        description='Find the fastest tile size and thread count of each stage with probe renders, '
+                    'cached per host, scene and resolution'
+    )
+    depth_source_dir = StringProperty(
+        name='depth source',
+        subtype='DIR_PATH',
+        default='',
+        description='Output directory of a rendering with identical center camera, whose center depth map is reused'
+    )
+
     # file IO
     tgt_dir = StringProperty(
         name='',
@@ -208,6 +505,11 @@ class LFPropertyGroup(bpy.types.PropertyGroup):
         description='Min disparity of frustum in [px]',
         update=updates.update_lightfield
     )
+    estimate_use_vertices = BoolProperty(
+        name='use vertices',
+        default=False,
+        description='Estimate the disparity range from all object vertices instead of bounding boxes (slower, tighter)'
+    )
     frustum_max_disp = FloatProperty(
         name='frustumMaxDisp[px]',
         default=2.0,
@@ -260,6 +562,13 @@ class LFPropertyGroup(bpy.types.PropertyGroup):
         default=-1
     )
     setup_number = IntProperty(
+        name='rig number',
+        default=0,
+        min=0,
+        description='Number of the active light field rig, each rig keeps its own settings',
+        update=updates.update_setup_number
+    )
+    setup_number_hidden = IntProperty(
         default=0
     )
     num_cams_x_hidden = IntProperty(
@@ -321,16 +630,74 @@ class LFPropertyGroup(bpy.types.PropertyGroup):
         except:
             return False
 
-    @staticmethod
-    def get_lightfield_cameras():
+    def get_lightfield_cameras(self):
         cameras = []
-        for obj in bpy.data.objects:
-            if obj.type == 'CAMERA' and obj.name.startswith("LF"):
+        prefix = "LF%s_Cam" % self.setup_number
+        for obj in bpy.context.scene.objects:
+            if obj.type == 'CAMERA' and obj.name.startswith(prefix):
                 cameras.append(obj)
         return cameras
 
+    # settings shared by all light field rigs of a scene
+    shared_settings = ['tgt_dir', 'path_config_file', 'sequence_start', 'sequence_end', 'sequence_steps',
+                       'render_all_rigs', 'resume_rendering', 'render_progress', 'render_status',
+                       'render_cost_estimate', 'ignore_cost_limits', 'use_job_queue', 'job_lease_minutes',
+                       'depth_source_dir', 'auto_tune_render', 'depth_cache_dir', 'depth_cache_size_gb']
+
+    def get_settings(self):
+        """
+        Returns the rig specific settings as dict
+        """
+        return {key: getattr(self, key) for key in self.bl_rna.properties.keys()
+                if key not in ['rna_type', 'name'] + self.shared_settings}
+
+    def set_settings(self, settings):
+        """
+        Sets rig specific settings without triggering updates of the light field
+        """
+        for key, value in settings.items():
+            if key not in self.bl_rna.properties or key in self.shared_settings:
+                continue
+            if self.bl_rna.properties[key].type == 'ENUM':
+                setattr(self, key, value)
+            else:
+                self[key] = value
+        # activating a rig this way does not store the settings of the previous one
+        if 'setup_number' in settings:
+            self.setup_number_hidden = self.setup_number
+
+    def store_rig_settings(self, setup_number=None):
+        """
+        Stores the current settings at the container object of the active rig, or of the rig setup_number
+        """
+        if setup_number is None:
+            setup_number = self.setup_number
+        settings = self.get_settings()
+        settings['setup_number'] = settings['setup_number_hidden'] = setup_number
+        try:
+            bpy.data.objects["LF%s" % setup_number]['LF_settings'] = settings
+        except KeyError:
+            pass
+
+    def get_rigs(self):
+        """
+        Returns the container objects of all rigs in the scene with stored settings, sorted by setup number
+        """
+        rigs = [obj for obj in bpy.context.scene.objects
+                if obj.type == 'EMPTY' and re.match(r'^LF\d+$', obj.name) and 'LF_settings' in obj]
+        return sorted(rigs, key=lambda obj: int(obj.name[2:]))
+
+    def get_rig_directory(self, tgt_dir):
+        return os.path.join(tgt_dir, self.rig_subdir or self.get_lightfield_name())
+
+    def get_center_view(self):
+        return view_selection.get_center_view(self.num_cams_x, self.num_cams_y)
+
     def get_center_camera(self):
-        camera_name = self.get_camera_name((self.num_cams_y - 1) / 2, (self.num_cams_x - 1) / 2)
+        if self.use_virtual_rig:
+            return virtual_rig.get_view(self, *self.get_center_view())
+
+        camera_name = self.get_camera_name(*self.get_center_view())
         try:
             camera = bpy.data.objects[camera_name]
         except KeyError:
@@ -339,6 +706,107 @@ class LFPropertyGroup(bpy.types.PropertyGroup):
 
         return camera
 
+    def get_view_mask(self, product):
+        """
+        Returns the boolean (num_cams_y, num_cams_x) view selection mask for 'rgb', 'depth', 'disp' or 'object_id'
+        """
+        return view_selection.get_view_mask(getattr(self, '%s_views' % product),
+                                            self.num_cams_x,
+                                            self.num_cams_y,
+                                            getattr(self, '%s_view_stride' % product),
+                                            getattr(self, '%s_view_list' % product))
+
+    def get_key_view_mask(self):
+        """
+        Returns the mask of rendered input views, with view synthesis only the key views are rendered
+        """
+        if not self.use_view_synthesis:
+            return np.ones((self.num_cams_y, self.num_cams_x), dtype=bool)
+        return view_selection.get_key_view_mask(self.num_cams_x, self.num_cams_y, self.synthesis_stride)
+
+    def get_selected_cameras(self, *products, include_center=False):
+        """
+        Returns the cameras selected for any of the given products in grid order
+        """
+        mask = np.zeros((self.num_cams_y, self.num_cams_x), dtype=bool)
+        for product in products:
+            mask |= self.get_view_mask(product)
+        if include_center:
+            mask[self.get_center_view()] = True
+        return self.get_cameras(mask)
+
+    def get_rendered_input_cameras(self):
+        return self.get_cameras(self.get_view_mask('rgb') & self.get_key_view_mask())
+
+    def get_synthesized_cameras(self):
+        if not self.use_view_synthesis:
+            return []
+        return self.get_cameras(self.get_view_mask('rgb') & ~self.get_key_view_mask())
+
+    def get_depth_cameras(self):
+        """
+        Returns the cameras of depth and disparity maps, including the center view and the key views of view synthesis
+        """
+        mask = self.get_view_mask('depth') | self.get_view_mask('disp')
+        mask[self.get_center_view()] = True
+        if self.use_view_synthesis:
+            mask |= self.get_view_mask('rgb') & self.get_key_view_mask()
+        return self.get_cameras(mask)
+
+    def is_synthesis_key_view(self, camera):
+        if not self.use_view_synthesis:
+            return False
+        idx = self.get_camera_index(camera.name)
+        return bool((self.get_view_mask('rgb') & self.get_key_view_mask()).flat[idx])
+
+    def get_cameras(self, mask):
+        """
+        Returns the cameras of a view mask (num_cams_y, num_cams_x) in grid order
+        """
+        cameras = []
+        for i, j in zip(*np.nonzero(mask)):
+            if self.use_virtual_rig:
+                cameras.append(virtual_rig.get_view(self, i, j))
+                continue
+
+            camera_name = self.get_camera_name(i, j)
+            try:
+                cameras.append(bpy.data.objects[camera_name])
+            except KeyError:
+                print("Could not find camera: %s" % camera_name)
+        return cameras
+
+    def get_render_camera(self, camera):
+        """
+        Returns the camera object rendering a grid camera, i.e. the single camera of a virtual rig
+        """
+        if self.use_virtual_rig:
+            return bpy.data.objects[self.get_virtual_camera_name()]
+        return camera
+
+    def activate_view(self, scene, camera):
+        """
+        Makes a grid camera the active scene camera, a virtual rig moves its single camera to the view
+        """
+        if self.use_virtual_rig:
+            scene.camera = virtual_rig.set_view(self, camera)
+        else:
+            scene.camera = camera
+
+    def get_virtual_rig_objects(self):
+        objects = []
+        for name in [self.get_virtual_camera_name(), self.get_virtual_grid_name(),
+                     self.get_virtual_grid_name() + "Cam"]:
+            try:
+                objects.append(bpy.data.objects[name])
+            except KeyError:
+                pass
+        return objects
+
+    def is_view_selected(self, camera, product):
+        idx = self.get_camera_index(camera.name)
+        return bool(self.get_view_mask(product).flat[idx])
+
     def get_frustum(self):
         return bpy.data.objects[self.get_frustum_name()]
 
@@ -349,6 +817,17 @@ class LFPropertyGroup(bpy.types.PropertyGroup):
     def get_camera_name(self, i, j):
         return "LF%s_Cam%3.3i" % (self.setup_number, i*self.num_cams_x+j)
 
+    @staticmethod
+    def get_camera_index(camera_name):
+        prefix, camera = camera_name.split("_Cam")
+        return int(camera)
+
+    def get_virtual_camera_name(self):
+        return "LF%s_VirtualCam" % self.setup_number
+
+    def get_virtual_grid_name(self):
+        return "LF%s_VirtualGrid" % self.setup_number
+
     def get_lightfield_name(self):
         return "LF%s" % self.setup_number
 
@@ -0,0 +1,149 @@
+############################################################################
+#  This file is part of the 4D Light Field Benchmark.                      #
+#                                                                          #
+#  This work is licensed under the Creative Commons                        #
+#  Attribution-NonCommercial-ShareAlike 4.0 International License.         #
+#  To view a copy of this license,                                         #
+#  visit http://creativecommons.org/licenses/by-nc-sa/4.0/.                #
+#                                                                          #
+#  Authors: Katrin Honauer & Ole Johannsen                                 #
+#  Contact: contact@lightfield-analysis.net                                #
+#  Website: www.lightfield-analysis.net                                    #
+#                                                                          #
+#  This add-on is based upon work of Maximilian Diebold                    #
+#                                                                          #
+#  The 4D Light Field Benchmark was jointly created by the University of   #
+#  Konstanz and the HCI at Heidelberg University. If you use any part of   #
+#  the benchmark, please cite our paper "A dataset and evaluation          #
+#  methodology for depth estimation on 4D light fields". Thanks!           #
+#                                                                          #
+#  @inproceedings{honauer2016benchmark,                                    #
+#    title={A dataset and evaluation methodology for depth estimation on   #
+#           4D light fields},                                              #
+#    author={Honauer, Katrin and Johannsen, Ole and Kondermann, Daniel     #
+#            and Goldluecke, Bastian},                                     #
+#    booktitle={Asian Conference on Computer Vision},                      #
+#    year={2016},                                                          #
+#    organization={Springer}                                               #
+#    }                                                                     #
+#                                                                          #
+############################################################################
+
+
+
+"""
+Pre-flight estimates of render time, peak memory and output size of a light field rendering.
+Sizes are upper bounds, png files are counted uncompressed.
+"""
+
+import os
+import shutil
+
+# bytes per pixel of the output files, high resolution products have depth_map_scale^2 pixels per view pixel
+BYTES_PER_PIXEL = {'input_PNG': 3, 'input_PNG16': 6, 'input_PFM': 12,
+                   'depth_highres': 4, 'disp_highres': 4, 'depth_lowres': 4, 'disp_lowres': 4,
+                   'depth_lowres_min': 4, 'depth_lowres_max': 4, 'depth_lowres_mean': 4, 'depth_lowres_std': 4,
+                   'depth_lowres_edges': 1, 'normals_highres': 12, 'normals_lowres': 12, 'boundaries_lowres': 1,
+                   'visibility': 1, 'objectids_highres': 2, 'objectids_lowres': 2, 'synthesis_mask': 1}
+HIGHRES_PRODUCTS = ['depth_highres', 'disp_highres', 'normals_highres', 'objectids_highres']
+
+# memory per high resolution pixel: the float rgba viewer image of blender and its copy read back to numpy,
+# and the depth, disparity and tile statistics temporaries of one depth map in post-processing
+VIEWER_BYTES_PER_PIXEL = 2 * 16
+POSTPROCESS_BYTES_PER_PIXEL = 40
+
+# fraction of the available memory or disk space above which a warning is given
+WARNING_FRACTION = 0.8
+
+
+def get_output_bytes(x_res, y_res, depth_map_scale, file_counts):
+    """
+    Returns a dict of product -> bytes of all files, given a dict of product -> number of files
+    """
+    output_bytes = {}
+    for product, count in file_counts.items():
+        pixels = x_res * y_res
+        if product in HIGHRES_PRODUCTS:
+            pixels *= depth_map_scale ** 2
+        output_bytes[product] = count * pixels * BYTES_PER_PIXEL[product]
+    return output_bytes
+
+
+def get_peak_memory(x_res, y_res, depth_map_scale, postprocess_threads):
+    """
+    Returns the peak memory in bytes of the high resolution ground truth, where up to postprocess_threads + 1
+    depth maps are post-processed while the next view renders
+    """
+    pixels = x_res * y_res * depth_map_scale ** 2
+    return pixels * (VIEWER_BYTES_PER_PIXEL + (postprocess_threads + 1) * POSTPROCESS_BYTES_PER_PIXEL)
+
+
+def get_render_time(view_counts, view_times):
+    """
+    Returns the render time in seconds of the number of views per stage with the measured time per view of a stage
+    """
+    return sum(count * view_times.get(stage, 0.0) for stage, count in view_counts.items())
+
+
+def get_available_memory():
+    """
+    Returns the available physical memory in bytes or None if it is unknown on this platform. On linux this includes
+    reclaimable page cache, elsewhere only the free pages are counted.
+    """
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_AVPHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def get_free_disk(path):
+    """
+    Returns the free space in bytes of the file system of path, which need not exist yet
+    """
+    path = os.path.abspath(path)
+    while not os.path.exists(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+    return shutil.disk_usage(path).free
+
+
+def check_limits(peak_memory, output_bytes, available_memory, free_disk):
+    """
+    Returns (errors, warnings), lists of messages about exceeded or nearly exceeded memory and disk limits
+    """
+    errors = []
+    warnings = []
+    for name, required, available in [('memory', peak_memory, available_memory),
+                                      ('disk space', output_bytes, free_disk)]:
+        if available is None:
+            continue
+        message = "%s of %s required, %s available" % (format_bytes(required), name, format_bytes(available))
+        if required > available:
+            errors.append(message)
+        elif required > WARNING_FRACTION * available:
+            warnings.append(message)
+    return errors, warnings
+
+
+def format_bytes(num_bytes):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if num_bytes < 1024:
+            return "%.1f %s" % (num_bytes, unit)
+        num_bytes /= 1024.0
+    return "%.1f TB" % num_bytes
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    days, hours = divmod(hours, 24)
+    if days > 0:
+        return "%dd %dh" % (days, hours)
+    return "%d:%02d:%02d" % (hours, minutes, seconds)
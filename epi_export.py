@@ -0,0 +1,101 @@
+############################################################################
+#  This file is part of the 4D Light Field Benchmark.                      #
+#                                                                          #
+#  This work is licensed under the Creative Commons                        #
+#  Attribution-NonCommercial-ShareAlike 4.0 International License.         #
+#  To view a copy of this license,                                         #
+#  visit http://creativecommons.org/licenses/by-nc-sa/4.0/.                #
+#                                                                          #
+#  Authors: Katrin Honauer & Ole Johannsen                                 #
+#  Contact: contact@lightfield-analysis.net                                #
+#  Website: www.lightfield-analysis.net                                    #
+#                                                                          #
+#  This add-on is based upon work of Maximilian Diebold                    #
+#                                                                          #
+#  The 4D Light Field Benchmark was jointly created by the University of   #
+#  Konstanz and the HCI at Heidelberg University. If you use any part of   #
+#  the benchmark, please cite our paper "A dataset and evaluation          #
+#  methodology for depth estimation on 4D light fields". Thanks!           #
+#                                                                          #
+#  @inproceedings{honauer2016benchmark,                                    #
+#    title={A dataset and evaluation methodology for depth estimation on   #
+#           4D light fields},                                              #
+#    author={Honauer, Katrin and Johannsen, Ole and Kondermann, Daniel     #
+#            and Goldluecke, Bastian},                                     #
+#    booktitle={Asian Conference on Computer Vision},                      #
+#    year={2016},                                                          #
+#    organization={Springer}                                               #
+#    }                                                                     #
+#                                                                          #
+############################################################################
+
+
+import os
+
+import numpy as np
+
+
+def get_complete_lines(mask):
+    """
+    Returns the grid rows and columns of a view mask (num_cams_y, num_cams_x) for which all views are available
+    """
+    rows = [int(i) for i in np.flatnonzero(np.all(mask, axis=1))]
+    cols = [int(j) for j in np.flatnonzero(np.all(mask, axis=0))]
+    return rows, cols
+
+
+def export_epi_stacks(view_fpaths, mask, tgt_dir, name, load_view):
+    """
+    Streams the views of a camera grid into epipolar plane image stacks stored as .npy files.
+
+    For each complete grid row i, 'epi_<name>_horizontal_row<i>.npy' has shape (H, num_cams_x, W, C),
+    i.e. [y] is the horizontal EPI of image row y. For each complete grid column j,
+    'epi_<name>_vertical_col<j>.npy' has shape (W, num_cams_y, H, C). Views are loaded once in row order
+    with load_view(fpath) -> (H, W, C) top-down array and written into memory mapped stacks, so that
+    at most one view is held in memory.
+    """
+    rows, cols = get_complete_lines(mask)
+    if not rows and not cols:
+        print("No complete row or column of %s views, skipping EPI export." % name)
+        return []
+
+    num_cams_y, num_cams_x = np.shape(mask)
+    horizontal = {}
+    vertical = {}
+    fpaths = []
+
+    for i in range(num_cams_y):
+        for j in range(num_cams_x):
+            if i not in rows and j not in cols:
+                continue
+
+            view = load_view(view_fpaths[i][j])
+            if np.ndim(view) == 2:
+                view = view[:, :, np.newaxis]
+            height, width, channels = np.shape(view)
+
+            # open stacks lazily once the view dimensions are known
+            if i in rows and i not in horizontal:
+                fpath = os.path.join(tgt_dir, 'epi_%s_horizontal_row%03d.npy' % (name, i))
+                horizontal[i] = np.lib.format.open_memmap(fpath, mode='w+', dtype=view.dtype,
+                                                          shape=(height, num_cams_x, width, channels))
+                fpaths.append(fpath)
+            if j in cols and j not in vertical:
+                fpath = os.path.join(tgt_dir, 'epi_%s_vertical_col%03d.npy' % (name, j))
+                vertical[j] = np.lib.format.open_memmap(fpath, mode='w+', dtype=view.dtype,
+                                                        shape=(width, num_cams_y, height, channels))
+                fpaths.append(fpath)
+
+            if i in rows:
+                horizontal[i][:, j, :, :] = view
+            if j in cols:
+                vertical[j][:, i, :, :] = view.transpose([1, 0, 2])
+
+        # a horizontal stack is complete after its grid row
+        if i in horizontal:
+            horizontal.pop(i).flush()
+
+    for stack in vertical.values():
+        stack.flush()
+
+    return fpaths
@@ -54,6 +54,7 @@ class VIEW3D_OT_lightfield_setup(bpy.types.Panel):
 
         col = layout.column(align=True)
         col.label(text="Light field parameters:")
+        col.prop(LF, "setup_number")
         col.prop(LF, "num_cams_x")
         col.prop(LF, "num_cams_y")
         col.prop(LF, "baseline_mm")
@@ -67,6 +68,8 @@ class VIEW3D_OT_lightfield_setup(bpy.types.Panel):
         col.label(text="Disparity Preview:")
         col.prop(LF, "frustum_min_disp")
         col.prop(LF, "frustum_max_disp")
+        col.prop(LF, "estimate_use_vertices")
+        col.operator("scene.estimate_disparity_range", "Estimate Disparity Range", icon="HAND")
 
         if LF.frustum_is_hidden():
             col.operator("scene.show_frustum", "Show Frustum", icon="HAND")
@@ -77,12 +80,64 @@ class VIEW3D_OT_lightfield_setup(bpy.types.Panel):
         col.label(text="Rendering:")
         col.prop(LF, "tgt_dir")
         col.prop(LF, "depth_map_scale")
+        col.prop(LF, "depth_postprocess_threads")
+        col.prop(LF, "compositor_disparity")
+        col.prop(LF, "adaptive_depth")
+        if LF.adaptive_depth:
+            col.prop(LF, "adaptive_depth_block_size")
+        col.prop(LF, "depth_cache_dir")
+        if LF.depth_cache_dir:
+            col.prop(LF, "depth_cache_size_gb")
+            col.operator("scene.recompute_ground_truth", "Recompute Ground Truth", icon="HAND")
+            col.operator("scene.clear_depth_cache", "Clear Depth Cache", icon="HAND")
+        col.prop(LF, "save_depth_statistics")
+        col.prop(LF, "save_derived_ground_truth")
+        if LF.save_depth_statistics or LF.adaptive_depth or LF.save_derived_ground_truth:
+            col.prop(LF, "depth_edge_threshold")
         col.prop(LF, "sequence_start")
         col.prop(LF, "sequence_end")
         col.prop(LF, "sequence_steps")
-        col.prop(LF, "save_depth_for_all_views")
-        col.prop(LF, "save_object_id_maps_for_all_views")
+        col.prop(LF, "use_job_queue")
+        if LF.use_job_queue:
+            col.prop(LF, "job_lease_minutes")
+        col.prop(LF, "render_all_rigs")
+        if LF.render_all_rigs:
+            col.prop(LF, "rig_subdir")
+        col.prop(LF, "use_view_synthesis")
+        if LF.use_view_synthesis:
+            col.prop(LF, "synthesis_stride")
+            col.prop(LF, "synthesis_block_size")
+        col.prop(LF, "export_epis")
+        col.prop(LF, "export_focal_stack")
+        if LF.export_focal_stack:
+            col.prop(LF, "focal_stack_disparities")
+            col.prop(LF, "focal_stack_threads")
+        col.prop(LF, "light_field_image")
+        if LF.light_field_image != 'NONE':
+            col.prop(LF, "save_view_images")
+        col.prop(LF, "use_direct_image_output")
+        if LF.use_direct_image_output:
+            col.prop(LF, "image_output_format")
+            col.prop(LF, "image_output_threads")
+        col.prop(LF, "resume_rendering")
+        col.prop(LF, "auto_tune_render")
+        col.operator("scene.estimate_render_cost", "Estimate Render Cost", icon="HAND")
+        for line in LF.render_cost_estimate.splitlines():
+            col.label(text=line)
+        col.prop(LF, "ignore_cost_limits")
         col.operator("scene.render_lightfield", "Render Light Field", icon="HAND")
+        if LF.render_status:
+            col.label(text="%s (%.1f%%)" % (LF.render_status, LF.render_progress))
+
+        col = layout.column(align=True)
+        col.label(text="View selection:")
+        for product in ["rgb", "depth", "disp", "object_id"]:
+            pattern = getattr(LF, "%s_views" % product)
+            col.prop(LF, "%s_views" % product)
+            if pattern == 'STRIDE':
+                col.prop(LF, "%s_view_stride" % product)
+            elif pattern == 'LIST':
+                col.prop(LF, "%s_view_list" % product)
 
         col = layout.column(align=True)
         col.label("Meta information:")
@@ -0,0 +1,281 @@
+############################################################################
+#  This file is part of the 4D Light Field Benchmark.                      #
+#                                                                          #
+#  This work is licensed under the Creative Commons                        #
+#  Attribution-NonCommercial-ShareAlike 4.0 International License.         #
+#  To view a copy of this license,                                         #
+#  visit http://creativecommons.org/licenses/by-nc-sa/4.0/.                #
+#                                                                          #
+#  Authors: Katrin Honauer & Ole Johannsen                                 #
+#  Contact: contact@lightfield-analysis.net                                #
+#  Website: www.lightfield-analysis.net                                    #
+#                                                                          #
+#  This add-on is based upon work of Maximilian Diebold                    #
+#                                                                          #
+#  The 4D Light Field Benchmark was jointly created by the University of   #
+#  Konstanz and the HCI at Heidelberg University. If you use any part of   #
+#  the benchmark, please cite our paper "A dataset and evaluation          #
+#  methodology for depth estimation on 4D light fields". Thanks!           #
+#                                                                          #
+#  @inproceedings{honauer2016benchmark,                                    #
+#    title={A dataset and evaluation methodology for depth estimation on   #
+#           4D light fields},                                              #
+#    author={Honauer, Katrin and Johannsen, Ole and Kondermann, Daniel     #
+#            and Goldluecke, Bastian},                                     #
+#    booktitle={Asian Conference on Computer Vision},                      #
+#    year={2016},                                                          #
+#    organization={Springer}                                               #
+#    }                                                                     #
+#                                                                          #
+############################################################################
+
+
+"""
+Renders a light field job in a background blender process, e.g.
+
+    blender -b scene.blend --python headless.py -- --job job.json
+
+A job file is a json dict with the target directory 'tgt_dir' and optionally a light field 'config' file,
+'settings' (light field properties set after loading the config) and a 'depth_source_dir' with the
+rendering of a job with identical center camera, whose center view depth map is reused.
+Before rendering, the estimated memory and disk space are checked and the job fails if they exceed the available
+resources, unless --force is given. --estimate only prints the estimate including the render time.
+A job may also give a single 'frame' and a list of input 'views' (grid indices) to render.
+
+With --serve, the process stays alive as worker of a warm pool (see worker_pool.py) and renders jobs received
+as json lines on a local port, the .blend file of a job is only loaded if it differs from the open one or changed
+on disk. Requests are only accepted with the 'token' given in the environment variable LF_WORKER_TOKEN:
+
+    LF_WORKER_TOKEN=<secret> blender -b --python headless.py -- --serve --port 5800
+"""
+
+import argparse
+import hmac
+import importlib
+import json
+import os
+import socket
+import sys
+import time
+import traceback
+
+import bpy
+
+
+# environment variable with the token which requests to a --serve worker must contain
+TOKEN_VARIABLE = 'LF_WORKER_TOKEN'
+
+# the imported add-on, see get_addon
+addon = None
+
+
+def get_addon():
+    """
+    Imports and registers the add-on this script belongs to, unless it is enabled already
+    """
+    global addon
+    if addon is None:
+        addon_dir = os.path.dirname(os.path.abspath(__file__))
+        if os.path.dirname(addon_dir) not in sys.path:
+            sys.path.insert(0, os.path.dirname(addon_dir))
+        addon = importlib.import_module(os.path.basename(addon_dir))
+    if not hasattr(bpy.types.Scene, 'LF'):
+        addon.register()
+    return addon
+
+
+def apply_job(job):
+    LF = bpy.context.scene.LF
+
+    if job.get('config'):
+        LF.path_config_file = job['config']
+        bpy.ops.scene.load_lightfield('EXEC_DEFAULT')
+
+    # set the rig settings without their update callbacks, the light field is created once below
+    settings = job.get('settings', {})
+    LF.set_settings(settings)
+    for key in LF.shared_settings:
+        if key in settings:
+            setattr(LF, key, settings[key])
+    if 'baseline_mm' in settings:
+        LF.baseline_x_m = LF.baseline_y_m = LF.baseline_mm / 1000.0
+
+    if job.get('frame') is not None:
+        LF.sequence_start = LF.sequence_end = int(job['frame'])
+    if job.get('views') is not None:
+        LF.rgb_views = 'LIST'
+        LF.rgb_view_list = ', '.join(str(idx) for idx in job['views'])
+
+    LF.tgt_dir = job['tgt_dir']
+    LF.depth_source_dir = job.get('depth_source_dir') or ''
+    bpy.ops.scene.create_lightfield('EXEC_DEFAULT')
+
+
+def render_job(job, force=False):
+    """
+    Renders a job after checking its estimated memory and disk space, returns False if the limits are exceeded
+    """
+    simulator = get_addon().lightfield_simulator
+    apply_job(job)
+    LF = bpy.context.scene.LF
+
+    cost = simulator.get_render_cost(LF)
+    print("\n".join(simulator.format_render_cost(cost)))
+    errors, warnings = simulator.check_render_cost(LF, cost)
+    for message in warnings:
+        print("Warning: rendering needs " + message)
+    for message in errors:
+        print("Error: rendering needs " + message)
+    if errors and not force:
+        return False
+
+    # the limits were checked above, the override only applies to this job
+    ignore_cost_limits = LF.ignore_cost_limits
+    LF.ignore_cost_limits = True
+    try:
+        bpy.ops.scene.render_lightfield('EXEC_DEFAULT')
+    finally:
+        LF.ignore_cost_limits = ignore_cost_limits
+    return True
+
+
+class WarmScene:
+    """
+    Keeps a .blend file open between jobs. The light field settings of the file are restored before each job,
+    so that no job sees the settings of the previous one.
+    """
+
+    def __init__(self):
+        self.blend_file = None
+        self.mtime = None
+        self.defaults = None
+
+    def adopt_open_file(self):
+        """
+        Keeps the .blend file opened on the command line, if any
+        """
+        if bpy.data.filepath:
+            self.blend_file = os.path.abspath(bpy.data.filepath)
+            self.mtime = os.path.getmtime(self.blend_file)
+
+    def prepare(self, blend_file=None):
+        """
+        Opens blend_file unless it is open and unchanged on disk, then restores the settings of the open file
+        """
+        if blend_file:
+            blend_file = os.path.abspath(blend_file)
+            mtime = os.path.getmtime(blend_file)
+            if (blend_file, mtime) != (self.blend_file, self.mtime):
+                print("Loading: %s" % blend_file)
+                bpy.ops.wm.open_mainfile(filepath=blend_file)
+                self.blend_file = blend_file
+                self.mtime = mtime
+                self.defaults = None
+
+        if self.defaults is None:
+            self.store_defaults()
+        else:
+            self.restore_defaults()
+
+    def store_defaults(self):
+        LF = bpy.context.scene.LF
+        self.defaults = (LF.get_settings(), {key: getattr(LF, key) for key in LF.shared_settings})
+
+    def restore_defaults(self):
+        LF = bpy.context.scene.LF
+        settings, shared_settings = self.defaults
+        LF.set_settings(settings)
+        for key, value in shared_settings.items():
+            setattr(LF, key, value)
+
+
+def serve(port, force=False):
+    """
+    Renders the jobs received on a local port until a 'quit' command, each request and response is a json line
+    """
+    token = os.environ.get(TOKEN_VARIABLE)
+    if not token:
+        raise RuntimeError("Set %s to the token of the requests, the worker accepts no others." % TOKEN_VARIABLE)
+
+    get_addon()
+    scene = WarmScene()
+    scene.adopt_open_file()
+
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(('127.0.0.1', port))
+    server.listen(1)
+    # with port 0 the system picks a free port, the worker pool reads it from this line
+    print("Worker ready on port %d" % server.getsockname()[1])
+    sys.stdout.flush()
+
+    try:
+        while True:
+            connection, _ = server.accept()
+            with connection, connection.makefile('rw') as stream:
+                try:
+                    request = json.loads(stream.readline())
+                except ValueError:
+                    request = {}
+                # any local process can connect, only the pool knows the token
+                if not isinstance(request, dict) or \
+                        not hmac.compare_digest(str(request.get('token', '')), token):
+                    stream.write(json.dumps({'ok': False, 'error': 'invalid token'}) + '\n')
+                    continue
+                if request.get('command') == 'quit':
+                    stream.write(json.dumps({'ok': True}) + '\n')
+                    break
+
+                start_time = time.time()
+                try:
+                    scene.prepare(request.get('blend_file'))
+                    response = {'ok': render_job(request, force)}
+                    if not response['ok']:
+                        response['error'] = 'memory or disk limits exceeded'
+                except Exception as e:
+                    traceback.print_exc()
+                    response = {'ok': False, 'error': str(e)}
+                response['duration'] = time.time() - start_time
+                sys.stdout.flush()
+                stream.write(json.dumps(response) + '\n')
+    finally:
+        server.close()
+
+
+def main(argv):
+    # blender passes the arguments after '--' to the script
+    if '--' in argv:
+        argv = argv[argv.index('--') + 1:]
+    else:
+        argv = []
+
+    parser = argparse.ArgumentParser(description='Render a light field job in a background blender process.')
+    parser.add_argument('--job', help='job file (json)')
+    parser.add_argument('--serve', action='store_true', help='render jobs received on a local port')
+    parser.add_argument('--port', type=int, default=5800, help='port of --serve, 0 picks a free port')
+    parser.add_argument('--estimate', action='store_true',
+                        help='only print the estimated render time, memory and disk space, with a probe render')
+    parser.add_argument('--force', action='store_true', help='render even if memory or disk limits are exceeded')
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        serve(args.port, args.force)
+        return
+    if not args.job:
+        parser.error('--job or --serve is required')
+
+    with open(args.job) as f:
+        job = json.load(f)
+
+    get_addon()
+    if args.estimate:
+        apply_job(job)
+        bpy.ops.scene.estimate_render_cost('EXEC_DEFAULT')
+        return
+
+    if not render_job(job, args.force):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
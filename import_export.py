@@ -36,6 +36,10 @@ from bpy.props import *
 
 import configparser
 
+import numpy as np
+
+from . import lightfield_core, view_selection
+
 
 class OBJECT_OT_save_lightfield(bpy.types.Operator):
     """Save config file with camera setup"""
@@ -94,17 +98,23 @@ class OBJECT_OT_save_lightfield(bpy.types.Operator):
         parser.set(section, 'frustum_disp_max', str(LF.frustum_max_disp))
         parser.set(section, 'depth_map_scale', str(LF.depth_map_scale))
 
+        section = "views"
+        parser.add_section(section)
+        for product in view_selection.VIEW_PRODUCTS:
+            parser.set(section, '%s_views' % product, getattr(LF, '%s_views' % product))
+            parser.set(section, '%s_view_stride' % product, str(getattr(LF, '%s_view_stride' % product)))
+            parser.set(section, '%s_view_list' % product, getattr(LF, '%s_view_list' % product))
+            indices = np.flatnonzero(LF.get_view_mask(product))
+            parser.set(section, '%s_view_indices' % product, ', '.join(str(idx) for idx in indices))
+
         with open(bpy.path.abspath(LF.path_config_file), "w") as f:
             parser.write(f)
 
         return {'FINISHED'}
 
     def get_offset(self, LF):
-        if LF.focus_dist > 0:
-            offset = LF.baseline_mm * LF.focal_length / LF.focus_dist / 1000. / LF.sensor_size * max(LF.x_res, LF.y_res)
-        else:
-            offset = 0
-        return offset
+        return lightfield_core.get_offset(LF.baseline_mm, LF.focal_length, LF.focus_dist, LF.sensor_size,
+                                          max(LF.x_res, LF.y_res))
 
 
 
@@ -138,6 +148,11 @@ class OBJECT_OT_load_lightfield(bpy.types.Operator):
         LF.min_disp = float(parser.get(section, 'disp_min'))
         LF.max_disp = float(parser.get(section, 'disp_max'))
         LF.depth_map_scale = float(parser.get(section, 'depth_map_scale'))
+        try:
+            lightfield_core.get_integer_scale(LF.depth_map_scale)
+        except ValueError as e:
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
         LF.cycles_seed = float(parser.get(section, 'cycles_seed'))
 
         section = "extrinsics"
@@ -152,5 +167,13 @@ class OBJECT_OT_load_lightfield(bpy.types.Operator):
         LF.center_cam_rot_y = float(parser.get(section, 'center_cam_ry_rad'))
         LF.center_cam_rot_z = float(parser.get(section, 'center_cam_rz_rad'))
 
+        # view selection is optional for config files written before it was introduced
+        section = "views"
+        if parser.has_section(section):
+            for product in view_selection.VIEW_PRODUCTS:
+                setattr(LF, '%s_views' % product, parser.get(section, '%s_views' % product))
+                setattr(LF, '%s_view_stride' % product, int(parser.get(section, '%s_view_stride' % product)))
+                setattr(LF, '%s_view_list' % product, parser.get(section, '%s_view_list' % product))
+
         bpy.ops.scene.create_lightfield('EXEC_DEFAULT')
         return {'FINISHED'}
@@ -0,0 +1,277 @@
+############################################################################
+#  This file is part of the 4D Light Field Benchmark.                      #
+#                                                                          #
+#  This work is licensed under the Creative Commons                        #
+#  Attribution-NonCommercial-ShareAlike 4.0 International License.         #
+#  To view a copy of this license,                                         #
+#  visit http://creativecommons.org/licenses/by-nc-sa/4.0/.                #
+#                                                                          #
+#  Authors: Katrin Honauer & Ole Johannsen                                 #
+#  Contact: contact@lightfield-analysis.net                                #
+#  Website: www.lightfield-analysis.net                                    #
+#                                                                          #
+#  This add-on is based upon work of Maximilian Diebold                    #
+#                                                                          #
+#  The 4D Light Field Benchmark was jointly created by the University of   #
+#  Konstanz and the HCI at Heidelberg University. If you use any part of   #
+#  the benchmark, please cite our paper "A dataset and evaluation          #
+#  methodology for depth estimation on 4D light fields". Thanks!           #
+#                                                                          #
+#  @inproceedings{honauer2016benchmark,                                    #
+#    title={A dataset and evaluation methodology for depth estimation on   #
+#           4D light fields},                                              #
+#    author={Honauer, Katrin and Johannsen, Ole and Kondermann, Daniel     #
+#            and Goldluecke, Bastian},                                     #
+#    booktitle={Asian Conference on Computer Vision},                      #
+#    year={2016},                                                          #
+#    organization={Springer}                                               #
+#    }                                                                     #
+#                                                                          #
+############################################################################
+
+
+
+"""
+Lease based queue of named tasks, e.g. the frames of a sequence, in a directory of a shared file system.
+Any number of workers on any number of machines claim tasks without a central service:
+
+    <task>.lock   created exclusively by the worker holding the lease, its mtime is the heartbeat
+    <task>.done   written when the task is complete
+
+A lease whose heartbeat is older than the lease time belongs to a dead worker and is reclaimed by the next
+worker looking for work. Run `python job_queue.py <queue dir>` to print the state of a queue.
+"""
+
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import uuid
+
+
+class JobQueue:
+    """
+    Claims, renews and completes leases on tasks in queue_dir. Use as context manager, which renews the held
+    leases in a background thread and releases unfinished tasks on exit.
+    """
+
+    def __init__(self, queue_dir, lease_seconds=1800, worker_id=None):
+        self.queue_dir = queue_dir
+        self.lease_seconds = lease_seconds
+        self.worker_id = worker_id or '%s-%d-%s' % (socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+        self.held = set()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        if not os.path.isdir(queue_dir):
+            os.makedirs(queue_dir, exist_ok=True)
+
+    def __enter__(self):
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run_heartbeat, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def close(self):
+        if self.thread is not None:
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
+        for task in list(self.held):
+            self.release(task)
+
+    def get_lock_path(self, task):
+        return os.path.join(self.queue_dir, task + '.lock')
+
+    def get_done_path(self, task):
+        return os.path.join(self.queue_dir, task + '.done')
+
+    def is_done(self, task):
+        return os.path.isfile(self.get_done_path(task))
+
+    def get_lease_age(self, task):
+        """
+        Returns the seconds since the last heartbeat of the lease on a task or None if it is not leased
+        """
+        try:
+            return time.time() - os.path.getmtime(self.get_lock_path(task))
+        except OSError:
+            return None
+
+    def get_owner(self, task):
+        try:
+            with open(self.get_lock_path(task)) as f:
+                return json.load(f).get('worker')
+        except (IOError, ValueError):
+            return None
+
+    def try_claim(self, task):
+        """
+        Claims the lease on a task, an expired lease is reclaimed first. Returns True if the lease was claimed.
+        """
+        if self.is_done(task):
+            return False
+
+        age = self.get_lease_age(task)
+        if age is not None and age > self.lease_seconds:
+            self.reclaim(task)
+
+        lock_path = self.get_lock_path(task)
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'worker': self.worker_id, 'host': socket.gethostname(), 'pid': os.getpid(),
+                       'claimed': time.time()}, f)
+
+        # another worker may have completed the task between the check and the claim
+        if self.is_done(task):
+            os.remove(lock_path)
+            return False
+
+        with self.lock:
+            self.held.add(task)
+        return True
+
+    def reclaim(self, task):
+        """
+        Removes an expired lease. Renaming is atomic, so only one of several reclaiming workers succeeds.
+        """
+        lock_path = self.get_lock_path(task)
+        stale_path = '%s.%s.stale' % (lock_path, self.worker_id)
+        try:
+            os.rename(lock_path, stale_path)
+        except OSError:
+            return
+
+        try:
+            # the owner may have renewed the lease just before the rename, then it is restored
+            if time.time() - os.path.getmtime(stale_path) <= self.lease_seconds:
+                try:
+                    os.link(stale_path, lock_path)
+                except OSError:
+                    pass
+                return
+
+            with open(stale_path) as f:
+                owner = json.load(f).get('worker')
+            print("Reclaiming task %s from worker %s, its lease expired." % (task, owner))
+        except (IOError, ValueError):
+            print("Reclaiming task %s, its lease expired." % task)
+        finally:
+            try:
+                os.remove(stale_path)
+            except OSError:
+                pass
+
+    def heartbeat(self):
+        """
+        Renews the leases of all held tasks and drops tasks whose lease was reclaimed by another worker
+        """
+        with self.lock:
+            for task in list(self.held):
+                owner = self.get_owner(task)
+                if owner is None:
+                    # another worker checking the lease has moved the lock away, it restores it unless expired
+                    continue
+                if owner != self.worker_id:
+                    print("Lost the lease on task %s to worker %s." % (task, owner))
+                    self.held.discard(task)
+                    continue
+                try:
+                    os.utime(self.get_lock_path(task))
+                except OSError:
+                    pass
+
+    def run_heartbeat(self):
+        while not self.stop_event.wait(self.lease_seconds / 4.0):
+            self.heartbeat()
+
+    def complete(self, task):
+        """
+        Marks a held task as done and releases its lease
+        """
+        done_path = self.get_done_path(task)
+        tmp_path = '%s.%s.tmp' % (done_path, self.worker_id)
+        with open(tmp_path, 'w') as f:
+            json.dump({'worker': self.worker_id, 'host': socket.gethostname(), 'completed': time.time()}, f)
+        os.replace(tmp_path, done_path)
+        self.release(task)
+
+    def release(self, task):
+        """
+        Releases the lease on a task without completing it, so that other workers can claim it immediately
+        """
+        with self.lock:
+            self.held.discard(task)
+            if self.get_owner(task) == self.worker_id:
+                try:
+                    os.remove(self.get_lock_path(task))
+                except OSError:
+                    pass
+
+    def iter_tasks(self, tasks, poll_seconds=10.0, block=True):
+        """
+        Yields claimed tasks until all tasks are done. The caller completes each task before the next one is
+        claimed. While the remaining tasks are leased by other workers, it waits for them to complete or expire,
+        which blocks unless block is False. Then None is yielded while waiting, so that the caller stays responsive.
+        """
+        while True:
+            pending = [task for task in tasks if not self.is_done(task)]
+            if not pending:
+                return
+
+            claimed = next((task for task in pending if task not in self.held and self.try_claim(task)), None)
+            if claimed is not None:
+                yield claimed
+                continue
+
+            print("Waiting for %d task(s) leased by other workers." % len(pending))
+            if block:
+                time.sleep(poll_seconds)
+                continue
+            next_poll = time.time() + poll_seconds
+            yield None
+            while time.time() < next_poll:
+                yield None
+
+    def get_status(self, tasks):
+        """
+        Returns a dict of task -> 'done', 'leased', 'expired' or 'open'
+        """
+        status = {}
+        for task in tasks:
+            age = self.get_lease_age(task)
+            if self.is_done(task):
+                status[task] = 'done'
+            elif age is None:
+                status[task] = 'open'
+            else:
+                status[task] = 'leased' if age <= self.lease_seconds else 'expired'
+        return status
+
+
+def main(argv):
+    if len(argv) != 2:
+        print("Usage: python job_queue.py <queue dir>")
+        return 1
+
+    queue = JobQueue(argv[1])
+    tasks = sorted({name.split('.')[0] for name in os.listdir(argv[1]) if name.endswith(('.lock', '.done'))})
+    for task, state in sorted(queue.get_status(tasks).items()):
+        line = "%s: %s" % (task, state)
+        if state in ['leased', 'expired']:
+            line += " by %s, heartbeat %.0fs ago" % (queue.get_owner(task), queue.get_lease_age(task))
+        print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
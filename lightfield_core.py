@@ -0,0 +1,745 @@
+############################################################################
+#  This file is part of the 4D Light Field Benchmark.                      #
+#                                                                          #
+#  This work is licensed under the Creative Commons                        #
+#  Attribution-NonCommercial-ShareAlike 4.0 International License.         #
+#  To view a copy of this license,                                         #
+#  visit http://creativecommons.org/licenses/by-nc-sa/4.0/.                #
+#                                                                          #
+#  Authors: Katrin Honauer & Ole Johannsen                                 #
+#  Contact: contact@lightfield-analysis.net                                #
+#  Website: www.lightfield-analysis.net                                    #
+#                                                                          #
+#  This add-on is based upon work of Maximilian Diebold                    #
+#                                                                          #
+#  The 4D Light Field Benchmark was jointly created by the University of   #
+#  Konstanz and the HCI at Heidelberg University. If you use any part of   #
+#  the benchmark, please cite our paper "A dataset and evaluation          #
+#  methodology for depth estimation on 4D light fields". Thanks!           #
+#                                                                          #
+#  @inproceedings{honauer2016benchmark,                                    #
+#    title={A dataset and evaluation methodology for depth estimation on   #
+#           4D light fields},                                              #
+#    author={Honauer, Katrin and Johannsen, Ole and Kondermann, Daniel     #
+#            and Goldluecke, Bastian},                                     #
+#    booktitle={Asian Conference on Computer Vision},                      #
+#    year={2016},                                                          #
+#    organization={Springer}                                               #
+#    }                                                                     #
+#                                                                          #
+############################################################################
+
+
+"""
+Light field geometry, ground truth post-processing and image I/O without dependencies on blender.
+Positions are given in light field (rig container) coordinates, the cameras look along -z.
+"""
+
+import collections
+import concurrent.futures
+import os
+import struct
+import zlib
+
+import numpy as np
+
+# high resolution depths outside of this range times the low resolution depth range are pixel artefacts
+ARTEFACT_RANGE = (0.9, 1.1)
+
+
+def get_camera_axes(num_cams_x, num_cams_y, baseline_x, baseline_y):
+    """
+    Returns the camera x positions (num_cams_x,) of the grid columns and y positions (num_cams_y,) of the grid rows,
+    the grid is centered at the origin and row 0 is the top row
+    """
+    cam_x = baseline_x * (np.arange(num_cams_x) - (num_cams_x - 1) / 2.0)
+    cam_y = -baseline_y * (np.arange(num_cams_y) - (num_cams_y - 1) / 2.0)
+    return cam_x, cam_y
+
+
+def get_center_pose(num_cams_x, num_cams_y, baseline_x, baseline_y, focal_length, sensor_size, focus_dist):
+    """
+    Returns the position and lens shift (x, y, shift_x, shift_y) of the center view (row (num_cams_y - 1) // 2,
+    column (num_cams_x - 1) // 2), which is off the grid axis on even grids
+    """
+    cam_x, cam_y = get_camera_axes(num_cams_x, num_cams_y, baseline_x, baseline_y)
+    x = cam_x[(num_cams_x - 1) // 2]
+    y = cam_y[(num_cams_y - 1) // 2]
+    factor = get_shift_factor(focal_length, sensor_size, focus_dist)
+    return x, y, -x * factor, -y * factor
+
+
+def get_camera_positions(num_cams_x, num_cams_y, baseline_x, baseline_y):
+    """
+    Returns the positions (num_cams_y * num_cams_x, 3) of all cameras in the order of the camera indices
+    """
+    cam_x, cam_y = get_camera_axes(num_cams_x, num_cams_y, baseline_x, baseline_y)
+    x, y = np.meshgrid(cam_x, cam_y)
+    return np.stack([x.ravel(), y.ravel(), np.zeros(x.size)], axis=1)
+
+
+def get_shift_factor(focal_length, sensor_size, focus_dist):
+    """
+    Returns the factor from camera position to lens shift which focuses the grid at the focus distance
+    """
+    if focus_dist == 0:
+        return 0  # focused at infinity
+    return focal_length / sensor_size / focus_dist
+
+
+def get_camera_shifts(positions, focal_length, sensor_size, focus_dist):
+    """
+    Returns the lens shifts (N, 2) of cameras at positions (N, 2|3)
+    """
+    return -np.asarray(positions)[:, :2] * get_shift_factor(focal_length, sensor_size, focus_dist)
+
+
+def get_offset(baseline_mm, focal_length, focus_dist, sensor_size, max_res):
+    """
+    Returns the disparity [px] between neighbouring views caused by the lens shift, i.e. of points at infinity
+    """
+    if focus_dist > 0:
+        return baseline_mm * focal_length / focus_dist / 1000. / sensor_size * max_res
+    return 0
+
+
+def get_frustum_coordinates(baseline_x, focal_length, focus_dist, sensor_size, x_res, y_res, min_disp, max_disp):
+    """
+    Returns vertices, edges and faces of the frustum covering the disparity range [min_disp, max_disp]
+    """
+    max_res = max(x_res, y_res)
+
+    if focus_dist == 0:
+        factor = baseline_x * focal_length * max_res
+        G_plus = factor / (max_disp * sensor_size)
+        G_minus = 10000  # factor / (min_disp * sensor_size)
+    else:
+        factor = baseline_x * focal_length * focus_dist * max_res
+        G_plus = factor / (baseline_x * focal_length * max_res + max_disp * focus_dist * sensor_size)
+        G_minus = factor / (baseline_x * focal_length * max_res + min_disp * focus_dist * sensor_size)
+        if G_minus < 0:
+            G_minus = 10000
+
+    A = 2.0 * focal_length / sensor_size
+    ARx = x_res / max_res
+    ARy = y_res / max_res
+
+    vertices = [(-ARx * G_minus / A, -ARy * G_minus / A, -G_minus),
+                ( ARx * G_minus / A, -ARy * G_minus / A, -G_minus),
+                ( ARx * G_minus / A, ARy * G_minus / A, -G_minus),
+                (-ARx * G_minus / A, ARy * G_minus / A, -G_minus),
+                (-ARx * G_plus / A, -ARy * G_plus / A, -G_plus),
+                ( ARx * G_plus / A, -ARy * G_plus / A, -G_plus),
+                ( ARx * G_plus / A, ARy * G_plus / A, -G_plus),
+                (-ARx * G_plus / A, ARy * G_plus / A, -G_plus)]
+
+    edges = [(0, 4), (1, 5), (2, 6), (3, 7)]
+    faces = [(0, 1, 2, 3), (4, 7, 6, 5)]
+    return vertices, edges, faces
+
+
+def depth_to_disparity(depth, baseline, focal_length, focus_dist, sensor_size, max_res):
+    """
+    Converts depth [m] of a shifted camera grid to disparity [px], focus_dist = 0 means focused at infinity
+    """
+    inv_focus = 1.0 / focus_dist if focus_dist > 0 else 0.0
+    return baseline * focal_length * max_res / sensor_size * (1.0 / depth - inv_focus)
+
+
+def transform_points(points, matrix):
+    """
+    Applies a 4x4 transformation matrix to an array of points with shape (N, 3)
+    """
+    return points.dot(matrix[:3, :3].T) + matrix[:3, 3]
+
+
+def get_grid_projection(points, cam_x, cam_y, focal_length, sensor_size, focus_dist):
+    """
+    Projects points (N, 3) in light field coordinates into all cameras of the grid.
+    As the grid is separable, returns image coordinates u (N, num_cams_x) and v (N, num_cams_y)
+    in units of the larger sensor dimension, relative to the shifted image center.
+    """
+    inv_focus = 1.0 / focus_dist if focus_dist > 0 else 0.0
+    scale = focal_length / sensor_size
+    depth = -points[:, 2:3]
+    depth = np.where(depth > 0, depth, np.inf)
+
+    u = scale * ((points[:, 0:1] - cam_x[np.newaxis, :]) / depth + cam_x[np.newaxis, :] * inv_focus)
+    v = scale * ((points[:, 1:2] - cam_y[np.newaxis, :]) / depth + cam_y[np.newaxis, :] * inv_focus)
+    return u, v
+
+
+def get_grid_visibility(points, cam_x, cam_y, focal_length, sensor_size, focus_dist, x_res, y_res):
+    """
+    Returns a boolean array (N,) which is True for points in front of the grid that fall into the image of any camera
+    """
+    max_res = max(x_res, y_res)
+    u, v = get_grid_projection(points, cam_x, cam_y, focal_length, sensor_size, focus_dist)
+    visible_x = np.any(np.abs(u) <= 0.5 * x_res / max_res, axis=1)
+    visible_y = np.any(np.abs(v) <= 0.5 * y_res / max_res, axis=1)
+    return visible_x & visible_y & (points[:, 2] < 0)
+
+
+def get_bounding_box_depth_range(corners, projection, clip_start, clip_end):
+    """
+    Returns the conservative depth range (min, max) of a bounding box with corners (8, 3)
+    in light field coordinates or None if the box is not seen by any camera of the grid.
+    """
+    cam_x, cam_y, focal_length, sensor_size, focus_dist, x_res, y_res = projection
+    depth = -corners[:, 2]
+    if np.all(depth < clip_start) or np.all(depth > clip_end):
+        return None
+
+    # boxes crossing the near plane cannot be projected and count as visible
+    if np.all(depth > 0):
+        max_res = max(x_res, y_res)
+        u, v = get_grid_projection(corners, cam_x, cam_y, focal_length, sensor_size, focus_dist)
+        half_x = 0.5 * x_res / max_res
+        half_y = 0.5 * y_res / max_res
+        overlap_x = np.any((np.amin(u, axis=0) <= half_x) & (np.amax(u, axis=0) >= -half_x))
+        overlap_y = np.any((np.amin(v, axis=0) <= half_y) & (np.amax(v, axis=0) >= -half_y))
+        if not (overlap_x and overlap_y):
+            return None
+
+    return max(np.amin(depth), clip_start), min(np.amax(depth), clip_end)
+
+
+def postprocess_depth_map(depth, depth_map_scale, disp_args, fpaths, edge_threshold=0.05, disp=None,
+                          camera_args=None, artefact_range=ARTEFACT_RANGE):
+    """
+    Creates low resolution depth and disparity maps from a high resolution depth map and fixes pixel artefacts.
+    The maps are written to fpaths, a dict of 'depth_highres', 'disp_highres', 'depth_lowres' and 'disp_lowres'
+    to lists of file paths. Optionally, fpaths may contain the low resolution depth statistics 'depth_lowres_min',
+    'depth_lowres_max', 'depth_lowres_mean', 'depth_lowres_std' and 'depth_lowres_edges' (see tile_statistics).
+    disp_args are (baseline, focal_length, focus_dist, sensor_size, max_res) as in depth_to_disparity.
+    The high resolution disparity map is computed from depth unless it is given, e.g. by the compositor.
+    The derived products 'normals_highres', 'normals_lowres' and 'boundaries_lowres' need the camera_args
+    (focal_length, sensor_size, shift_x, shift_y), see get_derived_maps. High resolution pixels outside of
+    artefact_range times the range of the low resolution depth are artefacts, which are inpainted.
+    Returns the range (min, max) of the low resolution disparity map.
+    """
+    # create depth map with original (low) resolution, the other statistics of each tile only if they are saved
+    full = any(product.startswith('depth_lowres_') for product in fpaths)
+    stats = tile_statistics(depth, depth_map_scale, depth_map_scale, edge_threshold, full)
+
+    # check if high resolution depth map has depth artifacts on individual pixels
+    min_depth = np.min(stats['median'])
+    max_depth = np.max(stats['median'])
+    m_out_of_range = (depth < artefact_range[0]*min_depth) + (depth > artefact_range[1]*max_depth)
+
+    if np.sum(m_out_of_range) > 0:
+        depth = fix_pixel_artefacts(depth, m_out_of_range)
+        stats = tile_statistics(depth, depth_map_scale, depth_map_scale, edge_threshold, full)
+        if disp is not None:
+            disp[m_out_of_range] = depth_to_disparity(depth[m_out_of_range], *disp_args)
+
+    # create disparity maps
+    if disp is None:
+        disp = depth_to_disparity(depth, *disp_args)
+    disp_small = median_downsampling(disp, depth_map_scale, depth_map_scale)
+
+    maps = {'depth_highres': depth, 'disp_highres': disp, 'disp_lowres': disp_small}
+    for stat, value in stats.items():
+        maps['depth_lowres' if stat == 'median' else 'depth_lowres_' + stat] = value
+    maps.update(get_derived_maps(depth, depth_map_scale, camera_args, edge_threshold, fpaths))
+
+    for product, product_fpaths in fpaths.items():
+        for fpath in product_fpaths:
+            if product == 'depth_lowres_edges':
+                # mask as png with the usual top-down row order
+                write_png(np.flipud(maps[product]) * np.uint8(255), fpath)
+            elif product == 'boundaries_lowres':
+                write_png(np.flipud(maps[product]), fpath)
+            else:
+                write_pfm(maps[product], fpath)
+
+    return np.amin(disp_small), np.amax(disp_small)
+
+
+def get_derived_maps(depth, depth_map_scale, camera_args, edge_threshold, products):
+    """
+    Computes the requested products 'normals_highres', 'normals_lowres' (see depth_to_normals) and 'boundaries_lowres'
+    (255 on the occluding and 128 on the occluded side of depth discontinuities, see get_occlusion_boundaries)
+    of a depth map with bottom-up rows. camera_args are (focal_length, sensor_size, shift_x, shift_y).
+    """
+    maps = {}
+    if 'normals_highres' in products or 'normals_lowres' in products:
+        focal_length, sensor_size, shift_x, shift_y = camera_args
+        normals = depth_to_normals(depth, focal_length, sensor_size, (shift_x, shift_y))
+        maps['normals_highres'] = normals
+        maps['normals_lowres'] = normal_downsampling(normals, depth_map_scale, depth_map_scale)
+
+    if 'boundaries_lowres' in products:
+        boundaries = get_occlusion_boundaries(depth, edge_threshold)
+        h, w = np.shape(depth)
+        scale = get_integer_scale(depth_map_scale)
+        tiles = boundaries.reshape(h // scale, scale, w // scale, scale)
+        occluding = np.max(tiles, axis=(1, 3)) > 0
+        occluded = np.min(tiles, axis=(1, 3)) < 0
+        maps['boundaries_lowres'] = np.where(occluding, 255, np.where(occluded, 128, 0)).astype(np.uint8)
+
+    return maps
+
+
+def depth_to_points(depth, focal_length, sensor_size, shift=(0.0, 0.0)):
+    """
+    Returns the camera coordinates (h, w, 3) of a depth map with bottom-up rows, x to the right, y up and the
+    camera looking along -z. The lens shift is given in units of the larger image dimension, as in blender.
+    """
+    h, w = np.shape(depth)
+    max_res = max(h, w)
+    pixel_size = sensor_size / float(focal_length * max_res)
+    ys, xs = np.mgrid[0:h, 0:w].astype(np.float32)
+    points = np.empty((h, w, 3), dtype=np.float32)
+    points[:, :, 0] = (xs + 0.5 - w / 2.0 + shift[0] * max_res) * pixel_size * depth
+    points[:, :, 1] = (ys + 0.5 - h / 2.0 + shift[1] * max_res) * pixel_size * depth
+    points[:, :, 2] = -depth
+    return points
+
+
+def depth_to_normals(depth, focal_length, sensor_size, shift=(0.0, 0.0)):
+    """
+    Returns unit surface normals (h, w, 3) in camera coordinates (see depth_to_points) of a depth map with bottom-up
+    rows, facing the camera. Normals are central differences of neighbouring points, at depth discontinuities the
+    difference with the closer neighbour is used.
+    """
+    points = depth_to_points(depth, focal_length, sensor_size, shift)
+
+    def get_tangent(axis):
+        # one sided differences to both neighbours, the one with the smaller depth change is used
+        points_axis = np.moveaxis(points, axis, 0)
+        forward = np.empty_like(points_axis)
+        forward[:-1] = points_axis[1:] - points_axis[:-1]
+        forward[-1] = forward[-2]
+        backward = np.empty_like(points_axis)
+        backward[1:] = forward[:-1]
+        backward[0] = forward[0]
+        use_forward = np.abs(forward[:, :, 2]) < np.abs(backward[:, :, 2])
+        return np.moveaxis(np.where(use_forward[:, :, np.newaxis], forward, backward), 0, axis)
+
+    normals = np.cross(get_tangent(1), get_tangent(0))
+    normals /= np.maximum(np.linalg.norm(normals, axis=2), 1e-12)[:, :, np.newaxis]
+
+    # the surface faces the camera at the origin
+    facing_away = np.sum(normals * points, axis=2) > 0
+    normals[facing_away] *= -1
+    return normals
+
+
+def normal_downsampling(normals, tile_height, tile_width):
+    """
+    Downsamples normals (h, w, 3) to the normalized mean of each tile
+    """
+    h, w, c = np.shape(normals)
+    tile_height = int(tile_height)
+    tile_width = int(tile_width)
+    tiles = normals.reshape(h // tile_height, tile_height, w // tile_width, tile_width, c)
+    mean = np.mean(tiles, axis=(1, 3))
+    return (mean / np.maximum(np.linalg.norm(mean, axis=2), 1e-12)[:, :, np.newaxis]).astype(np.float32)
+
+
+def get_occlusion_boundaries(depth, edge_threshold=0.05):
+    """
+    Marks both sides of depth discontinuities, i.e. of relative depth differences above edge_threshold to a pixel of
+    the 4-neighbourhood: 1 on the occluding (closer) side, -1 on the occluded side and 0 elsewhere
+    """
+    h, w = np.shape(depth)
+    padded = np.pad(depth, 1, mode='edge')
+    boundaries = np.zeros((h, w), dtype=np.int8)
+    occluded = np.zeros((h, w), dtype=bool)
+    for dy, dx in [(0, 1), (2, 1), (1, 0), (1, 2)]:
+        neighbour = padded[dy:dy + h, dx:dx + w]
+        jump = np.abs(neighbour - depth) > edge_threshold * np.minimum(np.abs(neighbour), np.abs(depth))
+        boundaries[jump & (depth < neighbour)] = 1
+        occluded |= jump & (depth > neighbour)
+
+    # pixels on both sides of thin structures are occluding
+    boundaries[occluded & (boundaries == 0)] = -1
+    return boundaries
+
+
+def get_visibility_mask(center_depth, view_depth, disp_y, disp_x, di, dj, depth_tolerance=0.01):
+    """
+    Returns the mask of pixels of the center view which are visible in the view (di, dj) grid steps away, given
+    both depth maps and the disparities (dy, dx) of the center view per grid step, all with top-down rows.
+    A pixel is visible if the view has the same depth within depth_tolerance (relative) at its projection.
+    """
+    h, w = np.shape(center_depth)
+    ys, xs = np.mgrid[0:h, 0:w]
+    ty = np.round(ys - disp_y * di).astype(np.int64)
+    tx = np.round(xs - disp_x * dj).astype(np.int64)
+    inside = (ty >= 0) & (ty < h) & (tx >= 0) & (tx < w)
+
+    visible = np.zeros((h, w), dtype=bool)
+    depth = center_depth[inside]
+    visible[inside] = np.abs(view_depth[ty[inside], tx[inside]] - depth) <= depth_tolerance * depth
+    return visible
+
+
+def get_refinement_mask(depth, object_ids=None, edge_threshold=0.05):
+    """
+    Marks pixels of a native resolution depth map (h, w) at depth discontinuities or object boundaries, i.e. pixels
+    whose 8-neighbourhood has a relative depth difference above edge_threshold or a different object id
+    """
+    h, w = np.shape(depth)
+    padded_depth = np.pad(depth, 1, mode='edge')
+    mask = np.zeros((h, w), dtype=bool)
+    if object_ids is not None:
+        padded_ids = np.pad(object_ids, 1, mode='edge')
+
+    for dy in [0, 1, 2]:
+        for dx in [0, 1, 2]:
+            if dy == 1 and dx == 1:
+                continue
+            neighbour_depth = padded_depth[dy:dy + h, dx:dx + w]
+            mask |= np.abs(neighbour_depth - depth) > edge_threshold * np.minimum(np.abs(neighbour_depth),
+                                                                                  np.abs(depth))
+            if object_ids is not None:
+                mask |= padded_ids[dy:dy + h, dx:dx + w] != object_ids
+
+    return mask
+
+
+def get_refinement_rects(mask, block_size=16):
+    """
+    Covers the marked pixels of a mask (h, w) with rectangles (y0, x0, y1, x1) of block_size x block_size blocks,
+    consecutive marked blocks of a block row are merged into one rectangle
+    """
+    h, w = np.shape(mask)
+    rects = []
+    for y0 in range(0, h, block_size):
+        y1 = min(h, y0 + block_size)
+        x0 = None
+        for bx in range(0, w, block_size):
+            marked = np.any(mask[y0:y1, bx:bx + block_size])
+            if marked and x0 is None:
+                x0 = bx
+            elif not marked and x0 is not None:
+                rects.append((y0, x0, y1, bx))
+                x0 = None
+        if x0 is not None:
+            rects.append((y0, x0, y1, w))
+    return rects
+
+
+def postprocess_adaptive_depth_map(depth, rects, rect_depths, depth_map_scale, disp_args, fpaths, edge_threshold=0.05,
+                                   camera_args=None, artefact_range=ARTEFACT_RANGE):
+    """
+    Creates low resolution depth and disparity maps from a native resolution depth map (h, w), refined by high
+    resolution depth maps rect_depths of the rectangles rects (see get_refinement_rects) in low resolution pixels.
+    fpaths is a dict of products to lists of file paths as in postprocess_depth_map, except for high resolution
+    maps, which are written as 'depth_highres_sparse' .npz file with the rectangles 'rects', the 'scale' and
+    'depth_<k>' and 'disp_<k>' of the k-th rectangle. Derived products are computed from the low resolution depth.
+    Artefacts are detected with artefact_range relative to the range of the native depth map.
+    Returns the range (min, max) of the low resolution disparity.
+    """
+    scale = get_integer_scale(depth_map_scale)
+
+    # smooth regions keep the native depth, refined rectangles get the statistics of their high resolution depth
+    maps = {'depth_lowres': np.array(depth, dtype=np.float32), 'disp_lowres': depth_to_disparity(depth, *disp_args),
+            'depth_lowres_min': np.array(depth, dtype=np.float32), 'depth_lowres_max': np.array(depth, dtype=np.float32),
+            'depth_lowres_mean': np.array(depth, dtype=np.float32), 'depth_lowres_std': np.zeros_like(depth),
+            'depth_lowres_edges': np.zeros(np.shape(depth), dtype=bool)}
+    sparse = {'rects': np.array(rects, dtype=np.int32).reshape((-1, 4)), 'scale': np.int32(scale)}
+
+    # depth range of the native map to detect artefacts on individual high resolution pixels
+    full = any(product.startswith('depth_lowres_') for product in fpaths)
+    min_depth = np.min(depth)
+    max_depth = np.max(depth)
+
+    for k, ((y0, x0, y1, x1), rect_depth) in enumerate(zip(rects, rect_depths)):
+        m_out_of_range = (rect_depth < artefact_range[0]*min_depth) + (rect_depth > artefact_range[1]*max_depth)
+        if np.sum(m_out_of_range) > 0:
+            rect_depth = fix_pixel_artefacts(rect_depth, m_out_of_range)
+
+        stats = tile_statistics(rect_depth, scale, scale, edge_threshold, full)
+        maps['depth_lowres'][y0:y1, x0:x1] = stats.pop('median')
+        for stat, value in stats.items():
+            maps['depth_lowres_' + stat][y0:y1, x0:x1] = value
+
+        rect_disp = depth_to_disparity(rect_depth, *disp_args)
+        maps['disp_lowres'][y0:y1, x0:x1] = median_downsampling(rect_disp, scale, scale)
+        sparse['depth_%d' % k] = rect_depth
+        sparse['disp_%d' % k] = rect_disp
+
+    # derived products only exist for the low resolution depth
+    maps.update(get_derived_maps(maps['depth_lowres'], 1, camera_args, edge_threshold, fpaths))
+
+    for product, product_fpaths in fpaths.items():
+        for fpath in product_fpaths:
+            if product == 'depth_highres_sparse':
+                with open(fpath, 'wb') as file:
+                    np.savez(file, **sparse)
+            elif product == 'depth_lowres_edges':
+                write_png(np.flipud(maps[product]) * np.uint8(255), fpath)
+            elif product == 'boundaries_lowres':
+                write_png(np.flipud(maps[product]), fpath)
+            else:
+                write_pfm(maps[product], fpath)
+
+    return np.amin(maps['disp_lowres']), np.amax(maps['disp_lowres'])
+
+
+def fix_pixel_artefacts(disp, m_out_of_range, half_window=1):
+    print("Fixing %d out of range pixel(s), values: %s" % (np.sum(m_out_of_range), list(disp[m_out_of_range])))
+    coords = np.where(m_out_of_range)
+    h, w = np.shape(disp)
+
+    for x, y in zip(coords[1], coords[0]):
+        xmin = max(0, x - half_window)
+        xmax = min(w - 1, x + half_window)
+        ymin = max(0, y - half_window)
+        ymax = min(h - 1, y + half_window)
+
+        window_values = disp[ymin:ymax + 1, xmin:xmax + 1]
+        valid_window_values = window_values[~m_out_of_range[ymin:ymax + 1, xmin:xmax + 1]]
+        n_values = np.size(valid_window_values)
+
+        if n_values == 0:
+            print("Could not find any pixels for inpainting depth artifact at (%d, %d)." % (y, x))
+            continue
+
+        # compute median (without averaging for even n)
+        median = np.sort(valid_window_values)[n_values // 2]
+        disp[y, x] = median
+
+    return disp
+
+
+def get_integer_scale(depth_map_scale):
+    """
+    Returns the depth map scale as int, the high resolution tiles must align with the low resolution pixels
+    """
+    scale = int(round(depth_map_scale))
+    if scale < 1 or abs(depth_map_scale - scale) > 1e-6:
+        raise ValueError("The depth map scale must be a positive integer, not %s." % depth_map_scale)
+    return scale
+
+
+def median_downsampling(img, tile_height, tile_width):
+    h, w = np.shape(img)
+    if w % tile_width or h % tile_height:
+        raise Exception("Image dimensions must be multiple of tile dimensions.")
+
+    n_tiles_horiz = w / tile_width
+    n_tiles_vert = h / tile_height
+    n_tiles = n_tiles_horiz * n_tiles_vert
+
+    # split vertically into tiles with height=tile_height, width=img_width
+    tiles_vert = np.asarray(np.split(img, int(n_tiles_vert), 0))  # n_tiles_vert x tile_height x w
+    tiles_vert = tiles_vert.transpose([1, 0, 2]).reshape(int(tile_height), int(n_tiles_vert * w))
+
+    # split horizontally into tiles with height=tile_height, width=tile_width
+    tiles = np.asarray(np.split(tiles_vert, n_tiles, 1))
+    tiles = tiles.reshape(int(n_tiles), int(tile_width * tile_height))  # n_tiles x px_per_tile
+
+    # compute median per tile (without averaging for even N)
+    tiles = np.sort(tiles, axis=1)[:, int(tile_width*tile_height/2)]
+    small_img = tiles.reshape(int(n_tiles_vert), int(n_tiles_horiz))
+
+    return small_img
+
+
+def tile_statistics(img, tile_height, tile_width, edge_threshold=0.05, full=True):
+    """
+    Computes statistics of each tile of an image in a single pass, returns a dict of low resolution images:
+    'median' (without averaging, as median_downsampling) and unless full is False also 'min', 'max', 'mean', 'std'
+    and 'edges', a boolean mask of tiles whose value range exceeds edge_threshold times the median, i.e. depth
+    discontinuities.
+    """
+    h, w = np.shape(img)
+    if w % tile_width or h % tile_height:
+        raise Exception("Image dimensions must be multiple of tile dimensions.")
+
+    tile_height = int(tile_height)
+    tile_width = int(tile_width)
+    n_tiles_vert = h // tile_height
+    n_tiles_horiz = w // tile_width
+    px_per_tile = tile_height * tile_width
+
+    # n_tiles x px_per_tile, sorted so that median, min and max can be read off
+    tiles = img.reshape(n_tiles_vert, tile_height, n_tiles_horiz, tile_width).transpose([0, 2, 1, 3])
+    tiles = np.sort(tiles.reshape(-1, px_per_tile), axis=1)
+
+    stats = {'median': tiles[:, px_per_tile // 2]}
+    if full:
+        stats.update({'min': tiles[:, 0], 'max': tiles[:, -1],
+                      'mean': np.mean(tiles, axis=1, dtype=np.float64), 'std': np.std(tiles, axis=1, dtype=np.float64)})
+        stats['edges'] = stats['max'] - stats['min'] > edge_threshold * np.abs(stats['median'])
+
+    for key, value in stats.items():
+        if key != 'edges':
+            value = value.astype(img.dtype)
+        stats[key] = value.reshape(n_tiles_vert, n_tiles_horiz)
+
+    return stats
+
+
+def mode_downsampling(img, tile_height, tile_width):
+    """
+    Downsamples a label image by majority vote per tile, ties are resolved by the smallest label
+    """
+    h, w = np.shape(img)
+    if w % tile_width or h % tile_height:
+        raise Exception("Image dimensions must be multiple of tile dimensions.")
+
+    tile_height = int(tile_height)
+    tile_width = int(tile_width)
+    n_tiles_vert = h // tile_height
+    n_tiles_horiz = w // tile_width
+    px_per_tile = tile_height * tile_width
+
+    # n_tiles x px_per_tile, sorted so that equal labels form consecutive runs
+    tiles = img.reshape(n_tiles_vert, tile_height, n_tiles_horiz, tile_width).transpose([0, 2, 1, 3])
+    tiles = np.sort(tiles.reshape(-1, px_per_tile), axis=1)
+
+    # length of the run up to each position, the mode ends the longest run
+    positions = np.arange(px_per_tile)
+    run_starts = np.ones(np.shape(tiles), dtype=bool)
+    run_starts[:, 1:] = tiles[:, 1:] != tiles[:, :-1]
+    run_lengths = positions - np.maximum.accumulate(np.where(run_starts, positions, 0), axis=1)
+    modes = tiles[np.arange(len(tiles)), np.argmax(run_lengths, axis=1)]
+
+    return modes.reshape(n_tiles_vert, n_tiles_horiz)
+
+
+def read_pfm(fpath, mmap=False):
+    """
+    Reads a pfm file as float array (h, w) or (h, w, 3) in file order (bottom-up), optionally memory mapped
+    """
+    with open(fpath, 'rb') as file:
+        channels = 3 if file.readline().strip() == b'PF' else 1
+        width, height = [int(value) for value in file.readline().split()]
+        scale = float(file.readline())
+        offset = file.tell()
+
+    dtype = '<f4' if scale < 0 else '>f4'
+    shape = (height, width, 3) if channels == 3 else (height, width)
+    if mmap:
+        return np.memmap(fpath, dtype=dtype, mode='r', offset=offset, shape=shape)
+    return np.fromfile(fpath, dtype=dtype, count=int(np.prod(shape)), offset=offset).reshape(shape)
+
+
+def write_pfm(data, fpath):
+    with open(fpath, 'wb') as file:
+        # header, three channel data is written as color pfm
+        height, width = np.shape(data)[:2]
+        file.write(('PF\n' if np.ndim(data) == 3 else 'Pf\n').encode('utf-8'))
+        file.write(('%d %d\n' % (width, height)).encode('utf-8'))
+        file.write(('%d\n' % -1).encode('utf-8'))
+
+        # data
+        values = np.ndarray.flatten(np.asarray(data, dtype=np.float32))
+        file.write(values)
+
+
+def write_png(data, fpath, bit_depth=8):
+    """
+    Writes an image (h, w) or (h, w, 3|4) of unsigned integers as 8 or 16 bit png
+    """
+    data = np.asarray(data)
+    height, width = np.shape(data)[:2]
+    channels = 1 if np.ndim(data) == 2 else np.shape(data)[2]
+    color_type = {1: 0, 3: 2, 4: 6}[channels]
+
+    # raw scanlines, each prefixed with filter type 0 (none)
+    dtype = '>u2' if bit_depth == 16 else np.uint8
+    scanlines = np.ascontiguousarray(data, dtype=dtype).view(np.uint8).reshape((height, -1))
+    scanlines = np.hstack((np.zeros((height, 1), dtype=np.uint8), scanlines))
+
+    def chunk(chunk_type, chunk_data):
+        return (struct.pack('>I', len(chunk_data)) + chunk_type + chunk_data +
+                struct.pack('>I', zlib.crc32(chunk_type + chunk_data) & 0xffffffff))
+
+    with open(fpath, 'wb') as file:
+        file.write(b'\x89PNG\r\n\x1a\n')
+        file.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, bit_depth, color_type, 0, 0, 0)))
+        file.write(chunk(b'IDAT', zlib.compress(scanlines.tobytes(), 6)))
+        file.write(chunk(b'IEND', b''))
+
+
+def linear_to_srgb(img):
+    """
+    Applies the sRGB transfer function to linear values in [0, 1]
+    """
+    img = np.clip(img, 0.0, 1.0)
+    return np.where(img <= 0.0031308, 12.92 * img, 1.055 * np.power(img, 1.0 / 2.4) - 0.055)
+
+
+def encode_image(rgb, file_format, transform=(True, 0.0, 1.0)):
+    """
+    Converts linear float rgb pixels (h, w, 3) stored bottom-up to the top-down values of a 'PNG', 'PNG16' or 'PFM'
+    file. The transform (use_srgb, exposure, gamma) is applied for png files only.
+    """
+    if file_format == 'PFM':
+        return np.flipud(rgb)
+
+    use_srgb, exposure, gamma = transform
+    rgb = rgb * 2.0 ** exposure
+    if use_srgb:
+        rgb = linear_to_srgb(rgb)
+    if gamma != 1.0:
+        rgb = np.power(np.clip(rgb, 0.0, 1.0), 1.0 / gamma)
+
+    max_value = 2 ** 16 - 1 if file_format == 'PNG16' else 2 ** 8 - 1
+    return np.round(np.clip(np.flipud(rgb), 0.0, 1.0) * max_value)
+
+
+def write_image(rgb, fpath, file_format, transform=(True, 0.0, 1.0)):
+    """
+    Writes linear float rgb pixels (h, w, 3) stored bottom-up as 'PNG', 'PNG16' or 'PFM', see encode_image
+    """
+    if file_format == 'PFM':
+        write_pfm(rgb, fpath)
+        return
+
+    write_png(encode_image(rgb, file_format, transform), fpath, bit_depth=16 if file_format == 'PNG16' else 8)
+
+
+def insert_view(image, view, i, j, num_cams_x, num_cams_y, layout):
+    """
+    Writes view (i, j) (h, w, c) into a light field image (num_cams_y * h, num_cams_x * w, c). The 'MOSAIC' layout
+    places the views side by side in grid order, the 'LENSLET' layout places the block of all views (i, j) of
+    pixel (y, x) at rows y * num_cams_y + i and columns x * num_cams_x + j.
+    """
+    h, w = np.shape(view)[:2]
+    if layout == 'MOSAIC':
+        image[i * h:(i + 1) * h, j * w:(j + 1) * w] = view
+    else:
+        image.reshape((h, num_cams_y, w, num_cams_x, -1))[:, i, :, j] = np.reshape(view, (h, w, -1))
+
+
+def write_atomic(write_func, data, fpath, *args):
+    """
+    Writes data to a temporary file and renames it, so fpath never contains a partial file
+    """
+    tmp_fpath = fpath + '.part'
+    write_func(data, tmp_fpath, *args)
+    os.replace(tmp_fpath, fpath)
+
+
+class AsyncImageWriter:
+    """
+    Writes files atomically in a thread pool with a bounded number of pending images
+    """
+
+    def __init__(self, num_threads, max_pending=None):
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, num_threads))
+        self.max_pending = max_pending or 2 * max(1, num_threads)
+        self.pending = collections.deque()
+
+    def write(self, write_func, data, fpath, *args):
+        self.submit(write_atomic, write_func, data, fpath, *args)
+
+    def submit(self, func, *args):
+        # wait for the oldest image to bound memory, this also raises its errors
+        while len(self.pending) >= self.max_pending:
+            self.pending.popleft().result()
+        self.pending.append(self.executor.submit(func, *args))
+
+    def close(self):
+        try:
+            while self.pending:
+                self.pending.popleft().result()
+        finally:
+            self.executor.shutdown()
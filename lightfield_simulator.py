@@ -32,12 +32,28 @@
 import bpy
 from bpy.props import *
 
+import collections
+import concurrent.futures
+import configparser
+import datetime
+import json
 import os
 import random
 import shutil
+import time
 
 import numpy as np
 
+from . import (cost_estimate, depth_cache, epi_export, job_queue, refocus, render_session, render_tuning,
+               view_selection, view_synthesis, virtual_rig)
+from .lightfield_core import (ARTEFACT_RANGE, AsyncImageWriter,
+                              get_bounding_box_depth_range, get_camera_axes, get_camera_positions, get_center_pose,
+                              get_frustum_coordinates, get_grid_visibility, get_shift_factor, transform_points,
+                              get_refinement_mask, get_refinement_rects, insert_view, get_integer_scale,
+                              depth_to_disparity, get_visibility_mask, mode_downsampling,
+                              postprocess_adaptive_depth_map, postprocess_depth_map,
+                              encode_image, read_pfm, write_atomic, write_image, write_pfm, write_png)
+
 from math import *
 from mathutils import *
 
@@ -108,6 +124,12 @@ class OBJECT_OT_create_lightfield(bpy.types.Operator):
 
         LF = bpy.context.scene.LF
 
+        try:
+            get_integer_scale(LF.depth_map_scale)
+        except ValueError as e:
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
+
         # Create lightfield container, but only if it doesn't exist yet.
         # If it exists, just clear it.
         # This is required as deleting the LF-object would also delete
@@ -129,7 +151,8 @@ class OBJECT_OT_create_lightfield(bpy.types.Operator):
             bpy.ops.object.select_all(action='DESELECT')
 
             # delete frustum, cameras and container
-            for camera in LF.get_lightfield_cameras():
+            for camera in LF.get_lightfield_cameras() + LF.get_virtual_rig_objects():
+                camera.hide_select = False
                 camera.select = True
 
             LF.get_frustum().hide = False
@@ -156,7 +179,10 @@ class OBJECT_OT_create_lightfield(bpy.types.Operator):
 
         # initialize lightfield elements
         self.set_render_properties()
-        cameras = self.create_cameras()
+        if LF.use_virtual_rig:
+            cameras = self.create_virtual_rig()
+        else:
+            cameras = self.create_cameras()
 
         frustum = self.create_frustum()
         frustum.hide_select = True
@@ -171,24 +197,32 @@ class OBJECT_OT_create_lightfield(bpy.types.Operator):
         bpy.context.scene.objects.active = lightfield
         lightfield.select = True
 
+        # keep the settings with the rig to support several rigs per scene
+        LF.store_rig_settings()
+
         return {'FINISHED'}
 
     def create_cameras(self):
         LF = bpy.context.scene.LF
-        pos_x = -LF.baseline_x_m * ((LF.num_cams_x - 1) / 2.0)
-        pos_y = LF.baseline_y_m * ((LF.num_cams_y - 1) / 2.0)
-        pos_z = 0
+        positions = get_camera_positions(LF.num_cams_x, LF.num_cams_y, LF.baseline_x_m, LF.baseline_y_m)
         cameras = []
 
         for i in range(0, LF.num_cams_y):
             for j in range(0, LF.num_cams_x):
+                pos_x, pos_y, pos_z = positions[i * LF.num_cams_x + j]
                 cameras.append(self.create_camera(LF.get_camera_name(i, j), pos_x, pos_y, pos_z, 0, 0))
-                pos_x += LF.baseline_x_m
-            pos_y -= LF.baseline_y_m
-            pos_x = -LF.baseline_x_m * float(((LF.num_cams_x - 1) / 2.0))
 
         return cameras
 
+    def create_virtual_rig(self):
+        """
+        Creates a single camera which is moved to each view while rendering and an instanced preview of the grid
+        """
+        LF = bpy.context.scene.LF
+        camera = self.create_camera(LF.get_virtual_camera_name(), 0, 0, 0, 0, 0)
+        grid = virtual_rig.create_preview(LF, camera)
+        return [camera, grid]
+
     def create_camera(self, cam_name, x_pos, y_pos, z_pos, theta, phi, eta=0):
         LF = bpy.context.scene.LF
         bpy.ops.object.camera_add(location=(x_pos, y_pos, z_pos),
@@ -202,11 +236,10 @@ class OBJECT_OT_create_lightfield(bpy.types.Operator):
         camera.data.sensor_height = LF.sensor_size
 
         if LF.focus_dist == 0:
-            factor = 0  # focused at infinity
             bpy.context.object.data.dof_distance = 10000  # not really infinity... but close enough.
         else:
-            factor = LF.focal_length / LF.sensor_size / LF.focus_dist
             bpy.context.object.data.dof_distance = LF.focus_dist
+        factor = get_shift_factor(LF.focal_length, LF.sensor_size, LF.focus_dist)
 
         camera.data.shift_x = -x_pos * factor
         camera.data.shift_y = -y_pos * factor
@@ -219,45 +252,13 @@ class OBJECT_OT_create_lightfield(bpy.types.Operator):
 
         return camera
 
-    def get_frustum_coordinates(self):
-        LF = bpy.context.scene.LF
-        max_res = max(LF.x_res, LF.y_res)
-
-        if LF.focus_dist == 0:
-            factor = LF.baseline_x_m * LF.focal_length * max_res
-            G_plus = factor / (LF.frustum_max_disp * LF.sensor_size)
-            G_minus = 10000  # factor / (LF.frustum_min_disp * LF.sensor_size)
-        else:
-            factor = LF.baseline_x_m * LF.focal_length * LF.focus_dist * max_res
-            G_plus = factor / (LF.baseline_x_m * LF.focal_length * max_res +
-                               LF.frustum_max_disp * LF.focus_dist * LF.sensor_size)
-            G_minus = factor / (LF.baseline_x_m * LF.focal_length * max_res +
-                                LF.frustum_min_disp * LF.focus_dist * LF.sensor_size)
-            if G_minus < 0:
-                G_minus = 10000
-
-        A = 2.0 * LF.focal_length / LF.sensor_size
-        ARx = LF.x_res / max_res
-        ARy = LF.y_res / max_res
-
-        vertices = [(-ARx * G_minus / A, -ARy * G_minus / A, -G_minus),
-                    ( ARx * G_minus / A, -ARy * G_minus / A, -G_minus),
-                    ( ARx * G_minus / A, ARy * G_minus / A, -G_minus),
-                    (-ARx * G_minus / A, ARy * G_minus / A, -G_minus),
-                    (-ARx * G_plus / A, -ARy * G_plus / A, -G_plus),
-                    ( ARx * G_plus / A, -ARy * G_plus / A, -G_plus),
-                    ( ARx * G_plus / A, ARy * G_plus / A, -G_plus),
-                    (-ARx * G_plus / A, ARy * G_plus / A, -G_plus)]
-
-        edges = [(0, 4), (1, 5), (2, 6), (3, 7)]
-        faces = [(0, 1, 2, 3), (4, 7, 6, 5)]
-        return vertices, edges, faces
-
     def create_frustum(self):
         LF = bpy.context.scene.LF
 
         # draw frustum
-        vertices, edges, faces = self.get_frustum_coordinates()
+        vertices, edges, faces = get_frustum_coordinates(LF.baseline_x_m, LF.focal_length, LF.focus_dist,
+                                                         LF.sensor_size, LF.x_res, LF.y_res,
+                                                         LF.frustum_min_disp, LF.frustum_max_disp)
         mesh_data = bpy.data.meshes.new("FrustumMeshData")
         mesh_data.from_pydata(vertices, edges, faces)
         mesh_data.update()
@@ -311,7 +312,8 @@ class OBJECT_OT_delete_lightfield(bpy.types.Operator):
             bpy.ops.object.select_all(action='DESELECT')
 
             # delete frustum, cameras and container
-            for camera in LF.get_lightfield_cameras():
+            for camera in LF.get_lightfield_cameras() + LF.get_virtual_rig_objects():
+                camera.hide_select = False
                 camera.select = True
 
             LF.get_frustum().hide = False
@@ -330,186 +332,827 @@ class OBJECT_OT_delete_lightfield(bpy.types.Operator):
         return {'FINISHED'}
 
 
+class OBJECT_OT_estimate_disparity_range(bpy.types.Operator):
+    """Estimate the disparity range of the scene from object bounds without rendering"""
+    bl_idname = "scene.estimate_disparity_range"
+    bl_label = """Estimate the disparity range"""
+    bl_options = {'REGISTER'}
+
+    # maximum number of points x cameras projected at once when using vertices
+    batch_size = 2 ** 22
+
+    def execute(self, context):
+        LF = bpy.context.scene.LF
+        scene = bpy.context.scene
+        start_time = time.time()
+
+        try:
+            lightfield = bpy.data.objects[LF.get_lightfield_name()]
+        except KeyError:
+            print("No camera grid with name: %s. Try adding a camera grid first." % LF.get_lightfield_name())
+            return {'CANCELLED'}
+
+        center_camera = LF.get_center_camera()
+        if center_camera is None:
+            return {'CANCELLED'}
+        clip_start = LF.get_render_camera(center_camera).data.clip_start
+        clip_end = LF.get_render_camera(center_camera).data.clip_end
+
+        # camera positions in light field coordinates, see create_cameras
+        cam_x, cam_y = get_camera_axes(LF.num_cams_x, LF.num_cams_y, LF.baseline_x_m, LF.baseline_y_m)
+        projection = (cam_x, cam_y, LF.focal_length, LF.sensor_size, LF.focus_dist, LF.x_res, LF.y_res)
+
+        # transformation from world to light field coordinates
+        world_to_lf = np.array(lightfield.matrix_world.inverted())
+
+        min_depth = np.inf
+        max_depth = -np.inf
+        for obj in scene.objects:
+            if obj.type not in ['MESH', 'CURVE', 'SURFACE', 'META', 'FONT'] or obj.name.startswith("LF"):
+                continue
+            if obj.hide_render or not obj.is_visible(scene):
+                continue
+
+            obj_to_lf = world_to_lf.dot(np.array(obj.matrix_world))
+
+            if LF.estimate_use_vertices:
+                depth_range = self.get_vertex_depth_range(obj, scene, obj_to_lf, projection, clip_start, clip_end)
+            else:
+                corners = transform_points(np.array([corner[:] for corner in obj.bound_box]), obj_to_lf)
+                depth_range = get_bounding_box_depth_range(corners, projection, clip_start, clip_end)
+
+            if depth_range is not None:
+                min_depth = min(min_depth, depth_range[0])
+                max_depth = max(max_depth, depth_range[1])
+
+        if not np.isfinite(min_depth):
+            print("Could not find any visible objects in the camera grid.")
+            return {'CANCELLED'}
+
+        disp_range = depth_to_disparity(np.array([max_depth, min_depth]), LF.baseline_x_m, LF.focal_length,
+                                        LF.focus_dist, LF.sensor_size, max(LF.x_res, LF.y_res))
+
+        # same rounding as for rendered disparity maps
+        LF.min_disp = np.floor(disp_range[0] * 10) / 10 - 0.1
+        LF.max_disp = np.ceil(disp_range[1] * 10) / 10 + 0.1
+        if LF.min_disp > disp_range[0] or LF.max_disp < disp_range[1]:
+            print("Estimated disparity range [%.2f, %.2f] exceeds the supported range." % tuple(disp_range))
+
+        # set frustum range with a single update of the light field
+        LF['frustum_min_disp'] = LF.min_disp
+        LF.frustum_max_disp = LF.max_disp
+
+        print("Estimated depth range [%.3f, %.3f] m, disparity range [%.2f, %.2f] px in %.1f ms." %
+              (min_depth, max_depth, disp_range[0], disp_range[1], (time.time() - start_time) * 1000))
+        return {'FINISHED'}
+
+    def get_vertex_depth_range(self, obj, scene, obj_to_lf, projection, clip_start, clip_end):
+        try:
+            mesh = obj.to_mesh(scene, True, 'RENDER')
+        except RuntimeError:
+            return None
+
+        try:
+            vertices = np.empty(len(mesh.vertices) * 3, dtype=np.float64)
+            mesh.vertices.foreach_get('co', vertices)
+            vertices = vertices.reshape((-1, 3))
+        finally:
+            bpy.data.meshes.remove(mesh)
+
+        # project vertices in batches to bound memory for large grids
+        cam_x, cam_y = projection[:2]
+        batch = max(1, self.batch_size // (len(cam_x) + len(cam_y)))
+
+        min_depth = np.inf
+        max_depth = -np.inf
+        for start in range(0, len(vertices), batch):
+            points = transform_points(vertices[start:start+batch], obj_to_lf)
+            depth = -points[:, 2]
+            visible = get_grid_visibility(points, *projection)
+            visible &= (depth >= clip_start) & (depth <= clip_end)
+            if np.any(visible):
+                min_depth = min(min_depth, np.amin(depth[visible]))
+                max_depth = max(max_depth, np.amax(depth[visible]))
+
+        if not np.isfinite(min_depth):
+            return None
+        return min_depth, max_depth
+
+
 class OBJECT_OT_render_lightfield(bpy.types.Operator):
     """render light field"""
     bl_idname = "scene.render_lightfield"
     bl_label = """Render Light Field"""
     bl_options = {'REGISTER'}
 
+    # stages of a frame, all frames are rendered stage by stage to switch the render engine only once
+    stages = ['input_views', 'ground_truth', 'view_synthesis']
+
     def execute(self, context):
+        if not self.check_view_selection(context.scene.LF) or not self.check_render_cost(context.scene.LF):
+            return {'CANCELLED'}
+        self.start()
+        try:
+            while self.step():
+                pass
+        finally:
+            self.steps.close()
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        if not self.check_view_selection(context.scene.LF) or not self.check_render_cost(context.scene.LF):
+            return {'CANCELLED'}
+
+        # render one view per timer event, so the user interface stays responsive
+        self.start()
+        self.timer = context.window_manager.event_timer_add(0.01, context.window)
+        context.window_manager.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            self.cancel(context)
+            return {'CANCELLED'}
+
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+
+        try:
+            running = self.step()
+        except:
+            self.cancel(context)
+            raise
+
+        for area in context.screen.areas:
+            if area.type == 'VIEW_3D':
+                area.tag_redraw()
+
+        if not running:
+            context.window_manager.event_timer_remove(self.timer)
+            self.timer = None
+            return {'FINISHED'}
+        return {'RUNNING_MODAL'}
+
+    def cancel(self, context):
+        if self.timer is None:
+            return
+
+        # closing the render steps restores the user's settings
+        self.steps.close()
+        context.window_manager.event_timer_remove(self.timer)
+        self.timer = None
         LF = bpy.context.scene.LF
+        LF.render_status = "Cancelled after %d of %d views" % (self.progress.get_done(), self.progress.get_total())
+        print(LF.render_status)
 
+    def check_view_selection(self, LF):
+        """
+        Reports invalid view lists before any stage is rendered, returns False if the rendering must not start
+        """
+        valid = True
+        for product in view_selection.VIEW_PRODUCTS:
+            if getattr(LF, '%s_views' % product) != 'LIST':
+                continue
+            try:
+                view_selection.parse_view_list(getattr(LF, '%s_view_list' % product), LF.num_cams_x * LF.num_cams_y)
+            except ValueError as e:
+                self.report({'ERROR'}, "Invalid %s view list: %s" % (product, e))
+                valid = False
+        if not valid:
+            LF.render_status = "Not started, a view list is invalid"
+        return valid
+
+    def check_render_cost(self, LF):
+        """
+        Reports memory or disk limits the rendering would exceed, returns False if it must not start
+        """
+        errors, warnings = check_render_cost(LF, get_render_cost(LF))
+        for warning in warnings:
+            self.report({'WARNING'}, "Rendering needs " + warning)
+        if not errors:
+            return True
+
+        for error in errors:
+            self.report({'WARNING'} if LF.ignore_cost_limits else {'ERROR'}, "Rendering needs " + error)
+        if LF.ignore_cost_limits:
+            return True
+        LF.render_status = "Not started, the rendering exceeds the memory or disk limits"
+        return False
+
+    @staticmethod
+    def get_frames(LF):
+        """
+        Returns a list of (frame, target directory) to render
+        """
         # legacy mode
         if LF.sequence_start == LF.sequence_end:
-            bpy.context.scene.frame_current = LF.sequence_start
-            self.renderFrame()
+            return [(LF.sequence_start, None)]
 
         # sequence mode
         # when more then one frame should be rendered we render each frame to a different folder
-        else:
-            frame_list = range(LF.sequence_start, LF.sequence_end+1, LF.sequence_steps)
-            for i in frame_list:
-                bpy.context.scene.frame_current = i
-                tgt_dir = os.path.join(bpy.path.abspath(LF.tgt_dir),"sequence","{:06d}".format(i))
-                self.renderFrame(tgt_dir)
+        frame_list = range(LF.sequence_start, LF.sequence_end+1, LF.sequence_steps)
+        return [(i, os.path.join(bpy.path.abspath(LF.tgt_dir), "sequence", "{:06d}".format(i))) for i in frame_list]
 
+    def get_rigs(self, LF):
+        """
+        Returns the active rig and all rigs to render
+        """
+        LF.store_rig_settings()
+        active_rig = bpy.data.objects[LF.get_lightfield_name()]
+        if LF.render_all_rigs:
+            return active_rig, LF.get_rigs()
+        return active_rig, [active_rig]
 
-        return {'FINISHED'}
+    def start(self):
+        LF = bpy.context.scene.LF
+        frames = self.get_frames(LF)
+
+        # count views per stage for progress and time estimates
+        active_rig, rigs = self.get_rigs(LF)
+        totals = {stage: 0 for stage in self.stages}
+        for rig in rigs:
+            LF.set_settings(rig['LF_settings'].to_dict())
+            totals['input_views'] += len(frames) * len(LF.get_rendered_input_cameras())
+            totals['ground_truth'] += len(frames) * (len(LF.get_selected_cameras('object_id', include_center=True)) +
+                                                     len(LF.get_depth_cameras()))
+            totals['view_synthesis'] += len(frames) * len(LF.get_synthesized_cameras())
+        LF.set_settings(active_rig['LF_settings'].to_dict())
+
+        self.progress = RenderProgress(self.stages, totals)
+        self.steps = self.iter_render(frames)
+        self.timer = None
+        LF.render_progress = 0
+        LF.render_status = "Rendering %d views, press ESC to cancel" % self.progress.get_total()
+
+    def step(self):
+        """
+        Renders the next view, returns False when the rendering is complete
+        """
+        LF = bpy.context.scene.LF
+        start_time = time.time()
+        try:
+            stage, rendered = next(self.steps)
+        except StopIteration:
+            LF.render_progress = 100
+            LF.render_status = "Done"
+            return False
+
+        if stage is None:
+            LF.render_status = "Waiting for frames leased by other workers"
+            return True
+
+        self.progress.update(stage, rendered, time.time() - start_time)
+        LF.render_progress = self.progress.get_percentage()
+        LF.render_status = self.progress.get_status(stage)
+        return True
+
+    def iter_render(self, frames):
+        """
+        Renders all frames and yields (stage, rendered) after each view, rendered is False for resumed views
+        """
+        # cycles seeds per frame and rig, chosen when rendering the input views
+        self.cycles_seeds = {}
 
-    def renderFrame(self, tgt_dir = None):
+        # tile sizes and thread counts per stage, found by probe renders
+        self.tuner = render_tuning.RenderTuner(bpy.context.scene) if bpy.context.scene.LF.auto_tune_render else None
+
+        with render_session.RenderSession(bpy.context.scene) as self.session:
+            if bpy.context.scene.LF.use_job_queue:
+                yield from self.iter_queued_frames(frames)
+            else:
+                for stage in self.stages:
+                    for i, tgt_dir in frames:
+                        bpy.context.scene.frame_current = i
+                        yield from self.renderFrame(tgt_dir, [stage])
+
+        print('Done!')
+
+    def iter_queued_frames(self, frames):
+        """
+        Renders all stages of the frames claimed from the job queue in the target directory, which is shared
+        by all workers rendering the same light field. Yields (stage, rendered) after each view and (None, False)
+        while waiting for frames of other workers in the modal operator.
+        """
+        LF = bpy.context.scene.LF
+        queue = job_queue.JobQueue(os.path.join(bpy.path.abspath(LF.tgt_dir), 'queue'), LF.job_lease_minutes * 60)
+        frame_tasks = {'frame_%06d' % i: (i, tgt_dir) for i, tgt_dir in frames}
+
+        with queue:
+            # the modal operator polls the queue from its timer instead of blocking the user interface
+            for task in queue.iter_tasks(sorted(frame_tasks), block=self.timer is None):
+                if task is None:
+                    yield None, False
+                    continue
+                i, tgt_dir = frame_tasks[task]
+                print("Worker %s rendering frame %d." % (queue.worker_id, i))
+                bpy.context.scene.frame_current = i
+                for stage, rendered in self.renderFrame(tgt_dir):
+                    queue.heartbeat()
+                    yield stage, rendered
+                queue.complete(task)
+
+    def renderFrame(self, tgt_dir = None, stages = None):
         """
-        Renders the currently selected frame to tgt_dir folder
+        Renders the given stages of the currently selected frame to tgt_dir folder, yields (stage, rendered) per view
         """
 
         scene_key = bpy.context.scene.name
         LF = bpy.context.scene.LF
+        session = self.session
 
         tgt_root_dir = bpy.path.abspath(LF.tgt_dir)
 
         if tgt_dir == None:
             tgt_dir = tgt_root_dir
 
+        if stages is None:
+            stages = self.stages
 
-        bpy.context.scene.use_nodes = True
-        bpy.data.scenes[scene_key].render.layers['RenderLayer'].use_pass_z = True
+        # render all rigs of the scene or only the active one, sharing the scene preparation
+        active_rig, rigs = self.get_rigs(LF)
 
-        # remove all nodes of previous file outputs
         try:
-            for node in bpy.context.scene.node_tree.nodes:
-                if node.name.startswith("LF"):
-                    bpy.context.scene.node_tree.nodes.remove(node)
-        except KeyError:
-            pass
+            # render input views with original resolution
+            if 'input_views' in stages:
+                session.configure()
+                for rig in rigs:
+                    rig_tgt_dir = self.apply_rig(LF, rig, tgt_dir)
+
+                    LF.cycles_seed = random.randint(0, 2147483646 - LF.num_cams_x * LF.num_cams_y - 1)
+                    self.cycles_seeds[(bpy.context.scene.frame_current, rig.name)] = LF.cycles_seed
+                    LF.store_rig_settings()
+                    self.tune_stage(LF, 'input_views')
+
+                    rgb_cameras = LF.get_rendered_input_cameras()
+                    for rendered in self.render_input_views(rgb_cameras, scene_key, LF, rig_tgt_dir):
+                        yield 'input_views', rendered
+                    if not LF.use_view_synthesis:
+                        self.export_input_views(LF, rig_tgt_dir)
+
+            # render high resolution ground truth with the internal renderer
+            if 'ground_truth' in stages:
+                for rig in rigs:
+                    rig_tgt_dir = self.apply_rig(LF, rig, tgt_dir)
+                    session.configure('BLENDER_RENDER', False, 100 * LF.depth_map_scale)
+                    LF.cycles_seed = self.cycles_seeds.get((bpy.context.scene.frame_current, rig.name),
+                                                           LF.cycles_seed)
+
+                    oid_cameras = LF.get_selected_cameras('object_id', include_center=True)
+                    depth_cameras = LF.get_depth_cameras()
+
+                    # the config file is written last, so its existence marks complete ground truth
+                    if LF.resume_rendering and os.path.isfile(os.path.join(rig_tgt_dir, 'parameters.cfg')):
+                        print("Skipping existing ground truth in: %s" % rig_tgt_dir)
+                        for camera in oid_cameras + depth_cameras:
+                            yield 'ground_truth', False
+                        continue
+
+                    self.tune_stage(LF, 'ground_truth')
+
+                    # render high resolution object id maps, the center view is always needed for the standard map
+                    for rendered in self.render_object_id_maps(oid_cameras, scene_key, LF, rig_tgt_dir):
+                        yield 'ground_truth', rendered
+
+                    # render high resolution depth maps for the union of depth and disparity views
+                    for rendered in self.render_depth_and_disp_maps(depth_cameras, scene_key, LF, rig_tgt_dir):
+                        yield 'ground_truth', rendered
+                    if LF.export_epis:
+                        self.export_epis(LF, rig_tgt_dir, 'disp')
+                    LF.store_rig_settings()
+
+                    # save parameters as config file in target directory of rendering
+                    tmp_config_path = LF.path_config_file
+                    LF.path_config_file = os.path.join(rig_tgt_dir, 'parameters.cfg')
+                    bpy.ops.scene.save_lightfield('EXEC_DEFAULT')
+                    LF.path_config_file = tmp_config_path
+
+            # synthesize input views between the rendered key views, which needs their depth maps
+            if 'view_synthesis' in stages:
+                session.configure()
+                for rig in rigs:
+                    rig_tgt_dir = self.apply_rig(LF, rig, tgt_dir)
+                    if not LF.use_view_synthesis:
+                        continue
+                    LF.cycles_seed = self.cycles_seeds.get((bpy.context.scene.frame_current, rig.name),
+                                                           LF.cycles_seed)
+
+                    synthesized_cameras = LF.get_synthesized_cameras()
+                    for rendered in self.synthesize_views(synthesized_cameras, scene_key, LF, rig_tgt_dir):
+                        yield 'view_synthesis', rendered
+                    self.export_input_views(LF, rig_tgt_dir)
+                    if self.get_light_field_layouts(LF):
+                        self.export_light_field_images(LF, rig_tgt_dir)
+        finally:
+            # restore the active rig
+            self.apply_rig(LF, active_rig, tgt_dir)
+
+    def export_input_views(self, LF, tgt_dir):
+        """
+        Exports EPIs and focal stack of the complete input views
+        """
+        if LF.export_epis:
+            self.export_epis(LF, tgt_dir, 'rgb')
+        if LF.export_focal_stack:
+            self.export_focal_stack(LF, tgt_dir)
 
-        lf_cameras = LF.get_lightfield_cameras()
-        LF.cycles_seed = random.randint(0, 2147483646 - len(lf_cameras) - 1)
+    def tune_stage(self, LF, stage):
+        """
+        Applies the fastest tile size and thread count of a stage, probe renders use the center view
+        """
+        if self.tuner is None:
+            return
 
-        # render input views with original resolution
-        self.render_input_views(lf_cameras, scene_key, LF, tgt_dir)
+        def activate_probe_view():
+            # no compositor output must be written by probe renders
+            self.session.use_nodes()
+            LF.activate_view(bpy.context.scene, LF.get_center_camera())
 
-        # store current render status
-        current_render_engine = bpy.context.scene.render.engine
-        current_antialiasing = bpy.context.scene.render.use_antialiasing
+        self.tuner.apply(stage, activate_probe_view)
 
-        # change settings for high resolution rendering
-        bpy.data.scenes[bpy.context.scene.name].render.resolution_percentage = 100 * LF.depth_map_scale
-        bpy.context.scene.render.engine = 'BLENDER_RENDER'
-        bpy.context.scene.render.use_antialiasing = False
+    def apply_rig(self, LF, rig, tgt_dir):
+        """
+        Activates the stored settings of a rig and returns its target directory
+        """
+        LF.set_settings(rig['LF_settings'].to_dict())
+        bpy.context.scene.render.resolution_x = LF.x_res
+        bpy.context.scene.render.resolution_y = LF.y_res
 
-        # render high resolution object id maps
-        if LF.save_object_id_maps_for_all_views:
-            oid_cameras = lf_cameras
-        else:
-            oid_cameras = [LF.get_center_camera()]
-        self.render_object_id_maps(oid_cameras, scene_key, LF, tgt_dir)
+        if not LF.render_all_rigs:
+            return tgt_dir
 
-        # render high resolution depth maps
-        if LF.save_depth_for_all_views:
-            depth_cameras = lf_cameras
+        rig_tgt_dir = LF.get_rig_directory(tgt_dir)
+        if not os.path.isdir(rig_tgt_dir):
+            os.makedirs(rig_tgt_dir)
+        return rig_tgt_dir
+
+    def get_view_fpaths(self, LF, tgt_dir, product):
+        """
+        Returns the file paths [i][j] of the rendered 'rgb' or 'disp' views of the grid
+        """
+        if product == 'rgb':
+            extension = 'pfm' if LF.use_direct_image_output and LF.image_output_format == 'PFM' else 'png'
+            file_pattern = 'input_%s.' + extension
         else:
-            depth_cameras = [LF.get_center_camera()]
-        self.render_depth_and_disp_maps(depth_cameras, scene_key, LF, tgt_dir)
+            file_pattern = 'gt_disp_lowres_%s.pfm'
 
-        # save parameters as config file in target directory of rendering
-        tmp_config_path = LF.path_config_file
-        LF.path_config_file = os.path.join(tgt_dir, 'parameters.cfg')
-        bpy.ops.scene.save_lightfield('EXEC_DEFAULT')
-        LF.path_config_file = tmp_config_path
+        return [[os.path.join(tgt_dir, file_pattern % self.get_raw_camera_name(LF.get_camera_name(i, j)))
+                 for j in range(LF.num_cams_x)] for i in range(LF.num_cams_y)]
 
-        # reset status
-        bpy.context.scene.render.engine = current_render_engine
-        bpy.context.scene.render.use_antialiasing = current_antialiasing
-        bpy.data.scenes[bpy.context.scene.name].render.resolution_percentage = 100
-        bpy.data.scenes[scene_key].render.filepath = tgt_root_dir
+    def export_epis(self, LF, tgt_dir, product):
+        """
+        Exports EPI stacks for all complete rows and columns of rendered 'rgb' or 'disp' views
+        """
+        view_fpaths = self.get_view_fpaths(LF, tgt_dir, product)
 
-        print('Done!')
+        epi_dir = os.path.join(tgt_dir, 'epi')
+        if not os.path.isdir(epi_dir):
+            os.makedirs(epi_dir)
 
-    def render_input_views(self, cameras, scene_key, LF, tgt_dir):
+        print("Exporting %s EPIs to: %s" % (product, epi_dir))
+        epi_export.export_epi_stacks(view_fpaths, LF.get_view_mask(product), epi_dir, product, load_view)
 
+    @staticmethod
+    def get_input_format(LF):
+        """
+        Returns the file format of the input views, 'PNG', 'PNG16' or 'PFM'
+        """
+        return LF.image_output_format if LF.use_direct_image_output else 'PNG'
 
-        # create image output node
-        image_out_node = bpy.data.scenes[scene_key].node_tree.nodes.new(type='CompositorNodeOutputFile')
-        image_out_node.format.file_format = 'PNG'
-        image_out_node.format.color_mode = 'RGB'
-        image_out_node.format.color_depth = '8'
-        image_out_node.name = 'LF_IMAGE_OUTPUT'
+    def get_view_writer(self, LF):
+        """
+        Returns a function writing top-down images (h, w, c) in the file format of the input views and its extension
+        """
+        file_format = self.get_input_format(LF)
+        if file_format == 'PFM':
+            def write_view(img, fpath):
+                write_pfm(np.flipud(img), fpath)
+            return write_view, 'pfm'
 
-        # connect nodes
-        right = bpy.data.scenes[scene_key].node_tree.nodes['Render Layers'].outputs['Image']
-        left = image_out_node.inputs['Image']
-        bpy.data.scenes[scene_key].node_tree.links.new(right, left)
+        bit_depth = 16 if file_format == 'PNG16' else 8
 
-        bpy.data.scenes[scene_key].render.filepath = os.path.join(bpy.path.abspath(LF.tgt_dir), "unused_blenderender_output")
+        def write_view(img, fpath):
+            write_png(np.round(np.clip(img, 0, 2 ** bit_depth - 1)), fpath, bit_depth=bit_depth)
+        return write_view, 'png'
+
+    def export_focal_stack(self, LF, tgt_dir):
+        """
+        Exports images of the rendered input views refocused to the focal stack disparities
+        """
+        disparities = refocus.parse_disparities(LF.focal_stack_disparities)
+        if not disparities:
+            print("No focal stack disparities given, skipping focal stack export.")
+            return
+
+        write_view, extension = self.get_view_writer(LF)
+
+        refocus_dir = os.path.join(tgt_dir, 'refocus')
+        if not os.path.isdir(refocus_dir):
+            os.makedirs(refocus_dir)
+
+        print("Exporting focal stack to: %s" % refocus_dir)
+        refocus.export_focal_stack(self.get_view_fpaths(LF, tgt_dir, 'rgb'), LF.get_view_mask('rgb'), disparities,
+                                   refocus_dir, load_view, write_view, extension, LF.focal_stack_threads)
+
+    def render_input_views(self, cameras, scene_key, LF, tgt_dir):
+        # light field images are assembled from the read back pixels
+        if LF.use_direct_image_output or self.get_light_field_layouts(LF):
+            yield from self.render_input_views_direct(cameras, scene_key, LF, tgt_dir)
+            return
+
+        # create image output node once per rendering
+        def setup_image_out_node(node, node_tree):
+            node.format.file_format = 'PNG'
+            node.format.color_mode = 'RGB'
+            node.format.color_depth = '8'
+            node_tree.links.new(self.session.get_render_layer_output('Image'), node.inputs[0])
+
+        image_out_node = self.session.get_node('LF_IMAGE_OUTPUT', 'CompositorNodeOutputFile', setup_image_out_node)
+        self.session.use_nodes('LF_IMAGE_OUTPUT')
 
         image_out_node.base_path = tgt_dir
 
         # render view per camera
-        c_image = 'Image'
-        for cam_idx, camera in enumerate(cameras):
+        for camera in cameras:
             print("Rendering scene with camera: " + camera.name)
+            cam_idx = LF.get_camera_index(camera.name)
             image_filename = 'input_' + self.get_raw_camera_name(camera.name)
-            image_out_node.file_slots[c_image].path = image_filename + '_frame###'
-            c_image = image_filename + '_frame###'
+            image_out_node.file_slots[0].path = image_filename + '_frame###'
+
+            if LF.resume_rendering and os.path.isfile(os.path.join(tgt_dir, image_filename + '.png')):
+                yield False
+                continue
 
             # set scene camera to current light field camera
-            bpy.data.scenes[scene_key].camera = camera
+            LF.activate_view(bpy.data.scenes[scene_key], camera)
 
             # change seed
             bpy.data.scenes[scene_key].cycles.seed = LF.cycles_seed + cam_idx
             print("Cycles seed for camera %d: %d" % (cam_idx, bpy.data.scenes[scene_key].cycles.seed))
 
-            # render scene and adjust the file name
-            bpy.ops.render.render(write_still=True)
+            # render scene, the file output node writes the view, and adjust the file name
+            bpy.ops.render.render(write_still=False)
             self.remove_blender_frame_from_file_name(image_filename, tgt_dir)
+            yield True
 
-        # remove the image output node
-        bpy.context.scene.node_tree.nodes.remove(image_out_node)
+    def use_image_viewer(self):
+        """
+        Activates the viewer node reading back the composited image, it is created once per rendering
+        """
+        def setup_image_view_node(node, node_tree):
+            node.use_alpha = False
+            node_tree.links.new(self.session.get_render_layer_output('Image'), node.inputs[0])
+
+        self.session.get_node('LF_IMAGE_VIEWER', 'CompositorNodeViewer', setup_image_view_node)
+        self.session.use_nodes('LF_IMAGE_VIEWER')
+
+    def render_input_views_direct(self, cameras, scene_key, LF, tgt_dir):
+        """
+        Renders the input views without file output node, the pixels are read back
+        and encoded in a thread pool while the next view is rendered. Light field images
+        are assembled in preallocated buffers and written after the last view.
+        """
+        scene = bpy.data.scenes[scene_key]
+        self.use_image_viewer()
+        transform = get_view_transform(scene)
+        file_format = self.get_input_format(LF)
+        write_view, extension = self.get_view_writer(LF)
+
+        # with view synthesis, the light field images are assembled after the synthesized views
+        layouts = self.get_light_field_layouts(LF) if not LF.use_view_synthesis else []
+        image_fpaths = self.get_light_field_image_fpaths(LF, tgt_dir, layouts)
+        save_views = self.needs_view_images(LF)
+        if layouts and LF.resume_rendering and all(os.path.isfile(fpath) for fpath in image_fpaths.values()):
+            print("Skipping existing light field images in: %s" % tgt_dir)
+            for camera in cameras:
+                yield False
+            return
+        images = {layout: self.create_light_field_image(LF, file_format) for layout in layouts}
+
+        def store_view(rgb, fpath, i, j):
+            view = encode_image(rgb, file_format, transform)
+            for layout, image in images.items():
+                insert_view(image, view, i, j, LF.num_cams_x, LF.num_cams_y, layout)
+            if save_views:
+                write_atomic(write_view, view, fpath)
+
+        writer = AsyncImageWriter(LF.image_output_threads)
+        try:
+            for camera in cameras:
+                print("Rendering scene with camera: " + camera.name)
+                cam_idx = LF.get_camera_index(camera.name)
+                image_filename = 'input_%s.%s' % (self.get_raw_camera_name(camera.name), extension)
+                image_fpath = os.path.join(tgt_dir, image_filename)
+                if LF.resume_rendering and os.path.isfile(image_fpath):
+                    for layout, image in images.items():
+                        insert_view(image, load_view(image_fpath), cam_idx // LF.num_cams_x,
+                                    cam_idx % LF.num_cams_x, LF.num_cams_x, LF.num_cams_y, layout)
+                    yield False
+                    continue
+
+                # set scene camera to current light field camera and change seed
+                LF.activate_view(scene, camera)
+                scene.cycles.seed = LF.cycles_seed + cam_idx
+                print("Cycles seed for camera %d: %d" % (cam_idx, scene.cycles.seed))
+
+                # render scene without writing a still, encoding happens in the background
+                bpy.ops.render.render(write_still=False)
+                rgb = get_viewer_pixels()[:, :, :3].copy()
+                if images:
+                    writer.submit(store_view, rgb, image_fpath, cam_idx // LF.num_cams_x, cam_idx % LF.num_cams_x)
+                else:
+                    writer.write(write_image, rgb, image_fpath, file_format, transform)
+                yield True
+        finally:
+            writer.close()
+
+        for layout, image in images.items():
+            print("Writing light field image: " + image_fpaths[layout])
+            write_atomic(write_view, image, image_fpaths[layout])
+
+    @staticmethod
+    def get_light_field_layouts(LF):
+        return {'NONE': [], 'MOSAIC': ['MOSAIC'], 'LENSLET': ['LENSLET'],
+                'BOTH': ['MOSAIC', 'LENSLET']}[LF.light_field_image]
+
+    def get_light_field_image_fpaths(self, LF, tgt_dir, layouts):
+        extension = self.get_view_writer(LF)[1]
+        return {layout: os.path.join(tgt_dir, 'lightfield_%s.%s' % (layout.lower(), extension)) for layout in layouts}
+
+    @staticmethod
+    def create_light_field_image(LF, file_format):
+        """
+        Returns a zero light field image (num_cams_y * y_res, num_cams_x * x_res, 3) of encoded views, see insert_view
+        """
+        dtype = {'PNG': np.uint8, 'PNG16': np.uint16, 'PFM': np.float32}[file_format]
+        return np.zeros((LF.num_cams_y * LF.y_res, LF.num_cams_x * LF.x_res, 3), dtype=dtype)
+
+    @staticmethod
+    def needs_view_images(LF):
+        """
+        Returns whether the individual input views are saved, which view synthesis and the exports read
+        """
+        return LF.save_view_images or LF.light_field_image == 'NONE' or LF.use_view_synthesis or \
+            LF.export_epis or LF.export_focal_stack
+
+    def export_light_field_images(self, LF, tgt_dir):
+        """
+        Assembles the light field images from the saved input views
+        """
+        layouts = self.get_light_field_layouts(LF)
+        images = {layout: self.create_light_field_image(LF, self.get_input_format(LF)) for layout in layouts}
+        view_fpaths = self.get_view_fpaths(LF, tgt_dir, 'rgb')
+        for i, j in zip(*np.nonzero(LF.get_view_mask('rgb'))):
+            view = load_view(view_fpaths[i][j])
+            for layout, image in images.items():
+                insert_view(image, view, i, j, LF.num_cams_x, LF.num_cams_y, layout)
+
+        write_view = self.get_view_writer(LF)[0]
+        for layout, fpath in self.get_light_field_image_fpaths(LF, tgt_dir, layouts).items():
+            print("Writing light field image: " + fpath)
+            write_atomic(write_view, images[layout], fpath)
+
+    def synthesize_views(self, cameras, scene_key, LF, tgt_dir):
+        """
+        Synthesizes input views from the surrounding key views and their low resolution depth maps. Pixels which
+        cannot be synthesized are rendered with border renders. A mask per view marks synthesized (0), filled (128)
+        and rendered (255) pixels, synthesis_report.json lists the fractions and error estimates per view.
+        """
+        scene = bpy.data.scenes[scene_key]
+        render = scene.render
+        write_view, extension = self.get_view_writer(LF)
+        file_format = self.get_input_format(LF)
+        transform = get_view_transform(scene)
+        key_mask = LF.get_view_mask('rgb') & LF.get_key_view_mask()
+        disp_args = (LF.focal_length, LF.focus_dist, LF.sensor_size, max(LF.x_res, LF.y_res))
+
+        report_fpath = os.path.join(tgt_dir, 'synthesis_report.json')
+        report = {}
+        if LF.resume_rendering and os.path.isfile(report_fpath):
+            with open(report_fpath) as f:
+                report = json.load(f)
+
+        # key views with their disparities per grid step, loaded once per rig
+        key_views = {}
+
+        def get_key_view(i, j):
+            if (i, j) not in key_views:
+                camera_name = self.get_raw_camera_name(LF.get_camera_name(i, j))
+                depth = np.flipud(read_pfm(os.path.join(tgt_dir, 'gt_depth_lowres_%s.pfm' % camera_name)))
+                disp_x = depth_to_disparity(depth, LF.baseline_x_m, *disp_args)
+                disp_y = depth_to_disparity(depth, LF.baseline_y_m, *disp_args)
+                view = load_view(os.path.join(tgt_dir, 'input_%s.%s' % (camera_name, extension)))
+                key_views[(i, j)] = (np.asarray(view, dtype=np.float32), depth, disp_y, disp_x)
+            return key_views[(i, j)]
+
+        self.use_image_viewer()
+        for camera in cameras:
+            camera_name = self.get_raw_camera_name(camera.name)
+            image_fpath = os.path.join(tgt_dir, 'input_%s.%s' % (camera_name, extension))
+            if LF.resume_rendering and os.path.isfile(image_fpath) and camera_name in report:
+                yield False
+                continue
+
+            print("Synthesizing view of camera: " + camera.name)
+            cam_idx = LF.get_camera_index(camera.name)
+            i, j = divmod(cam_idx, LF.num_cams_x)
+            sources = [get_key_view(ki, kj) + (i - ki, j - kj)
+                       for ki, kj in view_selection.get_surrounding_key_views(key_mask, i, j)]
+            view, holes, filled, error = view_synthesis.synthesize_view(sources)
+
+            # render the blocks around holes, border rectangles are bottom-up
+            height, width = np.shape(holes)
+            rects = get_refinement_rects(np.flipud(holes), LF.synthesis_block_size) if np.any(holes) else []
+            rendered = np.zeros((height, width), dtype=bool)
+            if rects:
+                LF.activate_view(scene, camera)
+                scene.cycles.seed = LF.cycles_seed + cam_idx
+                render.use_border = True
+                render.use_crop_to_border = True
+                try:
+                    for y0, x0, y1, x1 in rects:
+                        pixels = self.render_border(render, (y0, x0, y1, x1), height, width)
+                        if pixels is None:
+                            raise RuntimeError("Border render of camera %s failed." % camera.name)
+                        view[height - y1:height - y0, x0:x1] = encode_image(pixels[:, :, :3], file_format,
+                                                                            transform)
+                        rendered[height - y1:height - y0, x0:x1] = True
+                finally:
+                    render.use_border = False
+
+            mask = np.where(rendered, 255, np.where(filled, 128, 0))
+            write_png(mask, os.path.join(tgt_dir, 'synthesis_mask_%s.png' % camera_name))
+            write_view(view, image_fpath)
+
+            synthesized = ~rendered
+            report[camera_name] = {'key_views': len(sources),
+                                   'synthesized': float(np.mean(synthesized & ~filled)),
+                                   'filled': float(np.mean(filled & synthesized)),
+                                   'rendered': float(np.mean(rendered)),
+                                   'border_renders': len(rects),
+                                   'mean_error': float(np.mean(error[synthesized])) if np.any(synthesized) else 0.0,
+                                   'p99_error': float(np.percentile(error[synthesized], 99))
+                                   if np.any(synthesized) else 0.0}
+            with open(report_fpath, 'w') as f:
+                json.dump(report, f, indent=4, sort_keys=True)
+            yield True
 
     def render_object_id_maps(self, cameras, scene_key, LF, tgt_dir):
-        bpy.data.scenes[bpy.context.scene.name].render.layers["RenderLayer"].use_pass_object_index = True
-
-        # prepare nodes for object id map
-        oid_out_node = bpy.data.scenes[scene_key].node_tree.nodes.new(type='CompositorNodeOutputFile')
-        oid_out_node.format.file_format = 'PNG'
-        oid_out_node.format.color_depth = '16'
-        oid_out_node.format.color_mode = 'BW'
-        oid_out_node.name = 'LF_OID_OUTPUT'
-
-        oid_math_node = bpy.data.scenes[scene_key].node_tree.nodes.new(type='CompositorNodeMath')
-        oid_math_node.operation = 'DIVIDE'
-        oid_math_node.inputs[1].default_value = 2 ** 16 - 1
-        oid_math_node.name = 'LF_OID_MATH'
-
-        right = bpy.data.scenes[scene_key].node_tree.nodes['Render Layers'].outputs['IndexOB']
-        math_left = oid_math_node.inputs[0]
-        math_right = oid_math_node.outputs[0]
-        left = oid_out_node.inputs['Image']
-
-        bpy.data.scenes[scene_key].node_tree.links.new(right, math_left)
-        bpy.data.scenes[scene_key].node_tree.links.new(math_right, left)
+        # prepare nodes for object id map once per rendering
+        def setup_oid_math_node(node, node_tree):
+            node.operation = 'DIVIDE'
+            node.inputs[1].default_value = 2 ** 16 - 1
+            node_tree.links.new(self.session.get_render_layer_output('IndexOB'), node.inputs[0])
+
+        def setup_oid_out_node(node, node_tree):
+            node.format.file_format = 'PNG'
+            node.format.color_depth = '16'
+            node.format.color_mode = 'BW'
+            node_tree.links.new(oid_math_node.outputs[0], node.inputs[0])
+
+        # viewer node to read back the raw object ids for the low resolution maps
+        def setup_oid_view_node(node, node_tree):
+            node.use_alpha = False
+            node_tree.links.new(self.session.get_render_layer_output('IndexOB'), node.inputs[0])
+
+        oid_math_node = self.session.get_node('LF_OID_MATH', 'CompositorNodeMath', setup_oid_math_node)
+        oid_out_node = self.session.get_node('LF_OID_OUTPUT', 'CompositorNodeOutputFile', setup_oid_out_node)
+        self.session.get_node('LF_OID_VIEWER', 'CompositorNodeViewer', setup_oid_view_node)
+        self.session.use_nodes('LF_OID_MATH', 'LF_OID_OUTPUT', 'LF_OID_VIEWER')
+
         oid_out_node.base_path = tgt_dir
-        out_oid = oid_out_node.file_slots['Image']
+        out_oid = oid_out_node.file_slots[0]
 
-        # assign an object id to all scene objects
-        idx = 1
-        for obj in bpy.data.objects:
-            if obj.type not in ['CAMERA', 'LAMP', 'EMPTY'] and not obj.name.startswith("LF"):
-                obj.pass_index = idx
-                idx += 1
+        # save lookup table for the object ids of the scene
+        object_ids = self.get_object_ids(bpy.data.scenes[scene_key])
+        with open(os.path.join(tgt_dir, 'objectids.json'), 'w') as f:
+            json.dump({str(idx): obj.name for idx, obj in object_ids.items()}, f, indent=4, sort_keys=True)
 
         # save object id map for each camera
         for camera in cameras:
             print("Rendering object id map with camera: " + camera.name)
-            oid_filename = 'objectids_highres_' + self.get_raw_camera_name(camera.name)
+            camera_name = self.get_raw_camera_name(camera.name)
+            oid_filename = 'objectids_highres_' + camera_name
             out_oid.path = oid_filename + "_frame###"
 
             # set scene camera to current light field camera
-            bpy.data.scenes[scene_key].camera = camera
+            LF.activate_view(bpy.data.scenes[scene_key], camera)
 
-            # render scene and adjust the file name
-            bpy.ops.render.render(write_still=True)
+            # render scene, the file output node writes the view, and adjust the file name
+            bpy.ops.render.render(write_still=False)
             self.remove_blender_frame_from_file_name(oid_filename, tgt_dir)
 
+            # create object id map with original (low) resolution by majority vote, viewer images are stored bottom-up
+            object_ids_highres = get_viewer_pixels()[:, :, 0]
+            object_ids_lowres = np.flipud(mode_downsampling(np.round(object_ids_highres).astype(np.uint16),
+                                                            LF.depth_map_scale, LF.depth_map_scale))
+
+            if camera.name == LF.get_center_camera().name:
+                write_png(object_ids_lowres, os.path.join(tgt_dir, 'objectids_lowres.png'), bit_depth=16)
+            if LF.is_view_selected(camera, 'object_id'):
+                write_png(object_ids_lowres, os.path.join(tgt_dir, 'objectids_lowres_%s.png' % camera_name), bit_depth=16)
+
+            yield True
+
         # handle additional "standard" center view object id map
         center_camera = LF.get_center_camera()
         src = os.path.join(tgt_dir, 'objectids_highres_%s.png' % self.get_raw_camera_name(center_camera.name))
@@ -522,101 +1165,299 @@ class OBJECT_OT_render_lightfield(bpy.types.Operator):
         except:
             pass
 
-        if LF.save_object_id_maps_for_all_views:
+        if LF.is_view_selected(center_camera, 'object_id'):
             shutil.copy(src, tgt)
         else:
             os.rename(src, tgt)
 
-        # remove the oid output node
-        bpy.context.scene.node_tree.nodes.remove(oid_out_node)
+    def get_object_ids(self, scene):
+        """
+        Assigns an object id to all objects of the scene and returns a dict of object id -> object.
+        Ids are assigned by object name once and cached for all frames of one rendering.
+        """
+        try:
+            return self.object_ids
+        except AttributeError:
+            pass
 
-    def render_depth_and_disp_maps(self, cameras, scene_key, LF, tgt_dir):
-        max_res = max(LF.x_res, LF.y_res)
-        factor = LF.baseline_x_m * LF.focal_length * LF.focus_dist * max_res
+        objects = [obj for obj in scene.objects
+                   if obj.type not in ['CAMERA', 'LAMP', 'EMPTY'] and not obj.name.startswith("LF")]
+        objects.sort(key=lambda obj: obj.name)
+        self.object_ids = {idx: obj for idx, obj in enumerate(objects, 1)}
+        for idx, obj in self.object_ids.items():
+            obj.pass_index = idx
+
+        return self.object_ids
 
-        # prepare depth output node. blender changed their naming convection for render layers in 2.79... so Z became Depth and everthing else got complicated ;)
-        if 'Z' in bpy.data.scenes[scene_key].node_tree.nodes['Render Layers'].outputs:
-            right = bpy.data.scenes[scene_key].node_tree.nodes['Render Layers'].outputs['Z']
+    def render_depth_and_disp_maps(self, cameras, scene_key, LF, tgt_dir):
+        disp_args = (LF.baseline_x_m, LF.focal_length, LF.focus_dist, LF.sensor_size, max(LF.x_res, LF.y_res))
+
+        # prepare depth output node once per rendering. blender changed their naming convection for render layers in 2.79... so Z became Depth and everthing else got complicated ;)
+        def setup_depth_view_node(node, node_tree):
+            node.use_alpha = False
+            node_tree.links.new(self.session.get_render_layer_output('Z', 'Depth'), node.inputs[0])
+
+        self.session.get_node('LF_DEPTH_VIEWER', 'CompositorNodeViewer', setup_depth_view_node)
+        self.session.use_nodes('LF_DEPTH_VIEWER')
+
+        # adaptive rendering reads depth and object ids of native resolution renders from a single viewer
+        if LF.adaptive_depth:
+            def setup_adaptive_combine_node(node, node_tree):
+                node_tree.links.new(self.session.get_render_layer_output('Z', 'Depth'), node.inputs['R'])
+                node_tree.links.new(self.session.get_render_layer_output('IndexOB'), node.inputs['G'])
+
+            def setup_adaptive_view_node(node, node_tree):
+                node.use_alpha = False
+                node_tree.links.new(self.session.nodes['LF_ADAPTIVE_COMBINE'].outputs[0], node.inputs[0])
+
+            self.session.get_node('LF_ADAPTIVE_COMBINE', 'CompositorNodeCombRGBA', setup_adaptive_combine_node)
+            self.session.get_node('LF_ADAPTIVE_VIEWER', 'CompositorNodeViewer', setup_adaptive_view_node)
+
+        # disparity may be computed by the compositor next to the depth, both are read from one viewer
+        use_compositor_disparity = LF.compositor_disparity and not LF.adaptive_depth
+        if use_compositor_disparity:
+            self.use_disparity_nodes(disp_args)
+
+        # post-processing of a depth map either runs synchronously or in a worker pool
+        # while the next view renders, with a bounded number of depth maps in flight
+        if LF.depth_postprocess_threads > 0:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=LF.depth_postprocess_threads)
         else:
-            right = bpy.data.scenes[scene_key].node_tree.nodes['Render Layers'].outputs['Depth']
-            
-        depth_view_node = bpy.data.scenes[scene_key].node_tree.nodes.new('CompositorNodeViewer')
-        depth_view_node.use_alpha = False
-        left = depth_view_node.inputs[0]
-        bpy.data.scenes[scene_key].node_tree.links.new(right, left)
+            executor = None
+        max_in_flight = LF.depth_postprocess_threads + 1
+        cache = get_depth_cache(LF)
+        in_flight = collections.deque()
+        disp_ranges = []
 
-        for camera in cameras:
-            print("Rendering depth map with camera: " + camera.name)
+        try:
+            for camera in cameras:
+                # the center depth map may be shared with a rendering of identical center camera
+                depth = None
+                disp = None
+                refinement = None
+                if camera.name == LF.get_center_camera().name:
+                    depth = self.load_shared_depth(LF, tgt_dir)
+                if depth is None and cache is not None and not LF.adaptive_depth:
+                    cached_depth = cache.get(get_depth_cache_key(LF, bpy.data.scenes[scene_key], camera))
+                    if cached_depth is not None:
+                        print("Using cached depth map of camera: " + camera.name)
+                        depth = np.array(cached_depth)
+
+                if depth is None:
+                    print("Rendering depth map with camera: " + camera.name)
+
+                    # set scene camera to current light field camera
+                    LF.activate_view(bpy.data.scenes[scene_key], camera)
+
+                    if LF.adaptive_depth:
+                        refinement = self.render_adaptive_depth(LF, bpy.data.scenes[scene_key])
+
+                    # render scene and extract depth map to numpy array
+                    if refinement is None:
+                        bpy.ops.render.render(write_still=False)
+                        pixels = get_viewer_pixels()
+                        depth = pixels[:, :, 0].copy()
+                        if use_compositor_disparity:
+                            disp = pixels[:, :, 1].copy()
+                        del pixels
+                        if cache is not None:
+                            cache.put(get_depth_cache_key(LF, bpy.data.scenes[scene_key], camera), depth)
+
+                # save disparity files
+                fpaths = get_depth_fpaths(LF, camera, tgt_dir)
+
+                if refinement is None:
+                    postprocess = postprocess_depth_map
+                    args = (depth, LF.depth_map_scale, disp_args, fpaths, LF.depth_edge_threshold, disp,
+                            get_camera_args(LF, camera), ARTEFACT_RANGE)
+                else:
+                    # high resolution maps only exist for the refined rectangles
+                    fpaths['depth_highres_sparse'] = [fpath.replace('gt_depth_highres', 'gt_depth_highres_sparse')
+                                                      .replace('.pfm', '.npz') for fpath in fpaths.pop('depth_highres', [])]
+                    fpaths.pop('disp_highres', None)
+                    fpaths.pop('normals_highres', None)
+                    postprocess = postprocess_adaptive_depth_map
+                    args = refinement + (LF.depth_map_scale, disp_args, fpaths, LF.depth_edge_threshold,
+                                         get_camera_args(LF, camera), ARTEFACT_RANGE)
+
+                if executor is None:
+                    disp_ranges.append(postprocess(*args))
+                else:
+                    while len(in_flight) >= max_in_flight:
+                        disp_ranges.append(in_flight.popleft().result())
+                    in_flight.append(executor.submit(postprocess, *args))
+                yield True
+
+            while in_flight:
+                disp_ranges.append(in_flight.popleft().result())
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        if LF.save_derived_ground_truth:
+            save_visibility_masks(LF, tgt_dir)
+
+        # set disparity range of all rendered views for config file
+        if disp_ranges:
+            LF.min_disp = np.floor(min(disp_range[0] for disp_range in disp_ranges) * 10) / 10 - 0.1
+            LF.max_disp = np.ceil(max(disp_range[1] for disp_range in disp_ranges) * 10) / 10 + 0.1
+
+    def use_disparity_nodes(self, disp_args):
+        """
+        Activates compositor nodes computing the disparity from the depth pass, see depth_to_disparity.
+        The viewer holds depth in the red and disparity in the green channel.
+        """
+        baseline, focal_length, focus_dist, sensor_size, max_res = disp_args
+        factor = baseline * focal_length * max_res / sensor_size
+        inv_focus = 1.0 / focus_dist if focus_dist > 0 else 0.0
 
-            # set scene camera to current light field camera
-            bpy.data.scenes[scene_key].camera = camera
+        def setup_disp_divide_node(node, node_tree):
+            node.operation = 'DIVIDE'
+            node_tree.links.new(self.session.get_render_layer_output('Z', 'Depth'), node.inputs[1])
 
-            # render scene and extract depth map to numpy array
-            bpy.ops.render.render(write_still=True)
-            pixels = bpy.data.images['Viewer Node'].pixels  # size is width * height * 4 (rgba)
-            depth = np.array(pixels)[::4]
+        def setup_disp_subtract_node(node, node_tree):
+            node.operation = 'SUBTRACT'
+            node_tree.links.new(disp_divide_node.outputs[0], node.inputs[0])
 
-            # reshape high resolution depth map
-            depth = depth.reshape((int(LF.y_res * LF.depth_map_scale), int(LF.x_res * LF.depth_map_scale)))
+        def setup_disp_combine_node(node, node_tree):
+            node_tree.links.new(self.session.get_render_layer_output('Z', 'Depth'), node.inputs['R'])
+            node_tree.links.new(disp_subtract_node.outputs[0], node.inputs['G'])
 
-            # create depth map with original (low) resolution
-            depth_small = median_downsampling(depth, LF.depth_map_scale, LF.depth_map_scale)
+        def setup_disp_view_node(node, node_tree):
+            node.use_alpha = False
+            node_tree.links.new(disp_combine_node.outputs[0], node.inputs[0])
 
-            # check if high resolution depth map has depth artifacts on individual pixels
-            min_depth = np.min(depth_small)
-            max_depth = np.max(depth_small)
-            m_out_of_range = (depth < 0.9*min_depth) + (depth > 1.1*max_depth)
+        disp_divide_node = self.session.get_node('LF_DISP_DIVIDE', 'CompositorNodeMath', setup_disp_divide_node)
+        disp_subtract_node = self.session.get_node('LF_DISP_SUBTRACT', 'CompositorNodeMath', setup_disp_subtract_node)
+        disp_combine_node = self.session.get_node('LF_DISP_COMBINE', 'CompositorNodeCombRGBA', setup_disp_combine_node)
+        self.session.get_node('LF_DISP_VIEWER', 'CompositorNodeViewer', setup_disp_view_node)
 
-            if np.sum(m_out_of_range) > 0:
-                depth = self.fix_pixel_artefacts(depth, m_out_of_range)
-                depth_small = median_downsampling(depth, LF.depth_map_scale, LF.depth_map_scale)
+        # the constants depend on the settings of the rig, disparity = factor / depth - factor / focus_dist
+        disp_divide_node.inputs[0].default_value = factor
+        disp_subtract_node.inputs[1].default_value = factor * inv_focus
+        self.session.use_nodes('LF_DISP_DIVIDE', 'LF_DISP_SUBTRACT', 'LF_DISP_COMBINE', 'LF_DISP_VIEWER')
 
-            # create disparity maps
-            disp = (factor / depth - LF.baseline_x_m * LF.focal_length * max_res) / LF.focus_dist / LF.sensor_size
-            disp_small = median_downsampling(disp, LF.depth_map_scale, LF.depth_map_scale)
+    def render_adaptive_depth(self, LF, scene):
+        """
+        Renders depth and object ids at native resolution and the depth of rectangles around discontinuities at
+        high resolution with border renders. Returns (depth, rects, rect_depths) for postprocess_adaptive_depth_map,
+        or None if a border render does not match its rectangle.
+        """
+        render = scene.render
+        scale = get_integer_scale(LF.depth_map_scale)
+
+        self.session.use_nodes('LF_ADAPTIVE_COMBINE', 'LF_ADAPTIVE_VIEWER')
+        render.use_border = False
+        render.resolution_percentage = 100
+        bpy.ops.render.render(write_still=False)
+        pixels = get_viewer_pixels()
+        depth = pixels[:, :, 0].copy()
+        mask = get_refinement_mask(depth, np.round(pixels[:, :, 1]), LF.depth_edge_threshold)
+        rects = get_refinement_rects(mask, LF.adaptive_depth_block_size)
+
+        self.session.use_nodes('LF_DEPTH_VIEWER')
+        render.resolution_percentage = 100 * scale
+        render.use_border = True
+        render.use_crop_to_border = True
+        height, width = np.shape(depth)
+        rect_depths = []
 
-            # set disparity range for config file
-            LF.min_disp = np.floor(np.amin(disp_small) * 10) / 10 - 0.1
-            LF.max_disp = np.ceil(np.amax(disp_small) * 10) / 10 + 0.1
+        try:
+            for y0, x0, y1, x1 in rects:
+                pixels = self.render_border(render, (y0, x0, y1, x1), height, width, scale)
+                if pixels is None:
+                    print("Border render of %s failed, rendering the full view." % str((y0, x0, y1, x1)))
+                    return None
+                rect_depth = pixels[:, :, 0].copy()
+                rect_depths.append(rect_depth)
+        finally:
+            render.use_border = False
+
+        refined = sum((y1 - y0) * (x1 - x0) for y0, x0, y1, x1 in rects)
+        print("Refined %.1f%% of the pixels with %d border renders." % (100.0 * refined / depth.size, len(rects)))
+        return depth, rects, rect_depths
 
-            # save disparity files
-            if camera.name == LF.get_center_camera().name:
-                write_pfm(depth, os.path.join(tgt_dir, 'gt_depth_highres.pfm'))
-                write_pfm(disp, os.path.join(tgt_dir, 'gt_disp_highres.pfm'))
-                write_pfm(depth_small, os.path.join(tgt_dir, 'gt_depth_lowres.pfm'))
-                write_pfm(disp_small, os.path.join(tgt_dir, 'gt_disp_lowres.pfm'))
-
-            if LF.save_depth_for_all_views:
-                camera_name = self.get_raw_camera_name(camera.name)
-                write_pfm(depth, os.path.join(tgt_dir, 'gt_depth_highres_%s.pfm' % camera_name))
-                write_pfm(disp, os.path.join(tgt_dir, 'gt_disp_highres_%s.pfm' % camera_name))
-                write_pfm(depth_small, os.path.join(tgt_dir, 'gt_depth_lowres_%s.pfm' % camera_name))
-                write_pfm(disp_small, os.path.join(tgt_dir, 'gt_disp_lowres_%s.pfm' % camera_name))
-
-    def fix_pixel_artefacts(self, disp, m_out_of_range, half_window=1):
-        print("Fixing %d out of range pixel(s), values: %s" % (np.sum(m_out_of_range), list(disp[m_out_of_range])))
-        coords = np.where(m_out_of_range)
-        h, w = np.shape(disp)
-
-        for x, y in zip(coords[1], coords[0]):
-            xmin = max(0, x - half_window)
-            xmax = min(w - 1, x + half_window)
-            ymin = max(0, y - half_window)
-            ymax = min(h - 1, y + half_window)
-
-            window_values = disp[ymin:ymax + 1, xmin:xmax + 1]
-            valid_window_values = window_values[~m_out_of_range[ymin:ymax + 1, xmin:xmax + 1]]
-            n_values = np.size(valid_window_values)
-
-            if n_values == 0:
-                print("Could not find any pixels for inpainting depth artifact at (%d, %d)." % (y, x))
-                continue
+    @staticmethod
+    def render_border(render, rect, height, width, scale=1):
+        """
+        Renders the rectangle (y0, x0, y1, x1) of a (height, width) image with bottom-up rows at the given scale and
+        returns its viewer pixels, or None if they do not match the rectangle. Border rendering must be enabled.
+        """
+        y0, x0, y1, x1 = rect
+
+        # border coordinates are a quarter pixel inside the pixel edges, which is robust to rounding.
+        # both the viewer rows and the border y coordinates are bottom-up
+        render.border_min_x = min(1.0, (x0 * scale + 0.25) / (width * scale))
+        render.border_max_x = min(1.0, (x1 * scale + 0.25) / (width * scale))
+        render.border_min_y = min(1.0, (y0 * scale + 0.25) / (height * scale))
+        render.border_max_y = min(1.0, (y1 * scale + 0.25) / (height * scale))
+        bpy.ops.render.render(write_still=False)
+
+        pixels = get_viewer_pixels()
+        if np.shape(pixels)[:2] != ((y1 - y0) * scale, (x1 - x0) * scale):
+            print("Border render of %s has size %s." % (str(rect), str(np.shape(pixels)[:2])))
+            return None
+        return pixels
 
-            # compute median (without averaging for even n)
-            median = np.sort(valid_window_values)[n_values / 2]
-            disp[y, x] = median
+    @staticmethod
+    def has_same_center_camera(LF, config_fpath):
+        """
+        Returns whether the config file of another rendering has the pose, lens shift and intrinsics of the
+        center camera of the current settings
+        """
+        parser = configparser.ConfigParser(delimiters="=")
+        if not parser.read(config_fpath):
+            return False
 
-        return disp
+        try:
+            baseline = float(parser.get('extrinsics', 'baseline_mm')) / 1000.0
+            focal_length = float(parser.get('intrinsics', 'focal_length_mm'))
+            sensor_size = float(parser.get('intrinsics', 'sensor_size_mm'))
+            other = get_center_pose(int(parser.get('extrinsics', 'num_cams_x')),
+                                    int(parser.get('extrinsics', 'num_cams_y')), baseline, baseline,
+                                    focal_length, sensor_size, float(parser.get('extrinsics', 'focus_distance_m')))
+            other += (focal_length, sensor_size) + tuple(float(parser.get('extrinsics', key)) for key in
+                                                         ['center_cam_x_m', 'center_cam_y_m', 'center_cam_z_m',
+                                                          'center_cam_rx_rad', 'center_cam_ry_rad',
+                                                          'center_cam_rz_rad'])
+        except (configparser.Error, ValueError):
+            return False
+
+        lightfield = bpy.data.objects.get(LF.get_lightfield_name())
+        if lightfield is None:
+            return False
+        current = get_center_pose(LF.num_cams_x, LF.num_cams_y, LF.baseline_x_m, LF.baseline_y_m,
+                                  LF.focal_length, LF.sensor_size, LF.focus_dist)
+        current += (LF.focal_length, LF.sensor_size) + tuple(lightfield.location) + tuple(lightfield.rotation_euler)
+        return np.allclose(current, other, rtol=0, atol=1e-5)
+
+    @staticmethod
+    def load_shared_depth(LF, tgt_dir):
+        """
+        Loads the high-res center depth map from the same frame and rig of LF.depth_source_dir, if any
+        """
+        if not LF.depth_source_dir:
+            return None
+
+        rel_dir = os.path.relpath(tgt_dir, bpy.path.abspath(LF.tgt_dir))
+        fpath = os.path.normpath(os.path.join(bpy.path.abspath(LF.depth_source_dir), rel_dir, 'gt_depth_highres.pfm'))
+        if not os.path.isfile(fpath):
+            print("No shared depth map at %s, rendering it." % fpath)
+            return None
+
+        if not OBJECT_OT_render_lightfield.has_same_center_camera(LF, os.path.join(os.path.dirname(fpath),
+                                                                                 'parameters.cfg')):
+            print("Shared depth map %s has a different center camera, rendering it." % fpath)
+            return None
+
+        depth = read_pfm(fpath)
+        scale = LF.depth_map_scale
+        if depth.shape != (LF.y_res * scale, LF.x_res * scale):
+            print("Shared depth map %s has a different resolution, rendering it." % fpath)
+            return None
+
+        print("Using shared depth map: " + fpath)
+        return np.array(depth, dtype=np.float32)
 
     @staticmethod
     def get_raw_camera_name(camera_name):
@@ -639,38 +1480,427 @@ class OBJECT_OT_render_lightfield(bpy.types.Operator):
         os.rename(blender_filename, final_filename)
 
 
-def write_pfm(data, fpath):
-    with open(fpath, 'wb') as file:
-        # header
-        height, width = np.shape(data)
-        file.write('Pf\n'.encode('utf-8'))
-        file.write(('%d %d\n' % (width, height)).encode('utf-8'))
-        file.write(('%d\n' % -1).encode('utf-8'))
+class OBJECT_OT_estimate_render_cost(bpy.types.Operator):
+    """Estimate render time, memory and disk space of the rendering with a probe render of the center view"""
+    bl_idname = "scene.estimate_render_cost"
+    bl_label = """Estimate render cost"""
+    bl_options = {'REGISTER'}
+
+    def execute(self, context):
+        scene = context.scene
+        LF = scene.LF
+        center_camera = LF.get_center_camera()
+        if center_camera is None:
+            return {'CANCELLED'}
+
+        # time one view per stage, the first render includes the scene synchronization and keeps the estimate safe
+        view_times = {}
+        with render_session.RenderSession(scene) as session:
+            session.use_nodes()
+            scene.render.resolution_x = LF.x_res
+            scene.render.resolution_y = LF.y_res
+            for stage, settings in [('input_views', ()),
+                                    ('ground_truth', ('BLENDER_RENDER', False, 100 * LF.depth_map_scale))]:
+                session.configure(*settings)
+                LF.activate_view(scene, center_camera)
+                start_time = time.time()
+                bpy.ops.render.render(write_still=False)
+                view_times[stage] = time.time() - start_time
+                print("Probe render of stage %s: %.2fs" % (stage, view_times[stage]))
+
+        cost = get_render_cost(LF, view_times)
+        errors, warnings = check_render_cost(LF, cost)
+        lines = format_render_cost(cost) + ["Exceeds limits: " + error for error in errors] + \
+            ["Close to limits: " + warning for warning in warnings]
+        LF.render_cost_estimate = "\n".join(lines)
+        print("\n".join(lines))
+        return {'FINISHED'}
+
 
-        # data
-        values = np.ndarray.flatten(np.asarray(data, dtype=np.float32))
-        file.write(values)
+class OBJECT_OT_recompute_ground_truth(bpy.types.Operator):
+    """Recompute disparity and low resolution ground truth from cached depth maps without rendering"""
+    bl_idname = "scene.recompute_ground_truth"
+    bl_label = """Recompute ground truth"""
+    bl_options = {'REGISTER'}
 
+    def execute(self, context):
+        scene = bpy.context.scene
+        LF = scene.LF
+        cache = get_depth_cache(LF)
+        if cache is None:
+            self.report({'ERROR'}, "No depth cache directory set.")
+            return {'CANCELLED'}
+
+        start_time = time.time()
+        user_frame = scene.frame_current
+        LF.store_rig_settings()
+        active_rig = bpy.data.objects[LF.get_lightfield_name()]
+        rigs = LF.get_rigs() if LF.render_all_rigs else [active_rig]
+
+        def iter_views():
+            """
+            Yields (target directory, cameras) per frame and rig with the frame and rig settings applied
+            """
+            for frame, tgt_dir in OBJECT_OT_render_lightfield.get_frames(LF):
+                scene.frame_set(frame)
+                for rig in rigs:
+                    LF.set_settings(rig['LF_settings'].to_dict())
+                    rig_tgt_dir = bpy.path.abspath(LF.tgt_dir) if tgt_dir is None else tgt_dir
+                    if LF.render_all_rigs:
+                        rig_tgt_dir = LF.get_rig_directory(rig_tgt_dir)
+                    yield rig_tgt_dir, LF.get_depth_cameras()
 
-def median_downsampling(img, tile_height, tile_width):
-    h, w = np.shape(img)
-    if w % tile_width or h % tile_height:
-        raise Exception("Image dimensions must be multiple of tile dimensions.")
+        try:
+            # check all depth maps before writing anything
+            missing = 0
+            for tgt_dir, cameras in iter_views():
+                for camera in cameras:
+                    if cache.get(get_depth_cache_key(LF, scene, camera)) is None:
+                        print("No cached depth map of camera %s for: %s" % (camera.name, tgt_dir))
+                        missing += 1
+            if missing:
+                self.report({'ERROR'}, "%d depth maps are not cached, render the light field instead." % missing)
+                return {'CANCELLED'}
+
+            num_views = 0
+            for tgt_dir, cameras in iter_views():
+                if not os.path.isdir(tgt_dir):
+                    os.makedirs(tgt_dir)
+
+                disp_args = (LF.baseline_x_m, LF.focal_length, LF.focus_dist, LF.sensor_size, max(LF.x_res, LF.y_res))
+                disp_ranges = []
+                for camera in cameras:
+                    depth = np.array(cache.get(get_depth_cache_key(LF, scene, camera)))
+                    disp_ranges.append(postprocess_depth_map(depth, LF.depth_map_scale, disp_args,
+                                                             get_depth_fpaths(LF, camera, tgt_dir),
+                                                             LF.depth_edge_threshold,
+                                                             camera_args=get_camera_args(LF, camera)))
+                    num_views += 1
+                if LF.save_derived_ground_truth:
+                    save_visibility_masks(LF, tgt_dir)
+
+                # same rounding as for rendered disparity maps
+                LF.min_disp = np.floor(min(disp_range[0] for disp_range in disp_ranges) * 10) / 10 - 0.1
+                LF.max_disp = np.ceil(max(disp_range[1] for disp_range in disp_ranges) * 10) / 10 + 0.1
+                LF.store_rig_settings()
+
+                tmp_config_path = LF.path_config_file
+                LF.path_config_file = os.path.join(tgt_dir, 'parameters.cfg')
+                bpy.ops.scene.save_lightfield('EXEC_DEFAULT')
+                LF.path_config_file = tmp_config_path
+        finally:
+            LF.set_settings(active_rig['LF_settings'].to_dict())
+            scene.frame_set(user_frame)
+
+        print("Recomputed the ground truth of %d views in %.1fs." % (num_views, time.time() - start_time))
+        return {'FINISHED'}
 
-    n_tiles_horiz = w / tile_width
-    n_tiles_vert = h / tile_height
-    n_tiles = n_tiles_horiz * n_tiles_vert
 
-    # split vertically into tiles with height=tile_height, width=img_width
-    tiles_vert = np.asarray(np.split(img, int(n_tiles_vert), 0))  # n_tiles_vert x tile_height x w
-    tiles_vert = tiles_vert.transpose([1, 0, 2]).reshape(int(tile_height), int(n_tiles_vert * w))
+class OBJECT_OT_clear_depth_cache(bpy.types.Operator):
+    """Remove all depth maps from the depth cache, e.g. after changing the scene"""
+    bl_idname = "scene.clear_depth_cache"
+    bl_label = """Clear depth cache"""
+    bl_options = {'REGISTER'}
 
-    # split horizontally into tiles with height=tile_height, width=tile_width
-    tiles = np.asarray(np.split(tiles_vert, n_tiles, 1))
-    tiles = tiles.reshape(int(n_tiles), int(tile_width * tile_height))  # n_tiles x px_per_tile
+    def execute(self, context):
+        cache = get_depth_cache(bpy.context.scene.LF)
+        if cache is not None:
+            cache.clear()
+        return {'FINISHED'}
 
-    # compute median per tile (without averaging for even N)
-    tiles = np.sort(tiles, axis=1)[:, int(tile_width*tile_height/2)]
-    small_img = tiles.reshape(int(n_tiles_vert), int(n_tiles_horiz))
 
-    return small_img
+def get_depth_fpaths(LF, camera, tgt_dir):
+    """
+    Returns a dict of depth and disparity products to the file paths of a camera, see postprocess_depth_map
+    """
+    statistics_files = [('depth_lowres_min', 'pfm'), ('depth_lowres_max', 'pfm'), ('depth_lowres_mean', 'pfm'),
+                        ('depth_lowres_std', 'pfm'), ('depth_lowres_edges', 'png')]
+    derived_files = [('normals_highres', 'pfm'), ('normals_lowres', 'pfm'), ('boundaries_lowres', 'png')]
+
+    fpaths = collections.defaultdict(list)
+    if camera.name == LF.get_center_camera().name:
+        for product in ['depth_highres', 'disp_highres', 'depth_lowres', 'disp_lowres']:
+            fpaths[product].append(os.path.join(tgt_dir, 'gt_%s.pfm' % product))
+        if LF.save_depth_statistics:
+            for product, ext in statistics_files:
+                fpaths[product].append(os.path.join(tgt_dir, 'gt_%s.%s' % (product, ext)))
+        if LF.save_derived_ground_truth:
+            for product, ext in derived_files:
+                fpaths[product].append(os.path.join(tgt_dir, 'gt_%s.%s' % (product, ext)))
+
+    camera_name = OBJECT_OT_render_lightfield.get_raw_camera_name(camera.name)
+    if LF.is_view_selected(camera, 'depth'):
+        fpaths['depth_highres'].append(os.path.join(tgt_dir, 'gt_depth_highres_%s.pfm' % camera_name))
+        fpaths['depth_lowres'].append(os.path.join(tgt_dir, 'gt_depth_lowres_%s.pfm' % camera_name))
+        if LF.save_depth_statistics:
+            for product, ext in statistics_files:
+                fpaths[product].append(os.path.join(tgt_dir, 'gt_%s_%s.%s' % (product, camera_name, ext)))
+        if LF.save_derived_ground_truth:
+            for product, ext in derived_files:
+                fpaths[product].append(os.path.join(tgt_dir, 'gt_%s_%s.%s' % (product, camera_name, ext)))
+    elif LF.is_synthesis_key_view(camera):
+        # view synthesis warps the key views with their low resolution depth maps
+        fpaths['depth_lowres'].append(os.path.join(tgt_dir, 'gt_depth_lowres_%s.pfm' % camera_name))
+    if LF.is_view_selected(camera, 'disp'):
+        fpaths['disp_highres'].append(os.path.join(tgt_dir, 'gt_disp_highres_%s.pfm' % camera_name))
+        fpaths['disp_lowres'].append(os.path.join(tgt_dir, 'gt_disp_lowres_%s.pfm' % camera_name))
+
+    return fpaths
+
+
+def get_render_cost(LF, view_times=None):
+    """
+    Returns the cost of rendering all frames and rigs as dict of 'views' (per stage), 'output_bytes' (per product),
+    'peak_memory' and 'render_time', which needs the measured view_times per stage and is None otherwise.
+    The view times of the active rig are used for all rigs.
+    """
+    frames = OBJECT_OT_render_lightfield.get_frames(LF)
+    LF.store_rig_settings()
+    active_rig = bpy.data.objects[LF.get_lightfield_name()]
+    rigs = LF.get_rigs() if LF.render_all_rigs else [active_rig]
+
+    views = collections.Counter()
+    output_bytes = collections.Counter()
+    peak_memory = 0
+    try:
+        for rig in rigs:
+            LF.set_settings(rig['LF_settings'].to_dict())
+            rgb_cameras = LF.get_rendered_input_cameras()
+            synthesized_cameras = LF.get_synthesized_cameras()
+            oid_cameras = LF.get_selected_cameras('object_id', include_center=True)
+            depth_cameras = LF.get_depth_cameras()
+
+            views['input_views'] += len(frames) * len(rgb_cameras)
+            views['ground_truth'] += len(frames) * (len(oid_cameras) + len(depth_cameras))
+            views['view_synthesis'] += len(frames) * len(synthesized_cameras)
+
+            # number of files per frame, the low resolution object ids include the standard center view map
+            file_counts = collections.Counter()
+            input_product = 'input_' + OBJECT_OT_render_lightfield.get_input_format(LF)
+            if OBJECT_OT_render_lightfield.needs_view_images(LF):
+                file_counts[input_product] += len(rgb_cameras) + len(synthesized_cameras)
+            # a light field image has the size of all views of the grid
+            file_counts[input_product] += len(OBJECT_OT_render_lightfield.get_light_field_layouts(LF)) * \
+                LF.num_cams_x * LF.num_cams_y
+            file_counts['synthesis_mask'] += len(synthesized_cameras)
+            file_counts['objectids_highres'] += len(oid_cameras)
+            file_counts['objectids_lowres'] += len(LF.get_selected_cameras('object_id')) + 1
+            for camera in depth_cameras:
+                for product, fpaths in get_depth_fpaths(LF, camera, '').items():
+                    file_counts[product] += len(fpaths)
+            if LF.save_derived_ground_truth:
+                file_counts['visibility'] += len(LF.get_selected_cameras('depth'))
+
+            for product, num_bytes in cost_estimate.get_output_bytes(LF.x_res, LF.y_res, LF.depth_map_scale,
+                                                                     file_counts).items():
+                output_bytes[product] += len(frames) * num_bytes
+            peak_memory = max(peak_memory, cost_estimate.get_peak_memory(LF.x_res, LF.y_res, LF.depth_map_scale,
+                                                                         LF.depth_postprocess_threads))
+    finally:
+        LF.set_settings(active_rig['LF_settings'].to_dict())
+
+    render_time = None if view_times is None else cost_estimate.get_render_time(views, view_times)
+    return {'views': dict(views), 'output_bytes': dict(output_bytes), 'peak_memory': peak_memory,
+            'render_time': render_time}
+
+
+def check_render_cost(LF, cost):
+    """
+    Returns (errors, warnings) of the cost compared to the available memory and the free space of the target directory
+    """
+    return cost_estimate.check_limits(cost['peak_memory'], sum(cost['output_bytes'].values()),
+                                      cost_estimate.get_available_memory(),
+                                      cost_estimate.get_free_disk(bpy.path.abspath(LF.tgt_dir)))
+
+
+def format_render_cost(cost):
+    """
+    Returns the cost as lines of text for the panel and the console
+    """
+    lines = ["Views: " + ", ".join("%s %d" % (stage, count) for stage, count in sorted(cost['views'].items()))]
+    if cost['render_time'] is not None:
+        lines.append("Render time: " + cost_estimate.format_duration(cost['render_time']))
+    lines.append("Peak memory: " + cost_estimate.format_bytes(cost['peak_memory']))
+    lines.append("Output: %s (%s)" % (cost_estimate.format_bytes(sum(cost['output_bytes'].values())),
+                                      ", ".join("%s %s" % (product, cost_estimate.format_bytes(num_bytes))
+                                                for product, num_bytes in sorted(cost['output_bytes'].items())
+                                                if num_bytes > 0)))
+    return lines
+
+
+def get_depth_cache(LF):
+    """
+    Returns the depth map cache of the settings or None if it is disabled
+    """
+    if not LF.depth_cache_dir:
+        return None
+    return depth_cache.DepthCache(bpy.path.abspath(LF.depth_cache_dir), int(LF.depth_cache_size_gb * 2 ** 30))
+
+
+def get_camera_position(LF, camera):
+    """
+    Returns the position (x, y) of a camera in the light field coordinates
+    """
+    if LF.use_virtual_rig:
+        return camera.x, camera.y
+    return tuple(camera.location[:2])
+
+
+def get_camera_shift(LF, camera):
+    """
+    Returns the lens shift (shift_x, shift_y) of a camera, which focuses the grid at the focus distance
+    """
+    x, y = get_camera_position(LF, camera)
+    factor = get_shift_factor(LF.focal_length, LF.sensor_size, LF.focus_dist)
+    return -x * factor, -y * factor
+
+
+def get_camera_args(LF, camera):
+    """
+    Returns the camera_args (focal_length, sensor_size, shift_x, shift_y) of a camera for postprocess_depth_map
+    """
+    return (LF.focal_length, LF.sensor_size) + get_camera_shift(LF, camera)
+
+
+def save_visibility_masks(LF, tgt_dir):
+    """
+    Saves the masks of center view pixels visible in each view with depth map, computed from the low resolution
+    depth maps as gt_visibility_CamXXX.png
+    """
+    center_camera = LF.get_center_camera()
+    center_depth = np.flipud(read_pfm(os.path.join(tgt_dir, 'gt_depth_lowres.pfm')))
+    disp_args = (LF.focal_length, LF.focus_dist, LF.sensor_size, max(LF.x_res, LF.y_res))
+    disp_x = depth_to_disparity(center_depth, LF.baseline_x_m, *disp_args)
+    disp_y = depth_to_disparity(center_depth, LF.baseline_y_m, *disp_args)
+    ci, cj = divmod(LF.get_camera_index(center_camera.name), LF.num_cams_x)
+
+    for camera in LF.get_selected_cameras('depth'):
+        camera_name = OBJECT_OT_render_lightfield.get_raw_camera_name(camera.name)
+        i, j = divmod(LF.get_camera_index(camera.name), LF.num_cams_x)
+        view_depth = np.flipud(read_pfm(os.path.join(tgt_dir, 'gt_depth_lowres_%s.pfm' % camera_name)))
+        visible = get_visibility_mask(center_depth, view_depth, disp_y, disp_x, i - ci, j - cj)
+        write_png(visible * np.uint8(255), os.path.join(tgt_dir, 'gt_visibility_%s.png' % camera_name))
+
+
+def get_depth_cache_key(LF, scene, camera):
+    """
+    Returns the cache key of the high resolution depth map of a camera, i.e. of its pose, intrinsics and frame
+    """
+    x, y = get_camera_position(LF, camera)
+    shift_x, shift_y = get_camera_shift(LF, camera)
+    render_camera = LF.get_render_camera(camera)
+    lightfield = bpy.data.objects[LF.get_lightfield_name()]
+
+    return depth_cache.get_key({'blend_file': bpy.data.filepath,
+                                'scene': scene.name,
+                                'frame': scene.frame_current,
+                                'rig': [[round(value, 6) for value in row] for row in lightfield.matrix_world],
+                                'position': [round(x, 6), round(y, 6)],
+                                'shift': [round(shift_x, 6), round(shift_y, 6)],
+                                'focal_length': round(LF.focal_length, 6),
+                                'sensor_size': round(LF.sensor_size, 6),
+                                'clip': [round(render_camera.data.clip_start, 6), round(render_camera.data.clip_end, 6)],
+                                'resolution': [LF.x_res, LF.y_res],
+                                'depth_map_scale': round(LF.depth_map_scale, 6)})
+
+
+def get_view_transform(scene):
+    """
+    Returns the transform (use_srgb, exposure, gamma) of the scene's color management for encode_image
+    """
+    view_settings = scene.view_settings
+    if view_settings.view_transform not in ['Default', 'Standard', 'Raw'] or view_settings.look != 'None':
+        print("View transform '%s' is not supported for direct image output, using sRGB." %
+              view_settings.view_transform)
+    return view_settings.view_transform != 'Raw', view_settings.exposure, view_settings.gamma
+
+
+def get_viewer_pixels():
+    """
+    Returns the pixels of the compositor viewer image as float array (h, w, 4), rows are stored bottom-up
+    """
+    image = bpy.data.images['Viewer Node']
+    width, height = image.size
+    try:
+        pixels = np.empty(width * height * 4, dtype=np.float32)
+        image.pixels.foreach_get(pixels)
+    except AttributeError:
+        # older versions of blender don't support foreach_get on pixels
+        pixels = np.array(image.pixels[:], dtype=np.float32)
+    return pixels.reshape((height, width, 4))
+
+
+def load_view(fpath):
+    """
+    Loads a rendered view as top-down array (h, w, c), png files keep their integer bit depth
+    """
+    if fpath.endswith('.pfm'):
+        return np.flipud(read_pfm(fpath))
+
+    image = bpy.data.images.load(fpath)
+    try:
+        # blender loads 16 bit png files into linearized float buffers, keep the stored values instead
+        image.colorspace_settings.name = 'Non-Color'
+        width, height = image.size
+        pixels = np.array(image.pixels[:], dtype=np.float32).reshape((height, width, -1))
+        max_value = 2 ** 16 - 1 if image.is_float else 2 ** 8 - 1
+        dtype = np.uint16 if image.is_float else np.uint8
+    finally:
+        bpy.data.images.remove(image)
+
+    # pixels always contain rgba, drop alpha
+    view = np.flipud(pixels[:, :, :3])
+    return np.asarray(np.round(view * max_value), dtype=dtype)
+
+
+class RenderProgress:
+    """
+    Counts the views per stage and estimates the remaining time from the measured time per view of each stage
+    """
+
+    def __init__(self, stages, totals):
+        self.stages = stages
+        self.totals = totals
+        self.done = {stage: 0 for stage in stages}
+        self.rendered = {stage: 0 for stage in stages}
+        self.render_time = {stage: 0.0 for stage in stages}
+
+    def update(self, stage, rendered, duration):
+        self.done[stage] += 1
+        if rendered:
+            self.rendered[stage] += 1
+            self.render_time[stage] += duration
+
+    def get_total(self):
+        return sum(self.totals.values())
+
+    def get_done(self):
+        return sum(self.done.values())
+
+    def get_percentage(self):
+        return 100.0 * self.get_done() / max(1, self.get_total())
+
+    def get_eta(self):
+        """
+        Returns the estimated remaining time in seconds, stages without rendered views use the overall throughput
+        """
+        n_rendered = sum(self.rendered.values())
+        if n_rendered == 0:
+            return None
+
+        time_per_view = sum(self.render_time.values()) / n_rendered
+        eta = 0.0
+        for stage in self.stages:
+            if self.rendered[stage]:
+                stage_time_per_view = self.render_time[stage] / self.rendered[stage]
+            else:
+                stage_time_per_view = time_per_view
+            eta += (self.totals[stage] - self.done[stage]) * stage_time_per_view
+        return eta
+
+    def get_status(self, stage):
+        status = "%s: %d/%d views" % (stage.replace('_', ' '), self.done[stage], self.totals[stage])
+        eta = self.get_eta()
+        if eta is not None:
+            status += ", ETA %s" % datetime.timedelta(seconds=int(eta))
+        return status
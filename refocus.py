@@ -0,0 +1,149 @@
+############################################################################
+#  This file is part of the 4D Light Field Benchmark.                      #
+#                                                                          #
+#  This work is licensed under the Creative Commons                        #
+#  Attribution-NonCommercial-ShareAlike 4.0 International License.         #
+#  To view a copy of this license,                                         #
+#  visit http://creativecommons.org/licenses/by-nc-sa/4.0/.                #
+#                                                                          #
+#  Authors: Katrin Honauer & Ole Johannsen                                 #
+#  Contact: contact@lightfield-analysis.net                                #
+#  Website: www.lightfield-analysis.net                                    #
+#                                                                          #
+#  This add-on is based upon work of Maximilian Diebold                    #
+#                                                                          #
+#  The 4D Light Field Benchmark was jointly created by the University of   #
+#  Konstanz and the HCI at Heidelberg University. If you use any part of   #
+#  the benchmark, please cite our paper "A dataset and evaluation          #
+#  methodology for depth estimation on 4D light fields". Thanks!           #
+#                                                                          #
+#  @inproceedings{honauer2016benchmark,                                    #
+#    title={A dataset and evaluation methodology for depth estimation on   #
+#           4D light fields},                                              #
+#    author={Honauer, Katrin and Johannsen, Ole and Kondermann, Daniel     #
+#            and Goldluecke, Bastian},                                     #
+#    booktitle={Asian Conference on Computer Vision},                      #
+#    year={2016},                                                          #
+#    organization={Springer}                                               #
+#    }                                                                     #
+#                                                                          #
+############################################################################
+
+
+
+import concurrent.futures
+import os
+
+import numpy as np
+
+
+def parse_disparities(text):
+    """
+    Parses a comma separated list of disparities, 'start:stop:num' adds num evenly spaced disparities
+    """
+    disparities = []
+    for item in text.replace(';', ',').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        if ':' in item:
+            start, stop, num = item.split(':')
+            disparities.extend(np.linspace(float(start), float(stop), int(num)))
+        else:
+            disparities.append(float(item))
+    return sorted(set(float(disparity) for disparity in disparities))
+
+
+def add_shifted(acc, weights, view, dy, dx):
+    """
+    Adds view (h, w, c) sampled at (y + dy, x + dx) with bilinear interpolation to acc (h, w, c)
+    and the interpolation weights of the samples inside the view to weights (h, w, 1)
+    """
+    height, width = np.shape(view)[:2]
+    iy = int(np.floor(dy))
+    ix = int(np.floor(dx))
+    fy = dy - iy
+    fx = dx - ix
+
+    for oy, wy in [(iy, 1.0 - fy), (iy + 1, fy)]:
+        for ox, wx in [(ix, 1.0 - fx), (ix + 1, fx)]:
+            weight = wy * wx
+            if weight <= 0:
+                continue
+
+            # target pixels whose sample lies inside the view
+            y0, y1 = max(0, -oy), min(height, height - oy)
+            x0, x1 = max(0, -ox), min(width, width - ox)
+            if y0 >= y1 or x0 >= x1:
+                continue
+
+            acc[y0:y1, x0:x1] += weight * view[y0 + oy:y1 + oy, x0 + ox:x1 + ox]
+            weights[y0:y1, x0:x1] += weight
+
+
+def get_focal_stack(view_fpaths, mask, disparities, load_view, num_threads=0):
+    """
+    Computes refocused images (len(disparities), H, W, C) of a camera grid by shift-and-add.
+
+    A scene point with disparity d is seen at (y - d * (i - ci), x - d * (j - cj)) in view (i, j), with (ci, cj)
+    the grid center and disparities as in the ground truth, i.e. 0 at the focus distance of the grid.
+    Views with mask[i][j] are loaded in row order with load_view(fpath) -> (H, W, C) top-down array and added
+    to one accumulator per disparity, so that at most one view is held in memory. With num_threads > 0 the
+    disparities are processed in parallel.
+    """
+    num_cams_y, num_cams_x = np.shape(mask)
+    ci = (num_cams_y - 1) / 2.0
+    cj = (num_cams_x - 1) / 2.0
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=num_threads) if num_threads > 0 else None
+    stack = None
+    weights = None
+
+    try:
+        for i in range(num_cams_y):
+            for j in range(num_cams_x):
+                if not mask[i][j]:
+                    continue
+
+                view = np.asarray(load_view(view_fpaths[i][j]), dtype=np.float32)
+                if np.ndim(view) == 2:
+                    view = view[:, :, np.newaxis]
+
+                if stack is None:
+                    height, width, channels = np.shape(view)
+                    stack = np.zeros((len(disparities), height, width, channels), dtype=np.float32)
+                    weights = np.zeros((len(disparities), height, width, 1), dtype=np.float32)
+
+                def add_view(k):
+                    add_shifted(stack[k], weights[k], view, -disparities[k] * (i - ci), -disparities[k] * (j - cj))
+
+                if executor is None:
+                    for k in range(len(disparities)):
+                        add_view(k)
+                else:
+                    list(executor.map(add_view, range(len(disparities))))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    if stack is None:
+        return None
+    return stack / np.maximum(weights, 1e-6)
+
+
+def export_focal_stack(view_fpaths, mask, disparities, tgt_dir, load_view, write_view, extension, num_threads=0):
+    """
+    Writes refocused images 'refocused_disp<d>.<extension>' of all disparities with write_view(img, fpath)
+    and returns their file paths
+    """
+    stack = get_focal_stack(view_fpaths, mask, disparities, load_view, num_threads)
+    if stack is None:
+        print("No views for refocusing, skipping focal stack export.")
+        return []
+
+    fpaths = []
+    for disparity, img in zip(disparities, stack):
+        fpath = os.path.join(tgt_dir, 'refocused_disp%+.2f.%s' % (disparity, extension))
+        write_view(img, fpath)
+        fpaths.append(fpath)
+    return fpaths
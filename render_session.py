@@ -0,0 +1,176 @@
+############################################################################
+#  This file is part of the 4D Light Field Benchmark.                      #
+#                                                                          #
+#  This work is licensed under the Creative Commons                        #
+#  Attribution-NonCommercial-ShareAlike 4.0 International License.         #
+#  To view a copy of this license,                                         #
+#  visit http://creativecommons.org/licenses/by-nc-sa/4.0/.                #
+#                                                                          #
+#  Authors: Katrin Honauer & Ole Johannsen                                 #
+#  Contact: contact@lightfield-analysis.net                                #
+#  Website: www.lightfield-analysis.net                                    #
+#                                                                          #
+#  This add-on is based upon work of Maximilian Diebold                    #
+#                                                                          #
+#  The 4D Light Field Benchmark was jointly created by the University of   #
+#  Konstanz and the HCI at Heidelberg University. If you use any part of   #
+#  the benchmark, please cite our paper "A dataset and evaluation          #
+#  methodology for depth estimation on 4D light fields". Thanks!           #
+#                                                                          #
+#  @inproceedings{honauer2016benchmark,                                    #
+#    title={A dataset and evaluation methodology for depth estimation on   #
+#           4D light fields},                                              #
+#    author={Honauer, Katrin and Johannsen, Ole and Kondermann, Daniel     #
+#            and Goldluecke, Bastian},                                     #
+#    booktitle={Asian Conference on Computer Vision},                      #
+#    year={2016},                                                          #
+#    organization={Springer}                                               #
+#    }                                                                     #
+#                                                                          #
+############################################################################
+
+
+import bpy
+
+
+class RenderSession:
+    """
+    Keeps render settings and compositor nodes alive for all views and frames of a light field
+    rendering and restores the user's settings afterwards, also if the rendering fails.
+    """
+
+    # scene settings changed during rendering, as attribute paths relative to the scene
+    restored_settings = ['render.engine', 'render.use_antialiasing', 'render.resolution_x', 'render.resolution_y',
+                         'render.resolution_percentage', 'render.filepath', 'render.use_persistent_data',
+                         'render.use_compositing', 'use_nodes', 'camera', 'frame_current', 'cycles.seed',
+                         'render.tile_x', 'render.tile_y', 'render.threads_mode', 'render.threads',
+                         'render.use_border', 'render.use_crop_to_border', 'render.border_min_x',
+                         'render.border_max_x', 'render.border_min_y', 'render.border_max_y']
+
+    # settings which may be tuned per stage, see render_tuning.py
+    stage_settings = ['render.tile_x', 'render.tile_y', 'render.threads_mode', 'render.threads']
+
+    # render layer passes required for the ground truth
+    restored_passes = ['use_pass_z', 'use_pass_object_index']
+
+    # settings of the single camera of virtual rigs, which is moved and shifted from view to view
+    restored_camera_settings = ['location', 'data.shift_x', 'data.shift_y']
+
+    def __init__(self, scene):
+        self.scene = scene
+        self.user_settings = {}
+        self.user_passes = {}
+        self.user_cameras = {}
+        self.nodes = {}
+
+    def __enter__(self):
+        for path in self.restored_settings:
+            try:
+                self.user_settings[path] = get_path(self.scene, path)
+            except AttributeError:
+                pass
+
+        render_layer = self.scene.render.layers['RenderLayer']
+        for name in self.restored_passes:
+            self.user_passes[name] = getattr(render_layer, name)
+            setattr(render_layer, name, True)
+
+        for obj in self.scene.objects:
+            if obj.type == 'CAMERA' and obj.name.endswith('_VirtualCam'):
+                self.user_cameras[obj.name] = {path: copy_value(get_path(obj, path))
+                                               for path in self.restored_camera_settings}
+
+        # keep scene data between renders, only the camera changes from view to view
+        self.scene.use_nodes = True
+        self.scene.render.use_compositing = True
+        self.scene.render.use_persistent_data = True
+
+        # remove all nodes of previous, interrupted renderings
+        for node in list(self.scene.node_tree.nodes):
+            if node.name.startswith("LF"):
+                self.scene.node_tree.nodes.remove(node)
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def close(self):
+        for node in self.nodes.values():
+            self.scene.node_tree.nodes.remove(node)
+        self.nodes = {}
+
+        render_layer = self.scene.render.layers['RenderLayer']
+        for name, value in self.user_passes.items():
+            setattr(render_layer, name, value)
+        for path, value in self.user_settings.items():
+            set_path(self.scene, path, value)
+        for name, settings in self.user_cameras.items():
+            camera = bpy.data.objects.get(name)
+            if camera is not None:
+                for path, value in settings.items():
+                    set_path(camera, path, value)
+
+    def get_node(self, name, node_type, setup=None):
+        """
+        Returns the compositor node with the given name, it is created and set up on first use
+        """
+        try:
+            return self.nodes[name]
+        except KeyError:
+            pass
+
+        node = self.scene.node_tree.nodes.new(type=node_type)
+        node.name = name
+        if setup is not None:
+            setup(node, self.scene.node_tree)
+        self.nodes[name] = node
+        return node
+
+    def get_render_layer_output(self, *names):
+        """
+        Returns the first existing output of the render layers node, as pass names differ between versions
+        """
+        outputs = self.scene.node_tree.nodes['Render Layers'].outputs
+        for name in names:
+            if name in outputs:
+                return outputs[name]
+        raise KeyError("Render layers have none of the outputs: %s" % ", ".join(names))
+
+    def use_nodes(self, *names):
+        """
+        Enables the given nodes of the session and mutes all others, so that only their outputs are written
+        """
+        for name, node in self.nodes.items():
+            node.mute = name not in names
+            if name in names and node.type == 'VIEWER':
+                self.scene.node_tree.nodes.active = node
+
+    def configure(self, engine=None, use_antialiasing=None, resolution_percentage=100):
+        """
+        Changes the render settings for a stage, None restores the user's setting
+        """
+        render = self.scene.render
+        render.engine = self.user_settings['render.engine'] if engine is None else engine
+        render.use_antialiasing = self.user_settings['render.use_antialiasing'] if use_antialiasing is None \
+            else use_antialiasing
+        render.resolution_percentage = int(round(resolution_percentage))
+        for path in self.stage_settings:
+            set_path(self.scene, path, self.user_settings[path])
+
+
+def copy_value(value):
+    # vectors are references into the blender data
+    return value.copy() if hasattr(value, 'copy') else value
+
+
+def get_path(obj, path):
+    for name in path.split('.'):
+        obj = getattr(obj, name)
+    return obj
+
+
+def set_path(obj, path, value):
+    names = path.split('.')
+    setattr(get_path(obj, '.'.join(names[:-1])) if len(names) > 1 else obj, names[-1], value)
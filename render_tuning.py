@@ -0,0 +1,154 @@
+############################################################################
+#  This file is part of the 4D Light Field Benchmark.                      #
+#                                                                          #
+#  This work is licensed under the Creative Commons                        #
+#  Attribution-NonCommercial-ShareAlike 4.0 International License.         #
+#  To view a copy of this license,                                         #
+#  visit http://creativecommons.org/licenses/by-nc-sa/4.0/.                #
+#                                                                          #
+#  Authors: Katrin Honauer & Ole Johannsen                                 #
+#  Contact: contact@lightfield-analysis.net                                #
+#  Website: www.lightfield-analysis.net                                    #
+#                                                                          #
+#  This add-on is based upon work of Maximilian Diebold                    #
+#                                                                          #
+#  The 4D Light Field Benchmark was jointly created by the University of   #
+#  Konstanz and the HCI at Heidelberg University. If you use any part of   #
+#  the benchmark, please cite our paper "A dataset and evaluation          #
+#  methodology for depth estimation on 4D light fields". Thanks!           #
+#                                                                          #
+#  @inproceedings{honauer2016benchmark,                                    #
+#    title={A dataset and evaluation methodology for depth estimation on   #
+#           4D light fields},                                              #
+#    author={Honauer, Katrin and Johannsen, Ole and Kondermann, Daniel     #
+#            and Goldluecke, Bastian},                                     #
+#    booktitle={Asian Conference on Computer Vision},                      #
+#    year={2016},                                                          #
+#    organization={Springer}                                               #
+#    }                                                                     #
+#                                                                          #
+############################################################################
+
+
+
+import json
+import os
+import socket
+import time
+
+import bpy
+
+from . import render_session
+
+# candidate settings of the probe renders
+TILE_SIZES = [16, 32, 64, 128, 256]
+
+# probe renders cover the image center and use few samples, which keeps them short
+PROBE_BORDER = 0.25
+PROBE_SAMPLES = 8
+
+
+def get_thread_counts():
+    num_cpus = os.cpu_count() or 1
+    return sorted({num_cpus, max(1, num_cpus // 2)})
+
+
+def get_cache_path():
+    return os.path.join(bpy.utils.user_resource('CONFIG', path='lightfield', create=True), 'render_tuning.json')
+
+
+class RenderTuner:
+    """
+    Finds the fastest tile size and thread count of a render stage with probe renders of the current view.
+    The results are cached per host, .blend file, scene, stage, engine and resolution.
+    """
+
+    # settings chosen by the tuner, the render session restores them after rendering
+    tuned_settings = ['render.tile_x', 'render.tile_y', 'render.threads_mode', 'render.threads']
+
+    # settings changed for probe renders only
+    probe_settings = ['render.use_border', 'render.use_crop_to_border', 'render.border_min_x', 'render.border_max_x',
+                      'render.border_min_y', 'render.border_max_y', 'cycles.samples']
+
+    def __init__(self, scene, cache_path=None):
+        self.scene = scene
+        self.cache_path = get_cache_path() if cache_path is None else cache_path
+        try:
+            with open(self.cache_path) as f:
+                self.cache = json.load(f)
+        except (IOError, ValueError):
+            self.cache = {}
+
+    def get_key(self, stage):
+        render = self.scene.render
+        percentage = render.resolution_percentage / 100.0
+        return '|'.join([socket.gethostname(), bpy.path.abspath(bpy.data.filepath) or 'unsaved', self.scene.name,
+                         stage, render.engine, '%dx%d' % (render.resolution_x * percentage,
+                                                           render.resolution_y * percentage)])
+
+    def apply(self, stage, activate_probe_view):
+        """
+        Applies the tuned settings of a stage, probe renders run on first use after activate_probe_view()
+        """
+        key = self.get_key(stage)
+        if key not in self.cache:
+            activate_probe_view()
+            self.cache[key] = self.tune(stage)
+            self.save()
+
+        print("Render settings of stage %s: %s" % (stage, self.cache[key]))
+        for path, value in self.cache[key].items():
+            render_session.set_path(self.scene, path, value)
+
+    def tune(self, stage):
+        probe_settings = {}
+        for path in self.probe_settings:
+            try:
+                probe_settings[path] = render_session.get_path(self.scene, path)
+            except AttributeError:
+                pass
+
+        render = self.scene.render
+        render.use_border = True
+        render.use_crop_to_border = False
+        render.border_min_x = render.border_min_y = 0.5 - PROBE_BORDER
+        render.border_max_x = render.border_max_y = 0.5 + PROBE_BORDER
+        if 'cycles.samples' in probe_settings:
+            self.scene.cycles.samples = min(PROBE_SAMPLES, probe_settings['cycles.samples'])
+
+        try:
+            # the first render includes the scene synchronization and is not timed
+            bpy.ops.render.render(write_still=False)
+
+            timings = []
+            for threads in get_thread_counts():
+                for tile_size in TILE_SIZES:
+                    settings = {'render.tile_x': tile_size, 'render.tile_y': tile_size,
+                                'render.threads_mode': 'FIXED', 'render.threads': threads}
+                    for path, value in settings.items():
+                        render_session.set_path(self.scene, path, value)
+
+                    start = time.time()
+                    bpy.ops.render.render(write_still=False)
+                    timings.append((time.time() - start, threads, tile_size, settings))
+                    print("Probe render of stage %s with %d threads and %d px tiles: %.2fs" % (stage, threads,
+                                                                                               tile_size,
+                                                                                               timings[-1][0]))
+        finally:
+            for path, value in probe_settings.items():
+                render_session.set_path(self.scene, path, value)
+
+        return min(timings, key=lambda timing: timing[:3])[3]
+
+    def save(self):
+        # merge with results of other blender instances and replace the file atomically
+        try:
+            with open(self.cache_path) as f:
+                self.cache = dict(json.load(f), **self.cache)
+        except (IOError, ValueError):
+            pass
+
+        tmp_path = self.cache_path + '.%d.tmp' % os.getpid()
+        with open(tmp_path, 'w') as f:
+            json.dump(self.cache, f, indent=4, sort_keys=True)
+        os.replace(tmp_path, self.cache_path)
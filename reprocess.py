@@ -0,0 +1,241 @@
+############################################################################
+#  This file is part of the 4D Light Field Benchmark.                      #
+#                                                                          #
+#  This work is licensed under the Creative Commons                        #
+#  Attribution-NonCommercial-ShareAlike 4.0 International License.         #
+#  To view a copy of this license,                                         #
+#  visit http://creativecommons.org/licenses/by-nc-sa/4.0/.                #
+#                                                                          #
+#  Authors: Katrin Honauer & Ole Johannsen                                 #
+#  Contact: contact@lightfield-analysis.net                                #
+#  Website: www.lightfield-analysis.net                                    #
+#                                                                          #
+#  This add-on is based upon work of Maximilian Diebold                    #
+#                                                                          #
+#  The 4D Light Field Benchmark was jointly created by the University of   #
+#  Konstanz and the HCI at Heidelberg University. If you use any part of   #
+#  the benchmark, please cite our paper "A dataset and evaluation          #
+#  methodology for depth estimation on 4D light fields". Thanks!           #
+#                                                                          #
+#  @inproceedings{honauer2016benchmark,                                    #
+#    title={A dataset and evaluation methodology for depth estimation on   #
+#           4D light fields},                                              #
+#    author={Honauer, Katrin and Johannsen, Ole and Kondermann, Daniel     #
+#            and Goldluecke, Bastian},                                     #
+#    booktitle={Asian Conference on Computer Vision},                      #
+#    year={2016},                                                          #
+#    organization={Springer}                                               #
+#    }                                                                     #
+#                                                                          #
+############################################################################
+
+
+
+"""
+Recomputes the disparity and low resolution ground truth of rendered light fields from their saved high resolution
+depth maps, without blender, e.g.
+
+    python reprocess.py /data/lightfields --processes 8 --edge-threshold 0.05
+
+Every directory below the given ones with a parameters.cfg and high resolution depth maps is reprocessed, which
+includes sequence/ frames and rig subdirectories. Only products which exist are rewritten: the high resolution
+depth (with fixed artefacts), disparity and low resolution maps, the depth statistics, the normals and occlusion
+boundaries and the visibility masks. The disparity range disp_min/disp_max of the parameters.cfg is updated from all
+reprocessed views of a directory.
+"""
+
+import argparse
+import concurrent.futures
+import configparser
+import os
+import re
+import sys
+
+import numpy as np
+
+from lightfield_core import (ARTEFACT_RANGE, depth_to_disparity, get_camera_axes, get_integer_scale, get_shift_factor,
+                             get_visibility_mask, postprocess_depth_map, read_pfm, write_png)
+from view_selection import get_center_view
+
+# products of a view rewritten if their file exists, see get_depth_fpaths of the simulator
+PRODUCTS = [('depth_highres', 'pfm'), ('disp_highres', 'pfm'), ('depth_lowres', 'pfm'), ('disp_lowres', 'pfm'),
+            ('depth_lowres_min', 'pfm'), ('depth_lowres_max', 'pfm'), ('depth_lowres_mean', 'pfm'),
+            ('depth_lowres_std', 'pfm'), ('depth_lowres_edges', 'png'), ('normals_highres', 'pfm'),
+            ('normals_lowres', 'pfm'), ('boundaries_lowres', 'png')]
+
+DEPTH_FILE_PATTERN = re.compile(r'^gt_depth_highres(_Cam(\d+))?\.pfm$')
+VISIBILITY_FILE_PATTERN = re.compile(r'^gt_visibility_Cam(\d+)\.png$')
+
+
+def find_render_dirs(roots):
+    """
+    Returns all directories below roots with a parameters.cfg and high resolution depth maps
+    """
+    render_dirs = []
+    for root in roots:
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            if 'parameters.cfg' in filenames and any(DEPTH_FILE_PATTERN.match(name) for name in filenames):
+                render_dirs.append(dirpath)
+    return render_dirs
+
+
+def read_parameters(render_dir):
+    parser = configparser.ConfigParser(delimiters="=")
+    parser.read(os.path.join(render_dir, 'parameters.cfg'))
+    return parser
+
+
+def get_disp_args(parser):
+    """
+    Returns (baseline, focal_length, focus_dist, sensor_size, max_res) of a config for depth_to_disparity
+    """
+    return (float(parser.get('extrinsics', 'baseline_mm')) / 1000.0,
+            float(parser.get('intrinsics', 'focal_length_mm')),
+            float(parser.get('extrinsics', 'focus_distance_m')),
+            float(parser.get('intrinsics', 'sensor_size_mm')),
+            max(int(parser.get('intrinsics', 'image_resolution_x_px')),
+                int(parser.get('intrinsics', 'image_resolution_y_px'))))
+
+
+def get_camera_args(parser, index=None):
+    """
+    Returns the camera_args (focal_length, sensor_size, shift_x, shift_y) of the view with flat grid index
+    row * num_cams_x + col of a config for postprocess_depth_map, of the center view if index is None
+    """
+    num_cams_x = int(parser.get('extrinsics', 'num_cams_x'))
+    num_cams_y = int(parser.get('extrinsics', 'num_cams_y'))
+    baseline, focal_length, focus_dist, sensor_size, _ = get_disp_args(parser)
+    i, j = get_center_view(num_cams_x, num_cams_y) if index is None else divmod(index, num_cams_x)
+    cam_x, cam_y = get_camera_axes(num_cams_x, num_cams_y, baseline, baseline)
+    factor = get_shift_factor(focal_length, sensor_size, focus_dist)
+    return focal_length, sensor_size, -cam_x[j] * factor, -cam_y[i] * factor
+
+
+def get_view_tasks(render_dir, parser):
+    """
+    Returns (depth file path, dict of product -> list of file paths, camera_args) of all views of a render directory
+    """
+    tasks = []
+    for name in sorted(os.listdir(render_dir)):
+        match = DEPTH_FILE_PATTERN.match(name)
+        if match is None:
+            continue
+        suffix = match.group(1) or ''
+        camera_args = get_camera_args(parser, int(match.group(2)) if match.group(2) else None)
+        fpaths = {}
+        for product, extension in PRODUCTS:
+            fpath = os.path.join(render_dir, 'gt_%s%s.%s' % (product, suffix, extension))
+            if os.path.isfile(fpath):
+                fpaths[product] = [fpath]
+        tasks.append((os.path.join(render_dir, name), fpaths, camera_args))
+    return tasks
+
+
+def reprocess_view(depth_fpath, fpaths, depth_map_scale, disp_args, camera_args, edge_threshold, artefact_range):
+    """
+    Reprocesses a single view in a worker process, returns the range (min, max) of its low resolution disparity
+    """
+    # the memory mapped file is copied before the high resolution depth map itself is rewritten
+    depth = np.array(read_pfm(depth_fpath, mmap=True), dtype=np.float32)
+    return postprocess_depth_map(depth, depth_map_scale, disp_args, fpaths, edge_threshold, camera_args=camera_args,
+                                 artefact_range=artefact_range)
+
+
+def write_visibility_masks(render_dir, parser):
+    """
+    Rewrites the existing visibility masks of a directory from its reprocessed low resolution depth maps, see
+    save_visibility_masks of the simulator. Returns the number of rewritten masks.
+    """
+    names = [name for name in sorted(os.listdir(render_dir)) if VISIBILITY_FILE_PATTERN.match(name)]
+    if not names:
+        return 0
+
+    num_cams_x = int(parser.get('extrinsics', 'num_cams_x'))
+    ci, cj = get_center_view(num_cams_x, int(parser.get('extrinsics', 'num_cams_y')))
+    center_depth = np.flipud(read_pfm(os.path.join(render_dir, 'gt_depth_lowres.pfm')))
+    # the grid has the same baseline in x and y
+    disp = depth_to_disparity(center_depth, *get_disp_args(parser))
+
+    for name in names:
+        camera_name = name[len('gt_visibility_'):-len('.png')]
+        i, j = divmod(int(VISIBILITY_FILE_PATTERN.match(name).group(1)), num_cams_x)
+        view_depth = np.flipud(read_pfm(os.path.join(render_dir, 'gt_depth_lowres_%s.pfm' % camera_name)))
+        visible = get_visibility_mask(center_depth, view_depth, disp, disp, i - ci, j - cj)
+        write_png(visible * np.uint8(255), os.path.join(render_dir, name))
+    return len(names)
+
+
+def write_disp_range(render_dir, parser, disp_ranges):
+    # same rounding as for rendered disparity maps
+    min_disp = np.floor(min(disp_range[0] for disp_range in disp_ranges) * 10) / 10 - 0.1
+    max_disp = np.ceil(max(disp_range[1] for disp_range in disp_ranges) * 10) / 10 + 0.1
+    parser.set('meta', 'disp_min', str(round(min_disp, 1)))
+    parser.set('meta', 'disp_max', str(round(max_disp, 1)))
+
+    fpath = os.path.join(render_dir, 'parameters.cfg')
+    with open(fpath + '.part', 'w') as f:
+        parser.write(f)
+    os.replace(fpath + '.part', fpath)
+    return min_disp, max_disp
+
+
+def reprocess(roots, processes=None, edge_threshold=0.05, artefact_range=ARTEFACT_RANGE):
+    """
+    Reprocesses all render directories below roots in a process pool, returns the number of failed directories
+    """
+    render_dirs = find_render_dirs(roots)
+    print("Reprocessing %d directories." % len(render_dirs))
+
+    failed = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+        # submit the views of all directories at once, so that the pool stays busy across directories
+        futures = {}
+        parsers = {}
+        for render_dir in render_dirs:
+            parser = read_parameters(render_dir)
+            try:
+                depth_map_scale = get_integer_scale(float(parser.get('meta', 'depth_map_scale')))
+            except ValueError as e:
+                print("Cannot reprocess %s: %s" % (render_dir, e))
+                failed += 1
+                continue
+            parsers[render_dir] = parser
+            disp_args = get_disp_args(parser)
+            futures[render_dir] = [executor.submit(reprocess_view, depth_fpath, fpaths, depth_map_scale, disp_args,
+                                                   camera_args, edge_threshold, artefact_range)
+                                   for depth_fpath, fpaths, camera_args in get_view_tasks(render_dir, parser)]
+
+        for render_dir in sorted(futures):
+            try:
+                disp_ranges = [future.result() for future in futures[render_dir]]
+                write_visibility_masks(render_dir, parsers[render_dir])
+            except Exception as e:
+                print("Reprocessing failed in %s: %s" % (render_dir, e))
+                failed += 1
+                continue
+            min_disp, max_disp = write_disp_range(render_dir, parsers[render_dir], disp_ranges)
+            print("Reprocessed %d views in %s, disparity range [%.1f, %.1f]." % (len(disp_ranges), render_dir,
+                                                                                 min_disp, max_disp))
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Recompute the ground truth of rendered light fields from their '
+                                                 'high resolution depth maps.')
+    parser.add_argument('dirs', nargs='+', help='render directories or directories containing them')
+    parser.add_argument('--processes', type=int, default=None, help='worker processes, default: number of cpus')
+    parser.add_argument('--edge-threshold', type=float, default=0.05,
+                        help='relative depth range of a tile marked as discontinuity')
+    parser.add_argument('--artefact-min', type=float, default=ARTEFACT_RANGE[0],
+                        help='high resolution depths below this factor times the minimum depth are artefacts')
+    parser.add_argument('--artefact-max', type=float, default=ARTEFACT_RANGE[1],
+                        help='high resolution depths above this factor times the maximum depth are artefacts')
+    args = parser.parse_args(argv)
+
+    failed = reprocess(args.dirs, args.processes, args.edge_threshold, (args.artefact_min, args.artefact_max))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
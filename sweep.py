@@ -0,0 +1,268 @@
+############################################################################
+#  This file is part of the 4D Light Field Benchmark.                      #
+#                                                                          #
+#  This work is licensed under the Creative Commons                        #
+#  Attribution-NonCommercial-ShareAlike 4.0 International License.         #
+#  To view a copy of this license,                                         #
+#  visit http://creativecommons.org/licenses/by-nc-sa/4.0/.                #
+#                                                                          #
+#  Authors: Katrin Honauer & Ole Johannsen                                 #
+#  Contact: contact@lightfield-analysis.net                                #
+#  Website: www.lightfield-analysis.net                                    #
+#                                                                          #
+#  This add-on is based upon work of Maximilian Diebold                    #
+#                                                                          #
+#  The 4D Light Field Benchmark was jointly created by the University of   #
+#  Konstanz and the HCI at Heidelberg University. If you use any part of   #
+#  the benchmark, please cite our paper "A dataset and evaluation          #
+#  methodology for depth estimation on 4D light fields". Thanks!           #
+#                                                                          #
+#  @inproceedings{honauer2016benchmark,                                    #
+#    title={A dataset and evaluation methodology for depth estimation on   #
+#           4D light fields},                                              #
+#    author={Honauer, Katrin and Johannsen, Ole and Kondermann, Daniel     #
+#            and Goldluecke, Bastian},                                     #
+#    booktitle={Asian Conference on Computer Vision},                      #
+#    year={2016},                                                          #
+#    organization={Springer}                                               #
+#    }                                                                     #
+#                                                                          #
+############################################################################
+
+
+"""
+Parameter sweeps over light field settings and .blend files, e.g.
+
+    python sweep.py sweep.json --blender /path/to/blender --max-parallel 2
+
+The sweep file is a json dict with the keys
+    blend_files:  list of .blend files
+    output_dir:   root directory of the sweep, each job renders into output_dir/<blend name>/<job id>
+    config:       optional light field config file loaded before the settings of a job
+    settings:     optional light field settings common to all jobs
+    grid:         optional dict of setting -> list of values, all combinations are rendered
+    variants:     optional list of setting dicts, rendered in addition to the grid
+
+Jobs with identical settings are rendered once. Jobs which differ only in settings that do not affect the
+center camera (e.g. fstop, or baseline, focus and grid size of odd grids) reuse the center depth map of the first
+of them.
+"""
+
+import argparse
+import concurrent.futures
+import hashlib
+import itertools
+import json
+import os
+import subprocess
+import sys
+
+# light field settings that do not change the depth map of the center camera
+DEPTH_INDEPENDENT_SETTINGS = {'fstop', 'num_blades',
+                              'rotation', 'cycles_seed', 'use_virtual_rig', 'frustum_min_disp', 'frustum_max_disp',
+                              'min_disp', 'max_disp', 'depth_postprocess_threads', 'use_direct_image_output',
+                              'image_output_format', 'image_output_threads', 'export_epis', 'rgb_views',
+                              'rgb_view_stride', 'rgb_view_list', 'scene', 'category', 'date', 'version',
+                              'authors', 'contact'}
+
+# settings which only keep the center camera on the grid axis without lens shift if the grid size is odd
+GRID_SETTINGS = {'baseline_mm', 'focus_dist', 'num_cams_x', 'num_cams_y'}
+
+JOB_FILE = 'job.json'
+DONE_FILE = 'job.done'
+LOG_FILE = 'render.log'
+
+
+def expand_variants(sweep):
+    """
+    Returns the list of setting dicts of a sweep, i.e. the common settings updated with each grid combination
+    and each explicit variant
+    """
+    common = sweep.get('settings', {})
+    variants = []
+
+    grid = sweep.get('grid', {})
+    if grid:
+        keys = sorted(grid)
+        for values in itertools.product(*[grid[key] for key in keys]):
+            variants.append(dict(zip(keys, values)))
+    variants.extend(sweep.get('variants', []))
+    if not variants:
+        variants.append({})
+
+    return [dict(common, **variant) for variant in variants]
+
+
+def get_key(data):
+    """
+    Returns a deterministic hash of json serializable data
+    """
+    return hashlib.sha1(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+
+
+def get_jobs(sweep, base_dir='.'):
+    """
+    Expands a sweep into a list of deduplicated jobs with deterministic output directories
+    """
+    output_dir = os.path.abspath(os.path.join(base_dir, sweep['output_dir']))
+    config = sweep.get('config')
+    if config:
+        config = os.path.abspath(os.path.join(base_dir, config))
+
+    jobs = []
+    job_ids = set()
+    depth_sources = dict()
+
+    for blend_file in sweep['blend_files']:
+        blend_file = os.path.abspath(os.path.join(base_dir, blend_file))
+        blend_name = os.path.splitext(os.path.basename(blend_file))[0]
+
+        for settings in expand_variants(sweep):
+            job_id = get_key([blend_file, config, settings])
+            if job_id in job_ids:
+                continue
+            job_ids.add(job_id)
+
+            job = {'id': job_id,
+                   'blend_file': blend_file,
+                   'config': config,
+                   'settings': settings,
+                   'tgt_dir': os.path.join(output_dir, blend_name, job_id),
+                   'depth_source_job': None,
+                   'depth_source_dir': None}
+
+            # the first job of each group with identical center camera renders the shared depth map
+            depth_key = get_depth_key(blend_file, config, settings)
+            if depth_key in depth_sources:
+                source = depth_sources[depth_key]
+                job['depth_source_job'] = source['id']
+                job['depth_source_dir'] = source['tgt_dir']
+            else:
+                depth_sources[depth_key] = job
+
+            jobs.append(job)
+
+    return jobs
+
+
+def get_depth_key(blend_file, config, settings):
+    """
+    Returns the key of jobs rendering the same center depth map. The grid size, baseline and focus only do not
+    matter if the job sets odd grid dimensions, otherwise the center camera is off-axis with a focus dependent shift.
+    """
+    independent = set(DEPTH_INDEPENDENT_SETTINGS)
+    if settings.get('num_cams_x', 0) % 2 == 1 and settings.get('num_cams_y', 0) % 2 == 1:
+        independent |= GRID_SETTINGS
+    return get_key([blend_file, config, {key: value for key, value in settings.items() if key not in independent}])
+
+
+def is_done(job):
+    return os.path.isfile(os.path.join(job['tgt_dir'], DONE_FILE))
+
+
+def run_job(job, blender, pool=None):
+    """
+    Renders a job in a background blender process or on a warm worker of the pool, returns whether it succeeded
+    """
+    os.makedirs(job['tgt_dir'], exist_ok=True)
+    job_file = os.path.join(job['tgt_dir'], JOB_FILE)
+    with open(job_file, 'w') as f:
+        json.dump(job, f, indent=4, sort_keys=True)
+
+    if pool is not None:
+        # the output of warm workers goes to their own logs
+        response = pool.run(job)
+        with open(os.path.join(job['tgt_dir'], LOG_FILE), 'w') as log:
+            json.dump(response, log, indent=4, sort_keys=True)
+        returncode = 0 if response['ok'] else 1
+    else:
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'headless.py')
+        command = [blender, '-b', job['blend_file'], '--python', script, '--', '--job', job_file]
+
+        with open(os.path.join(job['tgt_dir'], LOG_FILE), 'w') as log:
+            returncode = subprocess.call(command, stdout=log, stderr=subprocess.STDOUT)
+
+    if returncode != 0:
+        return False
+    open(os.path.join(job['tgt_dir'], DONE_FILE), 'w').close()
+    return True
+
+
+def run_jobs(jobs, blender, max_parallel=1, pool=None):
+    """
+    Runs jobs in at most max_parallel blender processes, or on the warm workers of a pool. Jobs sharing a depth
+    map wait for its job to finish, they render the depth map themselves if that job failed.
+    Returns the list of failed job ids.
+    """
+    pending = [job for job in jobs if not is_done(job)]
+    done = set(job['id'] for job in jobs if is_done(job))
+    failed = set()
+    running = dict()
+
+    print("%d jobs, %d done already" % (len(jobs), len(done)))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_parallel) as executor:
+        while pending or running:
+            for job in list(pending):
+                if len(running) >= max_parallel:
+                    break
+                source = job['depth_source_job']
+                if source is not None and source not in done and source not in failed:
+                    continue
+                if source in failed:
+                    job = dict(job, depth_source_job=None, depth_source_dir=None)
+
+                print("Starting job %s: %s" % (job['id'], json.dumps(job['settings'], sort_keys=True)))
+                pending = [pending_job for pending_job in pending if pending_job['id'] != job['id']]
+                running[executor.submit(run_job, job, blender, pool)] = job
+
+            finished, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished:
+                job = running.pop(future)
+                if future.result():
+                    done.add(job['id'])
+                    print("Finished job %s" % job['id'])
+                else:
+                    failed.add(job['id'])
+                    print("Job %s failed, see %s" % (job['id'], os.path.join(job['tgt_dir'], LOG_FILE)))
+
+    return sorted(failed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render a parameter sweep of light fields.')
+    parser.add_argument('sweep', help='sweep file (json)')
+    parser.add_argument('--blender', default='blender', help='blender executable')
+    parser.add_argument('--max-parallel', type=int, default=1, help='maximum number of blender processes')
+    parser.add_argument('--warm', action='store_true',
+                        help='render on max-parallel persistent blender processes, which keep .blend files open')
+    parser.add_argument('--dry-run', action='store_true', help='only write the job list')
+    args = parser.parse_args(argv)
+
+    with open(args.sweep) as f:
+        sweep = json.load(f)
+    jobs = get_jobs(sweep, os.path.dirname(os.path.abspath(args.sweep)))
+
+    # job list of the sweep, e.g. to look up the settings of an output directory
+    output_dir = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(args.sweep)), sweep['output_dir']))
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, 'jobs.json'), 'w') as f:
+        json.dump(jobs, f, indent=4, sort_keys=True)
+
+    if args.dry_run:
+        for job in jobs:
+            print("%s %s" % (job['tgt_dir'], json.dumps(job['settings'], sort_keys=True)))
+        return 0
+
+    if args.warm:
+        # only available when run as a script next to worker_pool.py, not as a module of the add-on
+        import worker_pool
+        with worker_pool.WorkerPool(args.blender, max(1, args.max_parallel), log_dir=output_dir) as pool:
+            failed = run_jobs(jobs, args.blender, max(1, args.max_parallel), pool)
+    else:
+        failed = run_jobs(jobs, args.blender, max(1, args.max_parallel))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
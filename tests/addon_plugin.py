@@ -0,0 +1,15 @@
+"""
+Pytest plugin of the tests, see pytest.ini. The bpy-free modules are imported as by the command line tools.
+"""
+
+import os
+
+import pytest
+
+ADDON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def pytest_collect_directory(path, parent):
+    # the add-on __init__ imports bpy, so its directory is not collected as python package
+    if str(path) == ADDON_DIR:
+        return pytest.Dir.from_parent(parent, path=path)
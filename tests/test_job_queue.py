@@ -0,0 +1,112 @@
+import json
+import os
+import time
+
+from job_queue import JobQueue
+
+
+def make_queues(tmp_path, lease_seconds=60):
+    return JobQueue(str(tmp_path), lease_seconds, 'a'), JobQueue(str(tmp_path), lease_seconds, 'b')
+
+
+def expire(queue, task):
+    old = time.time() - 2 * queue.lease_seconds
+    os.utime(queue.get_lock_path(task), (old, old))
+
+
+def test_lease_is_exclusive(tmp_path):
+    a, b = make_queues(tmp_path)
+    assert a.try_claim('frame_1')
+    assert not b.try_claim('frame_1')
+    assert a.get_owner('frame_1') == 'a'
+    assert a.get_status(['frame_1', 'frame_2']) == {'frame_1': 'leased', 'frame_2': 'open'}
+
+
+def test_complete_and_release(tmp_path):
+    a, b = make_queues(tmp_path)
+    assert a.try_claim('frame_1')
+    a.complete('frame_1')
+    assert a.is_done('frame_1')
+    assert not b.try_claim('frame_1')
+
+    assert a.try_claim('frame_2')
+    a.release('frame_2')
+    assert b.try_claim('frame_2')
+
+
+def test_release_keeps_lease_of_other_worker(tmp_path):
+    a, b = make_queues(tmp_path)
+    assert b.try_claim('frame_1')
+    a.release('frame_1')
+    assert a.get_owner('frame_1') == 'b'
+
+
+def test_expired_lease_is_reclaimed(tmp_path):
+    a, b = make_queues(tmp_path)
+    assert a.try_claim('frame_1')
+    expire(a, 'frame_1')
+    assert b.get_status(['frame_1']) == {'frame_1': 'expired'}
+    assert b.try_claim('frame_1')
+    assert b.get_owner('frame_1') == 'b'
+    assert not [name for name in os.listdir(str(tmp_path)) if name.endswith('.stale')]
+
+
+def test_reclaim_restores_renewed_lease(tmp_path):
+    a, b = make_queues(tmp_path)
+    assert a.try_claim('frame_1')
+    # the lease was renewed between the age check and the rename
+    b.reclaim('frame_1')
+    assert a.get_owner('frame_1') == 'a'
+
+
+def test_heartbeat_renews_lease(tmp_path):
+    a, _ = make_queues(tmp_path)
+    assert a.try_claim('frame_1')
+    expire(a, 'frame_1')
+    a.heartbeat()
+    assert a.get_lease_age('frame_1') < a.lease_seconds
+    assert 'frame_1' in a.held
+
+
+def test_heartbeat_keeps_task_while_lock_is_checked(tmp_path):
+    a, _ = make_queues(tmp_path)
+    assert a.try_claim('frame_1')
+    lock_path = a.get_lock_path('frame_1')
+    os.rename(lock_path, lock_path + '.b.stale')
+    a.heartbeat()
+    assert 'frame_1' in a.held
+
+
+def test_heartbeat_drops_task_reclaimed_by_other_worker(tmp_path):
+    a, _ = make_queues(tmp_path)
+    assert a.try_claim('frame_1')
+    with open(a.get_lock_path('frame_1'), 'w') as f:
+        json.dump({'worker': 'b'}, f)
+    a.heartbeat()
+    assert 'frame_1' not in a.held
+
+
+def test_iter_tasks_claims_all_tasks(tmp_path):
+    a, _ = make_queues(tmp_path)
+    done = []
+    for task in a.iter_tasks(['frame_1', 'frame_2']):
+        done.append(task)
+        a.complete(task)
+    assert done == ['frame_1', 'frame_2']
+
+
+def test_iter_tasks_yields_none_while_waiting(tmp_path):
+    a, b = make_queues(tmp_path)
+    assert b.try_claim('frame_1')
+    tasks = a.iter_tasks(['frame_1'], poll_seconds=60, block=False)
+    assert next(tasks) is None
+    assert next(tasks) is None
+
+
+def test_iter_tasks_ends_when_other_worker_completes(tmp_path):
+    a, b = make_queues(tmp_path)
+    assert b.try_claim('frame_1')
+    tasks = a.iter_tasks(['frame_1'], poll_seconds=0, block=False)
+    assert next(tasks) is None
+    b.complete('frame_1')
+    assert list(tasks) == []
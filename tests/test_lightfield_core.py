@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from lightfield_core import (get_integer_scale, median_downsampling, mode_downsampling, normal_downsampling,
+                             postprocess_depth_map, read_pfm, tile_statistics)
+
+
+def test_median_downsampling_takes_upper_median_per_tile():
+    img = np.arange(16, dtype=np.float32).reshape(4, 4)
+    small = median_downsampling(img, 2, 2)
+    # tiles [[0, 1], [4, 5]] etc., the median of 4 values is the third sorted value
+    np.testing.assert_array_equal(small, [[4, 6], [12, 14]])
+
+
+def test_median_downsampling_rejects_partial_tiles():
+    with pytest.raises(Exception):
+        median_downsampling(np.zeros((5, 4)), 2, 2)
+
+
+def test_tile_statistics_matches_median_downsampling():
+    img = np.random.RandomState(0).uniform(1, 10, (12, 18)).astype(np.float32)
+    stats = tile_statistics(img, 3, 3)
+    np.testing.assert_array_equal(stats['median'], median_downsampling(img, 3, 3))
+
+    tiles = img.reshape(4, 3, 6, 3).transpose([0, 2, 1, 3]).reshape(4, 6, 9)
+    np.testing.assert_allclose(stats['min'], tiles.min(axis=2))
+    np.testing.assert_allclose(stats['max'], tiles.max(axis=2))
+    np.testing.assert_allclose(stats['mean'], tiles.mean(axis=2), rtol=1e-6)
+    np.testing.assert_allclose(stats['std'], tiles.std(axis=2), rtol=1e-5)
+    assert stats['median'].dtype == img.dtype
+
+
+def test_tile_statistics_marks_discontinuities():
+    img = np.ones((4, 4), dtype=np.float32)
+    img[0, 0] = 2.0
+    edges = tile_statistics(img, 2, 2, edge_threshold=0.05)['edges']
+    np.testing.assert_array_equal(edges, [[True, False], [False, False]])
+
+
+def test_tile_statistics_only_median_unless_full():
+    stats = tile_statistics(np.ones((4, 4), dtype=np.float32), 2, 2, full=False)
+    assert set(stats) == {'median'}
+
+
+def test_mode_downsampling_breaks_ties_by_smallest_label():
+    labels = np.array([[3, 3, 1, 2],
+                       [3, 1, 2, 1]])
+    np.testing.assert_array_equal(mode_downsampling(labels, 2, 2), [[3, 1]])
+
+
+def test_normal_downsampling_is_normalized():
+    normals = np.zeros((2, 2, 3), dtype=np.float32)
+    normals[:, 0] = [1, 0, 0]
+    normals[:, 1] = [0, 0, 1]
+    small = normal_downsampling(normals, 2, 2)
+    np.testing.assert_allclose(small[0, 0], [np.sqrt(0.5), 0, np.sqrt(0.5)], rtol=1e-6)
+
+
+def test_get_integer_scale():
+    assert get_integer_scale(10.0) == 10
+    for value in [2.5, 0]:
+        with pytest.raises(ValueError):
+            get_integer_scale(value)
+
+
+def test_postprocess_depth_map_fixes_artefacts(tmp_path):
+    depth = np.full((8, 8), 5.0, dtype=np.float32)
+    depth[3, 4] = 100.0
+    fpaths = {'depth_highres': [str(tmp_path / 'highres.pfm')], 'depth_lowres': [str(tmp_path / 'lowres.pfm')],
+              'depth_lowres_max': [str(tmp_path / 'max.pfm')]}
+    postprocess_depth_map(depth, 2, (0.05, 50.0, 5.0, 36.0, 4), fpaths)
+
+    np.testing.assert_allclose(read_pfm(fpaths['depth_highres'][0]), 5.0)
+    np.testing.assert_allclose(read_pfm(fpaths['depth_lowres'][0]), 5.0)
+    np.testing.assert_allclose(read_pfm(fpaths['depth_lowres_max'][0]), 5.0)
@@ -0,0 +1,62 @@
+import os
+
+from sweep import expand_variants, get_jobs
+
+
+def make_sweep(**kwargs):
+    sweep = {'blend_files': ['scene.blend'], 'output_dir': 'out'}
+    sweep.update(kwargs)
+    return sweep
+
+
+def test_expand_variants_combines_grid_and_variants():
+    sweep = make_sweep(settings={'fstop': 2.0}, grid={'x_res': [256, 512], 'y_res': [256]},
+                       variants=[{'fstop': 8.0}])
+    assert expand_variants(sweep) == [{'fstop': 2.0, 'x_res': 256, 'y_res': 256},
+                                      {'fstop': 2.0, 'x_res': 512, 'y_res': 256},
+                                      {'fstop': 8.0}]
+
+
+def test_get_jobs_deduplicates_identical_settings(tmp_path):
+    sweep = make_sweep(grid={'x_res': [256]}, variants=[{'x_res': 256}, {'x_res': 512}])
+    jobs = get_jobs(sweep, str(tmp_path))
+    assert [job['settings'] for job in jobs] == [{'x_res': 256}, {'x_res': 512}]
+    assert len({job['tgt_dir'] for job in jobs}) == 2
+    assert all(job['tgt_dir'].startswith(os.path.join(str(tmp_path), 'out', 'scene')) for job in jobs)
+
+
+def test_get_jobs_is_deterministic(tmp_path):
+    sweep = make_sweep(grid={'fstop': [2.0, 4.0]})
+    assert get_jobs(sweep, str(tmp_path)) == get_jobs(sweep, str(tmp_path))
+
+
+def test_get_jobs_shares_depth_of_depth_independent_settings(tmp_path):
+    jobs = get_jobs(make_sweep(grid={'fstop': [2.0, 4.0, 8.0]}), str(tmp_path))
+    assert jobs[0]['depth_source_job'] is None
+    for job in jobs[1:]:
+        assert job['depth_source_job'] == jobs[0]['id']
+        assert job['depth_source_dir'] == jobs[0]['tgt_dir']
+
+
+def test_get_jobs_renders_depth_of_different_center_cameras(tmp_path):
+    jobs = get_jobs(make_sweep(grid={'focal_length': [35.0, 50.0]}), str(tmp_path))
+    assert [job['depth_source_job'] for job in jobs] == [None, None]
+
+
+def test_get_jobs_shares_depth_across_odd_grids_only(tmp_path):
+    odd = get_jobs(make_sweep(settings={'num_cams_x': 9, 'num_cams_y': 9}, grid={'baseline_mm': [50.0, 90.0]}),
+                   str(tmp_path))
+    assert odd[1]['depth_source_job'] == odd[0]['id']
+
+    even = get_jobs(make_sweep(settings={'num_cams_x': 8, 'num_cams_y': 8}, grid={'baseline_mm': [50.0, 90.0]}),
+                    str(tmp_path))
+    assert [job['depth_source_job'] for job in even] == [None, None]
+
+    sizes = get_jobs(make_sweep(variants=[{'num_cams_x': 9, 'num_cams_y': 9}, {'num_cams_x': 8, 'num_cams_y': 8}]),
+                     str(tmp_path))
+    assert [job['depth_source_job'] for job in sizes] == [None, None]
+
+
+def test_get_jobs_does_not_share_depth_across_blend_files(tmp_path):
+    jobs = get_jobs(make_sweep(blend_files=['a.blend', 'b.blend']), str(tmp_path))
+    assert [job['depth_source_job'] for job in jobs] == [None, None]
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from view_selection import get_center_view, get_key_view_mask, get_view_mask, parse_view_list
+
+
+def test_parse_view_list_indices_and_ranges():
+    assert parse_view_list("0, 4, 10-12", 16) == [0, 4, 10, 11, 12]
+    assert parse_view_list("3; 1,, 3", 16) == [1, 3]
+    assert parse_view_list("", 16) == []
+
+
+@pytest.mark.parametrize('view_list', ["16", "-1", "14-16", "a", "1-b"])
+def test_parse_view_list_rejects_invalid_indices(view_list):
+    with pytest.raises(ValueError):
+        parse_view_list(view_list, 16)
+
+
+@pytest.mark.parametrize('num_cams_x, num_cams_y, center',
+                         [(9, 9, (4, 4)), (4, 4, (1, 1)), (5, 2, (0, 2)), (1, 1, (0, 0))])
+def test_get_center_view(num_cams_x, num_cams_y, center):
+    assert get_center_view(num_cams_x, num_cams_y) == center
+
+
+@pytest.mark.parametrize('num_cams_x, num_cams_y', [(5, 5), (4, 4), (6, 3)])
+def test_center_pattern_selects_center_view(num_cams_x, num_cams_y):
+    mask = get_view_mask('CENTER', num_cams_x, num_cams_y)
+    assert mask.sum() == 1
+    assert mask[get_center_view(num_cams_x, num_cams_y)]
+
+
+def test_cross_and_stride_patterns_contain_center_view():
+    for pattern in ['CROSS', 'STRIDE', 'CHECKERBOARD']:
+        assert get_view_mask(pattern, 4, 4, stride=2)[get_center_view(4, 4)]
+    np.testing.assert_array_equal(get_view_mask('CROSS', 3, 3), [[False, True, False],
+                                                                 [True, True, True],
+                                                                 [False, True, False]])
+
+
+def test_list_pattern_uses_flat_indices():
+    mask = get_view_mask('LIST', 4, 3, view_list="1, 7")
+    assert list(np.flatnonzero(mask)) == [1, 7]
+    assert mask[1, 3]
+
+
+def test_unknown_pattern():
+    with pytest.raises(ValueError):
+        get_view_mask('DIAGONAL', 3, 3)
+
+
+def test_key_view_mask_includes_last_row_and_column():
+    mask = get_key_view_mask(5, 5, 2)
+    assert mask[0, 0] and mask[4, 4] and mask[0, 4]
+    assert not mask[1, 1]
@@ -78,6 +78,42 @@ def update_number_of_cameras(self, context):
     update_lightfield(self, context)
 
 
+def update_setup_number(self, context):
+    """
+    update function for the active rig, stores the settings of the previous rig and loads the settings stored with
+    the new one
+    """
+    LF = bpy.context.scene.LF
+    if LF.setup_number_hidden == LF.setup_number:
+        return
+    LF.store_rig_settings(LF.setup_number_hidden)
+    LF.setup_number_hidden = LF.setup_number
+    try:
+        settings = bpy.data.objects[LF.get_lightfield_name()]['LF_settings'].to_dict()
+    except KeyError:
+        return
+    settings.pop('setup_number', None)
+    settings.pop('setup_number_hidden', None)
+    LF.set_settings(settings)
+
+
+def update_save_depth_for_all_views(self, context):
+    """
+    update function for legacy depth flag, maps it to the depth and disparity view selection
+    """
+    LF = bpy.context.scene.LF
+    LF.depth_views = 'ALL' if LF.save_depth_for_all_views else 'CENTER'
+    LF.disp_views = LF.depth_views
+
+
+def update_save_object_id_maps_for_all_views(self, context):
+    """
+    update function for legacy object id flag, maps it to the object id view selection
+    """
+    LF = bpy.context.scene.LF
+    LF.object_id_views = 'ALL' if LF.save_object_id_maps_for_all_views else 'CENTER'
+
+
 def update_target_directory(self, context):
     """
     update function for target directory
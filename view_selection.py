@@ -0,0 +1,131 @@
+############################################################################
+#  This file is part of the 4D Light Field Benchmark.                      #
+#                                                                          #
+#  This work is licensed under the Creative Commons                        #
+#  Attribution-NonCommercial-ShareAlike 4.0 International License.         #
+#  To view a copy of this license,                                         #
+#  visit http://creativecommons.org/licenses/by-nc-sa/4.0/.                #
+#                                                                          #
+#  Authors: Katrin Honauer & Ole Johannsen                                 #
+#  Contact: contact@lightfield-analysis.net                                #
+#  Website: www.lightfield-analysis.net                                    #
+#                                                                          #
+#  This add-on is based upon work of Maximilian Diebold                    #
+#                                                                          #
+#  The 4D Light Field Benchmark was jointly created by the University of   #
+#  Konstanz and the HCI at Heidelberg University. If you use any part of   #
+#  the benchmark, please cite our paper "A dataset and evaluation          #
+#  methodology for depth estimation on 4D light fields". Thanks!           #
+#                                                                          #
+#  @inproceedings{honauer2016benchmark,                                    #
+#    title={A dataset and evaluation methodology for depth estimation on   #
+#           4D light fields},                                              #
+#    author={Honauer, Katrin and Johannsen, Ole and Kondermann, Daniel     #
+#            and Goldluecke, Bastian},                                     #
+#    booktitle={Asian Conference on Computer Vision},                      #
+#    year={2016},                                                          #
+#    organization={Springer}                                               #
+#    }                                                                     #
+#                                                                          #
+############################################################################
+
+
+import numpy as np
+
+
+# view selection patterns as (identifier, name, description) for the UI
+VIEW_PATTERNS = [
+    ('ALL', 'All views', 'Select all views of the camera grid'),
+    ('CENTER', 'Center view', 'Select only the center view'),
+    ('CROSS', 'Cross', 'Select the horizontal and vertical cross through the center view'),
+    ('BORDER', 'Border', 'Select the outermost ring of views of the camera grid'),
+    ('CHECKERBOARD', 'Checkerboard', 'Select every other view in a checkerboard pattern including the center view'),
+    ('STRIDE', 'Stride', 'Select every k-th view in x and y direction, aligned to the center view'),
+    ('LIST', 'List', 'Select an explicit list of view indices, e.g. "0, 4, 10-12"'),
+]
+
+# products which can be rendered for a selection of views
+VIEW_PRODUCTS = ['rgb', 'depth', 'disp', 'object_id']
+
+
+def parse_view_list(view_list, num_views):
+    """
+    Parses a comma separated list of view indices and index ranges, e.g. "0, 4, 10-12".
+    """
+    indices = set()
+    for token in view_list.replace(';', ',').split(','):
+        token = token.strip()
+        if not token:
+            continue
+        if '-' in token:
+            start, end = token.split('-', 1)
+            indices.update(range(int(start), int(end) + 1))
+        else:
+            indices.add(int(token))
+
+    invalid = [idx for idx in indices if idx < 0 or idx >= num_views]
+    if invalid:
+        raise ValueError("View indices out of range [0, %d): %s" % (num_views, sorted(invalid)))
+
+    return sorted(indices)
+
+
+def get_center_view(num_cams_x, num_cams_y):
+    """
+    Returns the grid position (row, col) of the center view, on even grids the view before the grid center
+    """
+    return (num_cams_y - 1) // 2, (num_cams_x - 1) // 2
+
+
+def get_view_mask(pattern, num_cams_x, num_cams_y, stride=1, view_list=''):
+    """
+    Returns a boolean mask of shape (num_cams_y, num_cams_x) with the selected views of the camera grid.
+    """
+    rows, cols = np.mgrid[0:num_cams_y, 0:num_cams_x]
+    center_row, center_col = get_center_view(num_cams_x, num_cams_y)
+
+    if pattern == 'ALL':
+        mask = np.ones((num_cams_y, num_cams_x), dtype=bool)
+    elif pattern == 'CENTER':
+        mask = (rows == center_row) & (cols == center_col)
+    elif pattern == 'CROSS':
+        mask = (rows == center_row) | (cols == center_col)
+    elif pattern == 'BORDER':
+        mask = (rows == 0) | (rows == num_cams_y - 1) | (cols == 0) | (cols == num_cams_x - 1)
+    elif pattern == 'CHECKERBOARD':
+        mask = (rows + cols) % 2 == (center_row + center_col) % 2
+    elif pattern == 'STRIDE':
+        stride = max(1, int(stride))
+        mask = ((rows - center_row) % stride == 0) & ((cols - center_col) % stride == 0)
+    elif pattern == 'LIST':
+        mask = np.zeros(num_cams_y * num_cams_x, dtype=bool)
+        mask[parse_view_list(view_list, num_cams_y * num_cams_x)] = True
+        mask = mask.reshape((num_cams_y, num_cams_x))
+    else:
+        raise ValueError("Unknown view selection pattern: '%s'" % pattern)
+
+    return mask
+
+
+def get_key_view_mask(num_cams_x, num_cams_y, stride):
+    """
+    Returns the mask of key views rendered for view synthesis, i.e. every stride-th row and column of the grid
+    including the last ones, so that every view lies between key views.
+    """
+    stride = max(1, int(stride))
+    rows = sorted(set(range(0, num_cams_y, stride)) | {num_cams_y - 1})
+    cols = sorted(set(range(0, num_cams_x, stride)) | {num_cams_x - 1})
+    mask = np.zeros((num_cams_y, num_cams_x), dtype=bool)
+    mask[np.ix_(rows, cols)] = True
+    return mask
+
+
+def get_surrounding_key_views(key_mask, i, j):
+    """
+    Returns the grid positions of the up to four key views on the enclosing key rows and columns of view (i, j)
+    """
+    key_rows = np.flatnonzero(np.any(key_mask, axis=1))
+    key_cols = np.flatnonzero(np.any(key_mask, axis=0))
+    rows = sorted({int(key_rows[key_rows <= i].max()), int(key_rows[key_rows >= i].min())})
+    cols = sorted({int(key_cols[key_cols <= j].max()), int(key_cols[key_cols >= j].min())})
+    return [(row, col) for row in rows for col in cols if key_mask[row, col]]
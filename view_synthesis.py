@@ -0,0 +1,135 @@
+############################################################################
+#  This file is part of the 4D Light Field Benchmark.                      #
+#                                                                          #
+#  This work is licensed under the Creative Commons                        #
+#  Attribution-NonCommercial-ShareAlike 4.0 International License.         #
+#  To view a copy of this license,                                         #
+#  visit http://creativecommons.org/licenses/by-nc-sa/4.0/.                #
+#                                                                          #
+#  Authors: Katrin Honauer & Ole Johannsen                                 #
+#  Contact: contact@lightfield-analysis.net                                #
+#  Website: www.lightfield-analysis.net                                    #
+#                                                                          #
+#  This add-on is based upon work of Maximilian Diebold                    #
+#                                                                          #
+#  The 4D Light Field Benchmark was jointly created by the University of   #
+#  Konstanz and the HCI at Heidelberg University. If you use any part of   #
+#  the benchmark, please cite our paper "A dataset and evaluation          #
+#  methodology for depth estimation on 4D light fields". Thanks!           #
+#                                                                          #
+#  @inproceedings{honauer2016benchmark,                                    #
+#    title={A dataset and evaluation methodology for depth estimation on   #
+#           4D light fields},                                              #
+#    author={Honauer, Katrin and Johannsen, Ole and Kondermann, Daniel     #
+#            and Goldluecke, Bastian},                                     #
+#    booktitle={Asian Conference on Computer Vision},                      #
+#    year={2016},                                                          #
+#    organization={Springer}                                               #
+#    }                                                                     #
+#                                                                          #
+############################################################################
+
+
+"""
+Depth image based synthesis of intermediate views of a camera grid from rendered key views.
+Images are top-down arrays (h, w, c). A scene point with disparity (dy, dx) per grid step, i.e. the ground truth
+disparity scaled by the vertical and horizontal baseline, appears at (y - dy * di, x - dx * dj) in the view
+(di, dj) grid steps away.
+"""
+
+import numpy as np
+
+
+def forward_warp(view, depth, disp_y, disp_x, di, dj):
+    """
+    Warps a view with depth and disparity maps (h, w) by (di, dj) grid steps with z-buffered splatting.
+    Returns the warped view (h, w, c) and its depth (h, w), which is inf where no pixel was splatted.
+    """
+    height, width, channels = np.shape(view)
+    ys, xs = np.mgrid[0:height, 0:width]
+    ty = np.round(ys - disp_y * di).astype(np.int64).ravel()
+    tx = np.round(xs - disp_x * dj).astype(np.int64).ravel()
+    z = np.asarray(depth, dtype=np.float32).ravel()
+
+    inside = (ty >= 0) & (ty < height) & (tx >= 0) & (tx < width) & np.isfinite(z)
+    source = np.flatnonzero(inside)
+    target = ty[inside] * width + tx[inside]
+
+    # the closest source pixel wins each target pixel
+    order = np.lexsort((z[source], target))
+    target = target[order]
+    source = source[order]
+    first = np.ones(len(target), dtype=bool)
+    first[1:] = target[1:] != target[:-1]
+
+    warped = np.zeros((height * width, channels), dtype=np.float32)
+    warped_depth = np.full(height * width, np.inf, dtype=np.float32)
+    warped[target[first]] = np.reshape(view, (-1, channels))[source[first]]
+    warped_depth[target[first]] = z[source[first]]
+    return warped.reshape((height, width, channels)), warped_depth.reshape((height, width))
+
+
+def blend_warps(warps, warp_depths, weights, depth_tolerance=0.01):
+    """
+    Blends warped views of several key views. Per pixel, only warps within depth_tolerance (relative) of the
+    closest warp contribute, weighted by weights. Returns the view, a mask of valid pixels and the weighted
+    standard deviation of the contributions as error estimate.
+    """
+    warps = np.asarray(warps, dtype=np.float32)
+    warp_depths = np.asarray(warp_depths, dtype=np.float32)
+    min_depth = np.min(warp_depths, axis=0)
+    valid = np.isfinite(min_depth)
+
+    contributes = np.isfinite(warp_depths) & (warp_depths <= min_depth * (1 + depth_tolerance))
+    w = contributes * np.reshape(weights, (-1, 1, 1)).astype(np.float32)
+    w_sum = np.maximum(np.sum(w, axis=0), 1e-12)[:, :, np.newaxis]
+
+    view = np.sum(w[:, :, :, np.newaxis] * warps, axis=0) / w_sum
+    variance = np.sum(w[:, :, :, np.newaxis] * (warps - view) ** 2, axis=0) / w_sum
+    error = np.sqrt(np.mean(variance, axis=2))
+    return view, valid, error
+
+
+def fill_cracks(view, valid, min_neighbours=5):
+    """
+    Fills invalid pixels with at least min_neighbours valid pixels in their 8-neighbourhood, e.g. cracks of
+    splatting, with the mean of these neighbours. Returns the view, the valid mask and the mask of filled pixels.
+    """
+    height, width = np.shape(valid)
+    padded_view = np.pad(view, ((1, 1), (1, 1), (0, 0)), mode='constant')
+    padded_valid = np.pad(valid, 1, mode='constant')
+
+    total = np.zeros(np.shape(view), dtype=np.float32)
+    count = np.zeros((height, width), dtype=np.int32)
+    for dy in [0, 1, 2]:
+        for dx in [0, 1, 2]:
+            if dy == 1 and dx == 1:
+                continue
+            neighbour_valid = padded_valid[dy:dy + height, dx:dx + width]
+            total += neighbour_valid[:, :, np.newaxis] * padded_view[dy:dy + height, dx:dx + width]
+            count += neighbour_valid
+
+    filled = ~valid & (count >= min_neighbours)
+    view = np.array(view)
+    view[filled] = total[filled] / count[filled][:, np.newaxis]
+    return view, valid | filled, filled
+
+
+def synthesize_view(key_views, depth_tolerance=0.01):
+    """
+    Synthesizes a view from key views given as list of (view, depth, disp_y, disp_x, di, dj), where (di, dj) are the
+    grid steps from the key view to the synthesized view. Returns the view (h, w, c), the mask of pixels which
+    could not be synthesized, the mask of filled cracks and the error estimate (h, w).
+    """
+    warps = []
+    warp_depths = []
+    weights = []
+    for view, depth, disp_y, disp_x, di, dj in key_views:
+        warp, warp_depth = forward_warp(view, depth, disp_y, disp_x, di, dj)
+        warps.append(warp)
+        warp_depths.append(warp_depth)
+        weights.append(1.0 / max(1e-6, np.hypot(di, dj)))
+
+    view, valid, error = blend_warps(warps, warp_depths, weights, depth_tolerance)
+    view, valid, filled = fill_cracks(view, valid)
+    return view, ~valid, filled, error
@@ -0,0 +1,107 @@
+############################################################################
+#  This file is part of the 4D Light Field Benchmark.                      #
+#                                                                          #
+#  This work is licensed under the Creative Commons                        #
+#  Attribution-NonCommercial-ShareAlike 4.0 International License.         #
+#  To view a copy of this license,                                         #
+#  visit http://creativecommons.org/licenses/by-nc-sa/4.0/.                #
+#                                                                          #
+#  Authors: Katrin Honauer & Ole Johannsen                                 #
+#  Contact: contact@lightfield-analysis.net                                #
+#  Website: www.lightfield-analysis.net                                    #
+#                                                                          #
+#  This add-on is based upon work of Maximilian Diebold                    #
+#                                                                          #
+#  The 4D Light Field Benchmark was jointly created by the University of   #
+#  Konstanz and the HCI at Heidelberg University. If you use any part of   #
+#  the benchmark, please cite our paper "A dataset and evaluation          #
+#  methodology for depth estimation on 4D light fields". Thanks!           #
+#                                                                          #
+#  @inproceedings{honauer2016benchmark,                                    #
+#    title={A dataset and evaluation methodology for depth estimation on   #
+#           4D light fields},                                              #
+#    author={Honauer, Katrin and Johannsen, Ole and Kondermann, Daniel     #
+#            and Goldluecke, Bastian},                                     #
+#    booktitle={Asian Conference on Computer Vision},                      #
+#    year={2016},                                                          #
+#    organization={Springer}                                               #
+#    }                                                                     #
+#                                                                          #
+############################################################################
+
+
+import bpy
+
+import collections
+
+import numpy as np
+
+from . import lightfield_core
+
+
+# a view of a virtual rig, name and index follow the names of real grid cameras
+VirtualView = collections.namedtuple('VirtualView', ['name', 'index', 'x', 'y'])
+
+# maximum number of previewed cameras per grid direction
+max_preview_cams = 33
+
+
+def get_view(LF, i, j):
+    """
+    Returns the virtual view of grid row i and column j, positions are relative to the rig container
+    """
+    cam_x, cam_y = lightfield_core.get_camera_axes(LF.num_cams_x, LF.num_cams_y, LF.baseline_x_m, LF.baseline_y_m)
+    return VirtualView(LF.get_camera_name(i, j), int(i * LF.num_cams_x + j), float(cam_x[j]), float(cam_y[i]))
+
+
+def get_shift_factor(LF):
+    """
+    Returns the factor from camera position to lens shift which focuses the grid at the focus distance
+    """
+    return lightfield_core.get_shift_factor(LF.focal_length, LF.sensor_size, LF.focus_dist)
+
+
+def set_view(LF, view):
+    """
+    Moves and shifts the single camera of a virtual rig to the given view
+    """
+    camera = bpy.data.objects[LF.get_virtual_camera_name()]
+    factor = get_shift_factor(LF)
+    camera.location = (view.x, view.y, 0)
+    camera.data.shift_x = -view.x * factor
+    camera.data.shift_y = -view.y * factor
+    return camera
+
+
+def get_preview_positions(LF):
+    """
+    Returns the camera positions (N, 3) drawn in the preview, large grids are subsampled keeping the corners
+    """
+    rows = np.unique(np.round(np.linspace(0, LF.num_cams_y - 1, min(LF.num_cams_y, max_preview_cams))))
+    cols = np.unique(np.round(np.linspace(0, LF.num_cams_x - 1, min(LF.num_cams_x, max_preview_cams))))
+    cam_x, cam_y = lightfield_core.get_camera_axes(LF.num_cams_x, LF.num_cams_y, LF.baseline_x_m, LF.baseline_y_m)
+    x, y = np.meshgrid(cam_x[cols.astype(int)], cam_y[rows.astype(int)])
+    return np.stack([x.ravel(), y.ravel(), np.zeros(x.size)], axis=1)
+
+
+def create_preview(LF, camera):
+    """
+    Creates a proxy mesh with one vertex per previewed camera, which instances a copy of the camera
+    """
+    mesh_data = bpy.data.meshes.new("VirtualGridMeshData")
+    mesh_data.from_pydata([tuple(position) for position in get_preview_positions(LF)], [], [])
+    mesh_data.update()
+
+    grid = bpy.data.objects.new(LF.get_virtual_grid_name(), mesh_data)
+    grid.dupli_type = 'VERTS'
+    grid.hide_render = True
+    bpy.context.scene.objects.link(grid)
+
+    preview_camera = bpy.data.objects.new(LF.get_virtual_grid_name() + "Cam", camera.data.copy())
+    preview_camera.data.shift_x = 0
+    preview_camera.data.shift_y = 0
+    preview_camera.parent = grid
+    preview_camera.hide_select = True
+    bpy.context.scene.objects.link(preview_camera)
+
+    return grid
@@ -0,0 +1,259 @@
+############################################################################
+#  This file is part of the 4D Light Field Benchmark.                      #
+#                                                                          #
+#  This work is licensed under the Creative Commons                        #
+#  Attribution-NonCommercial-ShareAlike 4.0 International License.         #
+#  To view a copy of this license,                                         #
+#  visit http://creativecommons.org/licenses/by-nc-sa/4.0/.                #
+#                                                                          #
+#  Authors: Katrin Honauer & Ole Johannsen                                 #
+#  Contact: contact@lightfield-analysis.net                                #
+#  Website: www.lightfield-analysis.net                                    #
+#                                                                          #
+#  This add-on is based upon work of Maximilian Diebold                    #
+#                                                                          #
+#  The 4D Light Field Benchmark was jointly created by the University of   #
+#  Konstanz and the HCI at Heidelberg University. If you use any part of   #
+#  the benchmark, please cite our paper "A dataset and evaluation          #
+#  methodology for depth estimation on 4D light fields". Thanks!           #
+#                                                                          #
+#  @inproceedings{honauer2016benchmark,                                    #
+#    title={A dataset and evaluation methodology for depth estimation on   #
+#           4D light fields},                                              #
+#    author={Honauer, Katrin and Johannsen, Ole and Kondermann, Daniel     #
+#            and Goldluecke, Bastian},                                     #
+#    booktitle={Asian Conference on Computer Vision},                      #
+#    year={2016},                                                          #
+#    organization={Springer}                                               #
+#    }                                                                     #
+#                                                                          #
+############################################################################
+
+
+
+"""
+Warm pool of background blender processes rendering light field jobs, e.g.
+
+    python worker_pool.py jobs.json --blender /path/to/blender --workers 2 --blend scene.blend
+
+Each worker runs headless.py --serve and keeps its .blend file open between jobs, so that jobs of the same file
+skip starting blender, loading the file and registering the add-on. Jobs are dicts as for headless.py with the
+additional key 'blend_file'. A worker which dies is restarted for the next job.
+"""
+
+import argparse
+import concurrent.futures
+import json
+import os
+import queue
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+# seconds to wait for a started worker to accept connections
+STARTUP_TIMEOUT = 300
+
+# seconds after which a worker rendering a job is considered hung and killed
+JOB_TIMEOUT = 24 * 3600
+
+# line printed by headless.py --serve with the port it listens on
+READY_PATTERN = re.compile(r'^Worker ready on port (\d+)')
+
+# environment variable passing the request token to headless.py --serve
+TOKEN_VARIABLE = 'LF_WORKER_TOKEN'
+
+
+class WorkerUnavailable(RuntimeError):
+    """
+    Raised if a worker cannot be reached, so that the job was not sent
+    """
+
+
+class Worker:
+    """
+    A background blender process serving jobs on a local port, which the process picks and reports on its output.
+    Requests carry the token, without which the process rejects them.
+    """
+
+    def __init__(self, blender, blend_file=None, log_fpath=None, job_timeout=JOB_TIMEOUT, token=None):
+        self.blender = blender
+        self.blend_file = blend_file
+        self.log_fpath = log_fpath
+        self.job_timeout = job_timeout
+        self.token = token or uuid.uuid4().hex
+        self.process = None
+        self.port = None
+        self.ready = threading.Event()
+        self.output_thread = None
+
+    def start(self):
+        # the output thread of a previous process closes its log once the process is gone
+        if self.output_thread is not None:
+            self.output_thread.join()
+
+        self.port = None
+        self.ready = threading.Event()
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'headless.py')
+        command = [self.blender, '-b'] + ([self.blend_file] if self.blend_file else []) + \
+            ['--python', script, '--', '--serve', '--port', '0']
+        # the token is passed in the environment, which unlike the command line is private to the user
+        env = dict(os.environ)
+        env[TOKEN_VARIABLE] = self.token
+        self.process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                        universal_newlines=True, env=env)
+        log = open(self.log_fpath, 'a') if self.log_fpath else None
+        self.output_thread = threading.Thread(target=self.read_output, args=(self.process, log, self.ready))
+        self.output_thread.daemon = True
+        self.output_thread.start()
+
+    def read_output(self, process, log, ready):
+        """
+        Copies the output of a process to its log until it exits and reads the port from the ready line
+        """
+        try:
+            for line in process.stdout:
+                match = READY_PATTERN.match(line)
+                if match and not ready.is_set():
+                    self.port = int(match.group(1))
+                    ready.set()
+                if log is not None:
+                    log.write(line)
+                    log.flush()
+        finally:
+            process.stdout.close()
+            if log is not None:
+                log.close()
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def connect(self, timeout=STARTUP_TIMEOUT):
+        """
+        Returns a connection to the worker, waiting for a starting worker to listen
+        """
+        start_time = time.time()
+        while True:
+            if self.ready.wait(0.5):
+                try:
+                    return socket.create_connection(('127.0.0.1', self.port), timeout)
+                except OSError:
+                    # a crashed worker may not have exited yet
+                    time.sleep(0.5)
+            if not self.is_alive():
+                raise WorkerUnavailable("Blender worker exited with code %s." % self.process.poll())
+            if time.time() - start_time > timeout:
+                raise WorkerUnavailable("Blender worker did not accept connections within %ds." % timeout)
+
+    def request(self, message, timeout=None):
+        """
+        Sends a json message and returns the json response, a worker not responding within timeout seconds is killed
+        """
+        with self.connect() as connection, connection.makefile('rw') as stream:
+            connection.settimeout(timeout)
+            stream.write(json.dumps(dict(message, token=self.token)) + '\n')
+            stream.flush()
+            try:
+                response = stream.readline()
+            except socket.timeout:
+                self.process.kill()
+                self.process.wait()
+                raise RuntimeError("Blender worker did not respond within %ds and was killed." % timeout)
+        if not response:
+            raise RuntimeError("Blender worker closed the connection, see its log.")
+        return json.loads(response)
+
+    def stop(self, timeout=30):
+        if not self.is_alive():
+            return
+        try:
+            self.request({'command': 'quit'}, timeout)
+            self.process.wait(timeout)
+        except (OSError, RuntimeError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+        self.output_thread.join()
+
+
+class WorkerPool:
+    """
+    Runs jobs on num_workers warm blender processes, run() may be called from several threads
+    """
+
+    def __init__(self, blender, num_workers, blend_file=None, log_dir=None, job_timeout=JOB_TIMEOUT):
+        self.workers = []
+        self.idle = queue.Queue()
+        self.token = uuid.uuid4().hex
+        for k in range(num_workers):
+            log_fpath = os.path.join(log_dir, 'worker_%d.log' % k) if log_dir else None
+            worker = Worker(blender, blend_file, log_fpath, job_timeout, self.token)
+            worker.start()
+            self.workers.append(worker)
+            self.idle.put(worker)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def run(self, job):
+        """
+        Renders a job on the next idle worker, returns the response dict with 'ok' and optionally 'error'
+        """
+        worker = self.idle.get()
+        try:
+            # a job is sent again only if it did not reach the worker, jobs crashing blender are not repeated
+            for attempt in range(2):
+                if not worker.is_alive():
+                    print("Restarting blender worker, see its log.")
+                    worker.start()
+                try:
+                    return worker.request(job, worker.job_timeout)
+                except WorkerUnavailable as e:
+                    error = str(e)
+            return {'ok': False, 'error': error}
+        except (OSError, RuntimeError, ValueError) as e:
+            return {'ok': False, 'error': str(e)}
+        finally:
+            self.idle.put(worker)
+
+    def close(self):
+        for worker in self.workers:
+            worker.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render light field jobs on a pool of warm blender processes.')
+    parser.add_argument('jobs', help='json list of jobs')
+    parser.add_argument('--blender', default='blender', help='blender executable')
+    parser.add_argument('--workers', type=int, default=1, help='number of blender processes')
+    parser.add_argument('--blend', default=None, help='.blend file preloaded by all workers')
+    parser.add_argument('--log-dir', default=None, help='directory of the worker logs')
+    parser.add_argument('--job-timeout', type=float, default=JOB_TIMEOUT,
+                        help='seconds after which a worker rendering a job is killed')
+    args = parser.parse_args(argv)
+
+    with open(args.jobs) as f:
+        jobs = json.load(f)
+    if args.log_dir:
+        os.makedirs(args.log_dir, exist_ok=True)
+
+    failed = 0
+    with WorkerPool(args.blender, max(1, args.workers), args.blend, args.log_dir, args.job_timeout) as pool, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        for job, response in zip(jobs, executor.map(pool.run, jobs)):
+            if response['ok']:
+                print("Rendered %s in %.1fs" % (job['tgt_dir'], response['duration']))
+            else:
+                failed += 1
+                print("Job %s failed: %s" % (job['tgt_dir'], response.get('error')))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())